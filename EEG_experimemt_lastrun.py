@@ -18,7 +18,10 @@ from psychopy import plugins
 plugins.activatePlugins()
 prefs.hardware['audioLib'] = 'ptb'
 prefs.hardware['audioLatencyMode'] = '3'
-from psychopy import sound, gui, visual, core, data, event, logging, clock, colors, layout, hardware, iohub
+from psychopy import gui, visual, core, data, event, logging, clock, colors, layout, hardware, iohub
+# not used by this experiment, only loaded if they ever are (see lazy_import.py)
+from lazy_import import lazy_module
+sound = lazy_module('psychopy.sound')
 from psychopy.tools import environmenttools
 from psychopy.constants import (NOT_STARTED, STARTED, PLAYING, PAUSED,
                                 STOPPED, FINISHED, PRESSED, RELEASED, FOREVER, priority)
@@ -34,9 +37,32 @@ import psychopy.iohub as io
 from psychopy.hardware import keyboard
 
 # Run 'Before Experiment' code from talk_to_prolab_code
-from titta import Titta, helpers_tobii as helpers
+from titta import Titta
 from titta.TalkToProLab import TalkToProLab
+helpers = lazy_module('titta.helpers_tobii')
 from psychopy import monitors
+from prolab_media import MediaManifest, stimulus_files, media_name
+from media_cache import MediaCache
+from media_uploader import MediaUploader
+from stimulus_pool import StimulusPool
+from image_prefetch import ImagePrefetcher
+from clock_sync import ProLabClock
+from prolab_events import ProLabEventQueue
+from eeg_triggers import TriggerEngine
+from trigger_backends import open_backend
+from trigger_codes import TriggerCodeTable
+from frame_timing import FrameTimer
+from dwell_detector import DwellDetector, gaze_samples
+from eye_events import EyeEventClassifier
+from event_timeline import EventTimeline, TRIGGER, ROI_ENTER, ROI_EXIT, PROLAB, FIXATION, SACCADE
+from psychopy.tools import monitorunittools
+from session_parquet import save_parquet
+from trial_journal import TrialJournal
+from device_startup import DeviceStartup
+from conditions_cache import load_conditions
+from trial_schedule import build_schedule
+from routine_scheduler import RoutineScheduler
+from aoi_index import load_aoi_store, height_to_pixels
 
 #%% ET settings
 # et_name = 'Tobii Pro Spark'
@@ -47,19 +73,33 @@ et_name = 'Tobii Pro Fusion'
 dummy_mode = False
 project_name = None # None or a project name that is open in Pro Lab.
                     # If None, the currently opened project is used.
+upload_workers = 2  # number of stimuli uploaded to Pro Lab at the same time
+frame_timing = False  # True to time every frame and add the statistics of each routine to the data file
  
 # Change any of the default settings?
 settings = Titta.get_defaults(et_name)
  
+trigger_backend = 'serial'  # 'serial' for the TriggerBox, 'loopback' or 'memory' to run without it
+ 
 #%% Connect to eye tracker and calibrate (you need to do this outside of lab)
-tracker = Titta.Connect(settings)
-if dummy_mode:
-    tracker.set_dummy_mode()
-tracker.init()
+def connect_tracker(settings):
+    tracker = Titta.Connect(settings)
+    if dummy_mode:
+        tracker.set_dummy_mode()
+    tracker.init()
+    return tracker
  
+# The eye tracker, Pro Lab and the trigger port are connected in the background
+# while the participant dialog is shown, run() waits for them when needed.
+devices = DeviceStartup()
+devices.register('tracker', connect_tracker, settings)
 #%% Talk to Pro Lab
-ttl = TalkToProLab(project_name=project_name,
-                   dummy_mode=dummy_mode)
+devices.register('prolab', TalkToProLab, project_name=project_name,
+                 dummy_mode=dummy_mode)
+if trigger_backend == 'serial':
+    devices.register('triggers', open_backend, 'serial', port="COM7", baudrate=2000000)
+else:
+    devices.register('triggers', open_backend, trigger_backend)
 # --- Setup global variables (available in all functions) ---
 # create a device manager to handle hardware (keyboards, mice, mirophones, speakers, etc.)
 deviceManager = hardware.DeviceManager()
@@ -404,6 +444,16 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         frameDur = 1.0 / 60.0  # could not measure, so guess
     
     # Start Code - component code to be run after the window creation
+    # flips, triggers, ROI looks, fixations and Pro Lab events of the session, all on globalClock:
+    # win.flip() returns times on it (the logging clock) and ioServer.syncClock puts the eye samples on it.
+    # globalClock is set up below, before anything is logged or any trigger is sent
+    def session_time():
+        return globalClock.getTime(format='float')
+    timeline = EventTimeline(filename + '.timeline', clock=session_time).start()
+    # every data row is also written to disk as soon as it is complete, in case the session crashes
+    journal = TrialJournal(filename + '.journal').attach(thisExp)
+    # where the time of each frame goes, see frame_timing.py
+    frame_timer = FrameTimer(frameDur, enabled=frame_timing)
     
     # --- Initialize components for Routine "welcome" ---
     key_resp = keyboard.Keyboard(deviceName='key_resp')
@@ -418,6 +468,13 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         tracker=eyetracker,
         actionType='Start Only'
     )
+    upload_progress = visual.TextStim(win=win, name='upload_progress',
+        text='',
+        font='Open Sans',
+        pos=(0, -0.4), height=0.025, wrapWidth=None, ori=0.0, 
+        color='white', colorSpace='rgb', opacity=0.6, 
+        languageStyle='LTR',
+        depth=-3.0);
     
     # --- Initialize components for Routine "instructions" ---
     key_resp_2 = keyboard.Keyboard(deviceName='key_resp_2')
@@ -440,15 +497,19 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         texRes=128.0, interpolate=True, depth=0.0)
     
     # --- Initialize components for Routine "trial" ---
-    image = visual.ImageStim(
-        win=win,
-        name='image', 
-        image='default.png', mask=None, anchor='center',
+    # each trial image is decoded and uploaded to the GPU once, the "image"
+    # component is taken from this pool at the start of every trial. Images
+    # which do not fit in the budget are decoded during the fixation cross.
+    stimulus_prefetch = ImagePrefetcher(depth=2)
+    stimulus_pool = StimulusPool(win, budgetMB=1024, prefetcher=stimulus_prefetch,
+        name='image', mask=None, anchor='center',
         ori=0.0, pos=(0, 0), size=None,
         color=[1,1,1], colorSpace='rgb', opacity=None,
         flipHoriz=False, flipVert=False,
         texRes=128.0, interpolate=True, depth=0.0)
     # Run 'Begin Experiment' code from talk_to_prolab_code
+    ttl = devices.get('prolab')
+    tracker = devices.get('tracker')
     settings.FILENAME = expInfo['participant']
      
     # Participant ID and Project name for Lab
@@ -472,15 +533,49 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
                         participant_info['participant_id'],
                         screen_width=1920,
                         screen_height=1080)
+    # events are sent to the recording from a background thread
+    prolab_events = ProLabEventQueue(ttl, rec['recording_id']).start()
+    
+    # Find (or upload) every stimulus in Pro Lab once, so that no Pro Lab
+    # traffic is needed to get a media_id during the trials. This runs in the
+    # background while the welcome and instructions screens are shown.
+    media = MediaManifest(ttl, cache=MediaCache(os.path.join(_thisDir, 'data', 'media_cache.json')),
+                          project=ttl.get_project_info()['project_id'])
+    # read from data/conditions_cache.json unless images.xlsx changed
+    stimulusConditions = load_conditions('images.xlsx', cache=os.path.join(_thisDir, 'data', 'conditions_cache.json'),
+                                         columns=['images', 'diff_level', 'target_x', 'target_y'],
+                                         numeric=['target_x', 'target_y'], fileColumns=['images'])
+    # with several workers each one uploads through its own connection to Pro Lab,
+    # sharing the experiment's connection would upload one image at a time
+    mediaUploader = MediaUploader(media, stimulus_files(stimulusConditions,
+                                                        column='images', extra=['cross.png']),
+                                  workers=upload_workers,
+                                  connect=(lambda: TalkToProLab(project_name=project_name, dummy_mode=dummy_mode))
+                                          if upload_workers > 1 else None)
+    mediaUploader.start()
+    # load the trial images one per frame while the welcome and instructions are shown
+    stimulus_pool.preload(stimulus_files(stimulusConditions, column='images'))
     # Run 'Begin Experiment' code from eeg_trigger
-    import serial
-    port = serial.Serial(port="COM7",baudrate=2000000)
+    port = devices.get('triggers')
+    logging.exp(devices.summary())
+    # the port is only written to from the trigger engine's thread
+    trigger_engine = TriggerEngine(port, clock=session_time, log=logging.data,
+                                   onWrite=lambda t, code: timeline.log(TRIGGER, code[0], t=t)).start()
+    # one code per difficulty level, listed in trigger_codes.tsv for the EEG analysis
+    trigger_codes = TriggerCodeTable(os.path.join(_thisDir, 'trigger_codes.tsv'))
+    trigger_codes.compile(stimulusConditions, columns=['diff_level'], routine='trial')
     target = visual.ROI(win, name='target', device=eyetracker,
         debug=False,
         shape='circle',
         pos=[0,0], size=(0.2, 0.2), 
         anchor='center', ori=0.0, depth=-3
         )
+    # looks into the target from every eye sample, not just one per frame
+    target_dwell = DwellDetector(eyetracker, target, dwell=0.5)
+    # fixations and saccades (I-VT, 30 deg/s), gaze positions are in 'height' units
+    eye_events = EyeEventClassifier('ivt', degPerUnit=monitorunittools.pix2deg(win.size[1], win.monitor))
+    # AOIs of the images, the same file gaze_aoi.py reads for the offline analysis
+    aoi_store = load_aoi_store(os.path.join(_thisDir, 'aoi_coordenates.json'))
     
     # --- Initialize components for Routine "Thankyou" ---
     key_resp_3 = keyboard.Keyboard(deviceName='key_resp_3')
@@ -518,6 +613,9 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     logging.setDefaultClock(globalClock)
     # routine timer to track time remaining of each (possibly non-slip) routine
     routineTimer = core.Clock()
+    # model of the Pro Lab clock, to convert flip times to Pro Lab timestamps
+    prolab_clock = ProLabClock(ttl, clock=session_time)
+    prolab_clock.calibrate().start()
     win.flip()  # flip window to reset last flip timer
     # store the exact time the global clock started
     expInfo['expStart'] = data.getDateStr(
@@ -531,15 +629,13 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     key_resp.keys = []
     key_resp.rt = []
     _key_resp_allKeys = []
-    # keep track of which components have finished
-    welcomeComponents = [key_resp, welcome_message, start_recording]
-    for thisComponent in welcomeComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
+    # start and stop the components on time, and keep track of which have finished
+    welcomeScheduler = RoutineScheduler(win, thisExp, frameTolerance)
+    welcomeScheduler.add(key_resp)
+    welcomeScheduler.add(welcome_message)
+    welcomeScheduler.add(start_recording, duration=0, onFlip=False)
+    welcomeScheduler.add(upload_progress)
+    welcomeScheduler.begin()
     # reset timers
     t = 0
     _timeToFirstFrame = win.getFutureFlipTime(clock="now")
@@ -547,6 +643,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     
     # --- Run Routine "welcome" ---
     routineForceEnded = not continueRoutine
+    frame_timer.begin('welcome')
     while continueRoutine:
         # get current time
         t = routineTimer.getTime()
@@ -554,25 +651,18 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         tThisFlipGlobal = win.getFutureFlipTime(clock=None)
         frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
         # update/draw components on each frame
+        welcomeScheduler.update(t, tThisFlip, tThisFlipGlobal, frameN)
         
         # *key_resp* updates
         waitOnFlip = False
         
         # if key_resp is starting this frame...
-        if key_resp.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            key_resp.frameNStart = frameN  # exact frame index
-            key_resp.tStart = t  # local t and not account for scr refresh
-            key_resp.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(key_resp, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'key_resp.started')
-            # update status
-            key_resp.status = STARTED
+        if welcomeScheduler.isStarting(key_resp):
             # keyboard checking is just starting
             waitOnFlip = True
             win.callOnFlip(key_resp.clock.reset)  # t=0 on next screen flip
             win.callOnFlip(key_resp.clearEvents, eventType='keyboard')  # clear events on next screen flip
+        frame_timer.lap('components')
         if key_resp.status == STARTED and not waitOnFlip:
             theseKeys = key_resp.getKeys(keyList=['y','n','left','right','space'], ignoreKeys=["escape"], waitRelease=False)
             _key_resp_allKeys.extend(theseKeys)
@@ -583,52 +673,27 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
                 # a response ends the routine
                 continueRoutine = False
         
+        frame_timer.lap('keys')
         # *welcome_message* updates
         
-        # if welcome_message is starting this frame...
-        if welcome_message.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            welcome_message.frameNStart = frameN  # exact frame index
-            welcome_message.tStart = t  # local t and not account for scr refresh
-            welcome_message.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(welcome_message, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'welcome_message.started')
-            # update status
-            welcome_message.status = STARTED
-            welcome_message.setAutoDraw(True)
-        
         # if welcome_message is active this frame...
         if welcome_message.status == STARTED:
             # update params
             pass
         # *start_recording* updates
         
-        # if start_recording is starting this frame...
-        if start_recording.status == NOT_STARTED and t >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            start_recording.frameNStart = frameN  # exact frame index
-            start_recording.tStart = t  # local t and not account for scr refresh
-            start_recording.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(start_recording, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.addData('start_recording.started', t)
-            # update status
-            start_recording.status = STARTED
+        frame_timer.lap('components')
+        # *upload_progress* updates
         
-        # if start_recording is stopping this frame...
-        if start_recording.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if tThisFlipGlobal > start_recording.tStartRefresh + 0-frameTolerance:
-                # keep track of stop time/frame for later
-                start_recording.tStop = t  # not accounting for scr refresh
-                start_recording.tStopRefresh = tThisFlipGlobal  # on global time
-                start_recording.frameNStop = frameN  # exact frame index
-                # add timestamp to datafile
-                thisExp.addData('start_recording.stopped', t)
-                # update status
-                start_recording.status = FINISHED
+        # if upload_progress is active this frame...
+        if upload_progress.status == STARTED:
+            # update params (only re-render the text when it changes)
+            if upload_progress.text != mediaUploader.status_text():
+                upload_progress.setText(mediaUploader.status_text(), log=False)
+            # load the next trial image while nothing is timed
+            stimulus_pool.step()
         
+        frame_timer.lap('code')
         # check for quit (typically the Esc key)
         if defaultKeyboard.getKeys(keyList=["escape"]):
             thisExp.status = FINISHED
@@ -636,25 +701,24 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             endExperiment(thisExp, win=win)
             return
         
+        frame_timer.lap('keys')
         # check if all components have finished
         if not continueRoutine:  # a component has requested a forced-end of Routine
             routineForceEnded = True
             break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in welcomeComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
+        continueRoutine = not welcomeScheduler.finished  # True while at least one component is still running
         
+        frame_timer.lap('components')
         # refresh the screen
         if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
+            tFlip = win.flip()
+            timeline.flip(frameN, 'welcome', t=tFlip)
+            frame_timer.flip()
     
     # --- Ending Routine "welcome" ---
-    for thisComponent in welcomeComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
+    welcomeScheduler.end()
     thisExp.addData('welcome.stopped', globalClock.getTime(format='float'))
+    frame_timer.end(thisExp)
     # check responses
     if key_resp.keys in ['', [], None]:  # No response was made
         key_resp.keys = None
@@ -676,15 +740,12 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     key_resp_2.keys = []
     key_resp_2.rt = []
     _key_resp_2_allKeys = []
-    # keep track of which components have finished
-    instructionsComponents = [key_resp_2, text]
-    for thisComponent in instructionsComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
+    # start and stop the components on time, and keep track of which have finished
+    instructionsScheduler = RoutineScheduler(win, thisExp, frameTolerance)
+    instructionsScheduler.add(key_resp_2)
+    instructionsScheduler.add(text)
+    instructionsScheduler.add(upload_progress)
+    instructionsScheduler.begin()
     # reset timers
     t = 0
     _timeToFirstFrame = win.getFutureFlipTime(clock="now")
@@ -692,6 +753,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     
     # --- Run Routine "instructions" ---
     routineForceEnded = not continueRoutine
+    frame_timer.begin('instructions')
     while continueRoutine:
         # get current time
         t = routineTimer.getTime()
@@ -699,25 +761,18 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         tThisFlipGlobal = win.getFutureFlipTime(clock=None)
         frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
         # update/draw components on each frame
+        instructionsScheduler.update(t, tThisFlip, tThisFlipGlobal, frameN)
         
         # *key_resp_2* updates
         waitOnFlip = False
         
         # if key_resp_2 is starting this frame...
-        if key_resp_2.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            key_resp_2.frameNStart = frameN  # exact frame index
-            key_resp_2.tStart = t  # local t and not account for scr refresh
-            key_resp_2.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(key_resp_2, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'key_resp_2.started')
-            # update status
-            key_resp_2.status = STARTED
+        if instructionsScheduler.isStarting(key_resp_2):
             # keyboard checking is just starting
             waitOnFlip = True
             win.callOnFlip(key_resp_2.clock.reset)  # t=0 on next screen flip
             win.callOnFlip(key_resp_2.clearEvents, eventType='keyboard')  # clear events on next screen flip
+        frame_timer.lap('components')
         if key_resp_2.status == STARTED and not waitOnFlip:
             theseKeys = key_resp_2.getKeys(keyList=['y','n','left','right','space'], ignoreKeys=["escape"], waitRelease=False)
             _key_resp_2_allKeys.extend(theseKeys)
@@ -728,26 +783,26 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
                 # a response ends the routine
                 continueRoutine = False
         
+        frame_timer.lap('keys')
         # *text* updates
         
-        # if text is starting this frame...
-        if text.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            text.frameNStart = frameN  # exact frame index
-            text.tStart = t  # local t and not account for scr refresh
-            text.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(text, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'text.started')
-            # update status
-            text.status = STARTED
-            text.setAutoDraw(True)
-        
         # if text is active this frame...
         if text.status == STARTED:
             # update params
             pass
+
+        frame_timer.lap('components')
+        # *upload_progress* updates
         
+        # if upload_progress is active this frame...
+        if upload_progress.status == STARTED:
+            # update params (only re-render the text when it changes)
+            if upload_progress.text != mediaUploader.status_text():
+                upload_progress.setText(mediaUploader.status_text(), log=False)
+            # load the next trial image while nothing is timed
+            stimulus_pool.step()
+        
+        frame_timer.lap('code')
         # check for quit (typically the Esc key)
         if defaultKeyboard.getKeys(keyList=["escape"]):
             thisExp.status = FINISHED
@@ -755,25 +810,24 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             endExperiment(thisExp, win=win)
             return
         
+        frame_timer.lap('keys')
         # check if all components have finished
         if not continueRoutine:  # a component has requested a forced-end of Routine
             routineForceEnded = True
             break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in instructionsComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
+        continueRoutine = not instructionsScheduler.finished  # True while at least one component is still running
         
+        frame_timer.lap('components')
         # refresh the screen
         if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
+            tFlip = win.flip()
+            timeline.flip(frameN, 'instructions', t=tFlip)
+            frame_timer.flip()
     
     # --- Ending Routine "instructions" ---
-    for thisComponent in instructionsComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
+    instructionsScheduler.end()
     thisExp.addData('instructions.stopped', globalClock.getTime(format='float'))
+    frame_timer.end(thisExp)
     # check responses
     if key_resp_2.keys in ['', [], None]:  # No response was made
         key_resp_2.keys = None
@@ -785,17 +839,80 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     # the Routine "instructions" was not non-slip safe, so reset the non-slip timer
     routineTimer.reset()
     
+    # --- Load the remaining trial images before the first trial ---
+    while stimulus_pool.step():
+        pass
+    
+    def end_session():
+        """
+        Stop the devices and the Pro Lab recording, at the end of the experiment
+        or when it cannot go on.
+        """
+        # Run 'End Experiment' code from eeg_trigger
+        trigger_engine.stop()
+        port.close()
+        # Run 'End Experiment' code from talk_to_prolab_code
+        prolab_clock.stop()
+        logging.exp(prolab_clock.summary())
+        # make sure all the events reach Pro Lab before the recording stops
+        unsent_events = prolab_events.drain()
+        logging.exp(f'Pro Lab events: {prolab_events.sent} sent, {prolab_events.failures} failed attempts')
+        for unsent_event in unsent_events:
+            logging.warning(f'Pro Lab event not sent: {unsent_event}')
+        # Run 'End Experiment' code from event_timeline
+        timeline.close()
+        logging.exp(f'Event timeline: {timeline.written} events written, {timeline.dropped} dropped')
+        # Run 'End Experiment' code from trial_journal
+        journal.close()
+        ## Stop recording
+        ttl.send_message(ttl.external_presenter_address,
+            {"operation": "StopRecording"})
+        win.close()
+     
+        #%% Finalize the recording
+        # Finalize recording
+        print(rec)
+        print(rec['recording_id'])
+        ttl.send_message(ttl.external_presenter_address,
+            {"operation": "FinalizeRecording",
+            "recording_id": rec['recording_id']})
+        print('recording has been finalized')
+        ttl.disconnect()
+        logging.exp(stimulus_prefetch.summary())
+        stimulus_prefetch.close()
+    
+    # --- Wait for the media upload to finish before the first trial ---
+    try:
+        while not mediaUploader.wait(timeout=frameDur):
+            if upload_progress.text != mediaUploader.status_text():
+                upload_progress.setText(mediaUploader.status_text(), log=False)
+            upload_progress.draw()
+            # check for quit (typically the Esc key)
+            if defaultKeyboard.getKeys(keyList=["escape"]):
+                thisExp.status = FINISHED
+            if thisExp.status == FINISHED or endExpNow:
+                endExperiment(thisExp, win=win)
+                return
+            tFlip = win.flip()
+            timeline.flip(label='upload_wait', t=tFlip)
+    except Exception as e:
+        # the stimuli have no media_id, but the recording must still be stopped and finalized
+        logging.error(f'Uploading the media to Tobii Pro Lab failed, ending the experiment: {e}')
+        end_session()
+        endExperiment(thisExp, win=win)
+        return
+    
+    # stored with the data, so the same trial order can be generated again
+    trials_seed = expInfo.setdefault('trials_seed', int(randint(0, 2**31 - 1)))
     # set up handler to look after randomisation of conditions etc
     trials = data.TrialHandler(nReps=10.0, method='sequential', 
         extraInfo=expInfo, originPath=-1,
-        trialList=data.importConditions('images.xlsx'),
-        seed=None, name='trials')
+        trialList=stimulusConditions,
+        seed=trials_seed, name='trials')
     thisExp.addLoop(trials)  # add the loop to the experiment
     thisTrial = trials.trialList[0]  # so we can initialise stimuli with some values
-    # abbreviate parameter names if possible (e.g. rgb = thisTrial.rgb)
-    if thisTrial != None:
-        for paramName in thisTrial:
-            globals()[paramName] = thisTrial[paramName]
+    # image, trigger code, target position and media_id of every trial, in the order they will run
+    schedule = build_schedule(trials, media, trigger_codes, routine='trial')
     
     for thisTrial in trials:
         currentLoop = trials
@@ -808,50 +925,27 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
                 timers=[routineTimer], 
                 playbackComponents=[]
         )
-        # abbreviate parameter names if possible (e.g. rgb = thisTrial.rgb)
-        if thisTrial != None:
-            for paramName in thisTrial:
-                globals()[paramName] = thisTrial[paramName]
+        # the record of this trial, read by attribute in the routines
+        trial = schedule[trials.thisN]
         
         # --- Prepare to start Routine "cross" ---
         continueRoutine = True
         # update component parameters for each repeat
         thisExp.addData('cross.started', globalClock.getTime(format='float'))
         # Run 'Begin Routine' code from upload_fix_im
-        # Create Psychopy image objects and upload media to Lab
+        # Get the Pro Lab media ID of the image shown in this routine
         # Make sure the images have the same resolution as the screen
         im_name = 'cross.png'
-        im = visual.ImageStim(win, image = im_name)
-        prolab_list_media = ttl.list_media()['media_list']
-        
-        media_id = None
-        
-        # Upload media (if not already uploaded)
-        print('Searching media in Tobii Pro Lab')
-        if not ttl.find_media(im_name):
-            print(f'Media "{im_name}" not found, uploading to Tobii Pro Lab')
-            upload_response = ttl.upload_media(im_name, "image")
-            media_id = upload_response['media_id']
-        
-        # If the media were uploaded already, just get their names and IDs.
-        if media_id == None:
-            print('Media found, organising media to match Tobii Pro Lab')
-            for m in prolab_list_media:
-                if im_name[:-4] == m['media_name']:
-                    media_id = m['media_id']
-                    break
-        
-        t_onset = int(ttl.get_time_stamp()['timestamp'])
-        print('t_onset', t_onset)
-        # keep track of which components have finished
-        crossComponents = [image_2]
-        for thisComponent in crossComponents:
-            thisComponent.tStart = None
-            thisComponent.tStop = None
-            thisComponent.tStartRefresh = None
-            thisComponent.tStopRefresh = None
-            if hasattr(thisComponent, 'status'):
-                thisComponent.status = NOT_STARTED
+        # media were uploaded at Begin Experiment, just get the ID
+        media_id = media[im_name]
+        # decode the images of this trial and the next one while the cross is shown
+        stimulus_pool.prefetch(trial.image)
+        if trial.n + 1 < len(schedule):
+            stimulus_pool.prefetch(schedule[trial.n + 1].image)
+        # start and stop the components on time, and keep track of which have finished
+        crossScheduler = RoutineScheduler(win, thisExp, frameTolerance)
+        crossScheduler.add(image_2, duration=1.0)
+        crossScheduler.begin()
         # reset timers
         t = 0
         _timeToFirstFrame = win.getFutureFlipTime(clock="now")
@@ -859,6 +953,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         
         # --- Run Routine "cross" ---
         routineForceEnded = not continueRoutine
+        frame_timer.begin('cross')
         while continueRoutine and routineTimer.getTime() < 1.0:
             # get current time
             t = routineTimer.getTime()
@@ -866,41 +961,16 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             tThisFlipGlobal = win.getFutureFlipTime(clock=None)
             frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
             # update/draw components on each frame
+            crossScheduler.update(t, tThisFlip, tThisFlipGlobal, frameN)
             
             # *image_2* updates
             
-            # if image_2 is starting this frame...
-            if image_2.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                image_2.frameNStart = frameN  # exact frame index
-                image_2.tStart = t  # local t and not account for scr refresh
-                image_2.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(image_2, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'image_2.started')
-                # update status
-                image_2.status = STARTED
-                image_2.setAutoDraw(True)
-            
             # if image_2 is active this frame...
             if image_2.status == STARTED:
                 # update params
                 pass
             
-            # if image_2 is stopping this frame...
-            if image_2.status == STARTED:
-                # is it time to stop? (based on global clock, using actual start)
-                if tThisFlipGlobal > image_2.tStartRefresh + 1.0-frameTolerance:
-                    # keep track of stop time/frame for later
-                    image_2.tStop = t  # not accounting for scr refresh
-                    image_2.tStopRefresh = tThisFlipGlobal  # on global time
-                    image_2.frameNStop = frameN  # exact frame index
-                    # add timestamp to datafile
-                    thisExp.timestampOnFlip(win, 'image_2.stopped')
-                    # update status
-                    image_2.status = FINISHED
-                    image_2.setAutoDraw(False)
-            
+            frame_timer.lap('components')
             # check for quit (typically the Esc key)
             if defaultKeyboard.getKeys(keyList=["escape"]):
                 thisExp.status = FINISHED
@@ -908,34 +978,33 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
                 endExperiment(thisExp, win=win)
                 return
             
+            frame_timer.lap('keys')
             # check if all components have finished
             if not continueRoutine:  # a component has requested a forced-end of Routine
                 routineForceEnded = True
                 break
-            continueRoutine = False  # will revert to True if at least one component still running
-            for thisComponent in crossComponents:
-                if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                    continueRoutine = True
-                    break  # at least one component has not yet finished
+            continueRoutine = not crossScheduler.finished  # True while at least one component is still running
             
+            frame_timer.lap('components')
             # refresh the screen
             if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-                win.flip()
+                tFlip = win.flip()
+                timeline.flip(frameN, 'cross', t=tFlip)
+                frame_timer.flip()
         
         # --- Ending Routine "cross" ---
-        for thisComponent in crossComponents:
-            if hasattr(thisComponent, "setAutoDraw"):
-                thisComponent.setAutoDraw(False)
+        crossScheduler.end()
         thisExp.addData('cross.stopped', globalClock.getTime(format='float'))
+        frame_timer.end(thisExp)
         # Run 'End Routine' code from upload_fix_im
-        t_offset = int(ttl.get_time_stamp()['timestamp'])
-        print('t_offset', t_offset)
+        # the cross was shown from its first flip until the next flip, in Pro Lab time
+        t_onset = prolab_clock.to_prolab(image_2.tStartRefresh)
+        t_offset = prolab_clock.to_prolab(win.getFutureFlipTime(clock=None))
+        print('t_onset', t_onset, 't_offset', t_offset)
         
-        # Send stimulus event
-        ttl.send_stimulus_event(rec['recording_id'],
-                                str(t_onset),
-                                media_id,
-                                end_timestamp=str(t_offset))
+        # Send stimulus event (queued, sent in the background)
+        prolab_events.stimulus_event(t_onset, media_id, end_timestamp=t_offset)
+        timeline.log(PROLAB, 0, f'StimulusEvent {media_id} {t_onset} {t_offset}')
         # using non-slip timing so subtract the expected duration of this Routine (unless ended on request)
         if routineForceEnded:
             routineTimer.reset()
@@ -946,58 +1015,35 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         continueRoutine = True
         # update component parameters for each repeat
         thisExp.addData('trial.started', globalClock.getTime(format='float'))
-        image.setImage(images)
+        image = stimulus_pool.get(trial.image)
         # Run 'Begin Routine' code from talk_to_prolab_code
-        # Create Psychopy image objects and upload media to Lab
+        # Get the Pro Lab media ID of the image shown in this routine
         # Make sure the images have the same resolution as the screen
-        im_name = images # use image path from spreadsheet, the name of the variable corresponds to the name of the column in the table
-        im = visual.ImageStim(win, image=im_name)
-        
-        print('Searching media in Tobii Pro Lab')
-        prolab_list_media = ttl.list_media()['media_list']
+        im_name = trial.image
+        # media were uploaded at Begin Experiment, looked up when the schedule was built
+        media_id = trial.mediaId
         
-        media_id = None
-        
-        # Upload media (if not already uploaded)
-        print('Searching media in Tobii Pro Lab')
-        if not ttl.find_media(im_name):
-            print(f'Media "{im_name}" not found, uploading to Tobii Pro Lab')
-            upload_response = ttl.upload_media(im_name, "image")
-            media_id = upload_response['media_id']
-        
-        # If the media were uploaded already, just get their names and IDs.
-        if media_id == None:
-            print('Media found, organising media to match Tobii Pro Lab')
-            for m in prolab_list_media:
-                if im_name[:-4] == m['media_name']:
-                    media_id = m['media_id']
-                    break
-        
-        t_onset = int(ttl.get_time_stamp()['timestamp'])
-        print('t_onset', t_onset)
         # Run 'Begin Routine' code from eeg_trigger
         #Mark the stimulus onset triggers as "not sent"
         #at the start of the trial
         stimulus_pulse_started = False
-        stimulus_pulse_ended = False
         
         # Define the trigger based on the difficulty level of the image
-        if diff_level == 'low':
-            diff_trigger = [0x01]
-        else:
-            diff_trigger = [0x02]
-        target.setPos((target_x, target_y))
+        diff_trigger = trial.trigger
+        target.setPos(trial.targetPos)
         # clear any previous roi data
         target.reset()
-        # keep track of which components have finished
-        trialComponents = [image, target]
-        for thisComponent in trialComponents:
-            thisComponent.tStart = None
-            thisComponent.tStop = None
-            thisComponent.tStartRefresh = None
-            thisComponent.tStopRefresh = None
-            if hasattr(thisComponent, 'status'):
-                thisComponent.status = NOT_STARTED
+        target_dwell.reset()
+        eye_events.reset()
+        trial_eye_events = []
+        # eye samples in each AOI of the image, None if the image has no AOIs
+        trial_aois = aoi_store.get(media_name(trial.image))
+        trial_aoi_samples = np.zeros(len(trial_aois), dtype=int) if trial_aois is not None else None
+        # start and stop the components on time, and keep track of which have finished
+        trialScheduler = RoutineScheduler(win, thisExp, frameTolerance)
+        trialScheduler.add(image)
+        trialScheduler.add(target)
+        trialScheduler.begin()
         # reset timers
         t = 0
         _timeToFirstFrame = win.getFutureFlipTime(clock="now")
@@ -1005,6 +1051,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         
         # --- Run Routine "trial" ---
         routineForceEnded = not continueRoutine
+        frame_timer.begin('trial')
         while continueRoutine:
             # get current time
             t = routineTimer.getTime()
@@ -1012,77 +1059,53 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             tThisFlipGlobal = win.getFutureFlipTime(clock=None)
             frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
             # update/draw components on each frame
+            trialScheduler.update(t, tThisFlip, tThisFlipGlobal, frameN)
             
             # *image* updates
             
-            # if image is starting this frame...
-            if image.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                image.frameNStart = frameN  # exact frame index
-                image.tStart = t  # local t and not account for scr refresh
-                image.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(image, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'image.started')
-                # update status
-                image.status = STARTED
-                image.setAutoDraw(True)
-            
             # if image is active this frame...
             if image.status == STARTED:
                 # update params
                 pass
+            frame_timer.lap('components')
             # Run 'Each Frame' code from eeg_trigger
             ##STIMULUS TRIGGERS##
             #Check to see if the stimulus is presented this frame
             #and send the trigger if it is
+            #The trigger engine resets the value to "0" after 100 ms by itself
             if image.status == STARTED and not stimulus_pulse_started: #Change 'image' to match the name of the component that you want to send the trigger for
-                win.callOnFlip(port.write, diff_trigger)
-                stimulus_pulse_start_time = globalClock.getTime()
+                win.callOnFlip(trigger_engine.pulse, diff_trigger, width=0.1)
                 stimulus_pulse_started  = True
-            #If it's time to end the pulse, reset the value to "0"
-            #so that we don't continue sending triggers on every frame
-            if stimulus_pulse_started and not stimulus_pulse_ended:
-                    if globalClock.getTime() - stimulus_pulse_start_time >= 0.1:
-                        win.callOnFlip(port.write, [0x00])
-                        stimulus_pulse_ended = True
             
             
-            # if target is starting this frame...
-            if target.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-                # keep track of start time/frame for later
-                target.frameNStart = frameN  # exact frame index
-                target.tStart = t  # local t and not account for scr refresh
-                target.tStartRefresh = tThisFlipGlobal  # on global time
-                win.timeOnFlip(target, 'tStartRefresh')  # time at next scr refresh
-                # add timestamp to datafile
-                thisExp.timestampOnFlip(win, 'target.started')
-                # update status
-                target.status = STARTED
-                target.setAutoDraw(True)
-            
+            frame_timer.lap('code')
             # if target is active this frame...
             if target.status == STARTED:
                 # update params
                 pass
-                # check whether target has been looked in
-                if target.isLookedIn:
-                    if not target.wasLookedIn:
-                        target.timesOn.append(target.clock.getTime()) # store time of first look
-                        target.timesOff.append(target.clock.getTime()) # store time looked until
-                    else:
-                        target.timesOff[-1] = target.clock.getTime() # update time looked until
-                        if target.currentLookTime > 0.5: # check if they've been looking long enough
-                            continueRoutine = False # end Routine on sufficiently long look
-                    target.wasLookedIn = True  # if target is still looked at next frame, it is not a new look
-                else:
-                    if target.wasLookedIn:
-                        target.timesOff[-1] = target.clock.getTime() # update time looked until
-                    target.wasLookedIn = False  # if target is looked at next frame, it is a new look
+                frame_timer.lap('components')
+                # check whether target has been looked in, with all the eye samples since the last frame
+                if not target_dwell.running:
+                    target_dwell.start(globalClock.getTime(format='float'))  # ioHub sample times are on globalClock (syncClock)
+                samples = gaze_samples(eyetracker.getEvents())
+                dwellEnd = target_dwell.process(*samples)
+                for tLook, entered in target_dwell.transitions:
+                    timeline.log(ROI_ENTER if entered else ROI_EXIT, trials.thisN, target.name, t=tLook)
+                if trial_aois is not None:
+                    # the images are full screen, so AOI pixels are screen pixels
+                    _, aoiHits = trial_aois.classify(*height_to_pixels(samples[1], samples[2], win.size))
+                    trial_aoi_samples += np.bincount(aoiHits, minlength=len(trial_aois))
+                # fixations and saccades which ended since the last frame
+                for eyeEvent in eye_events.feed(*samples):
+                    trial_eye_events.append(eyeEvent)
+                    timeline.log(FIXATION if eyeEvent.kind == 'fixation' else SACCADE,
+                                 round(eyeEvent.duration * 1000), f'{eyeEvent.x:.4f} {eyeEvent.y:.4f}', t=eyeEvent.start)
+                if dwellEnd is not None:  # looked at for 0.5 s without interruption
+                    continueRoutine = False # end Routine on sufficiently long look
             else:
                 target.clock.reset() # keep clock at 0 if roi hasn't started / has finished
-                target.wasLookedIn = False  # if target is looked at next frame, it is a new look
             
+            frame_timer.lap('code')
             # check for quit (typically the Esc key)
             if defaultKeyboard.getKeys(keyList=["escape"]):
                 thisExp.status = FINISHED
@@ -1090,41 +1113,61 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
                 endExperiment(thisExp, win=win)
                 return
             
+            frame_timer.lap('keys')
             # check if all components have finished
             if not continueRoutine:  # a component has requested a forced-end of Routine
                 routineForceEnded = True
                 break
-            continueRoutine = False  # will revert to True if at least one component still running
-            for thisComponent in trialComponents:
-                if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                    continueRoutine = True
-                    break  # at least one component has not yet finished
+            continueRoutine = not trialScheduler.finished  # True while at least one component is still running
             
+            frame_timer.lap('components')
             # refresh the screen
             if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-                win.flip()
+                tFlip = win.flip()
+                timeline.flip(frameN, 'trial', t=tFlip)
+                frame_timer.flip()
         
         # --- Ending Routine "trial" ---
-        for thisComponent in trialComponents:
-            if hasattr(thisComponent, "setAutoDraw"):
-                thisComponent.setAutoDraw(False)
+        trialScheduler.end()
         thisExp.addData('trial.stopped', globalClock.getTime(format='float'))
+        frame_timer.end(thisExp)
         # Run 'End Routine' code from talk_to_prolab_code
-        t_offset = int(ttl.get_time_stamp()['timestamp'])
-        print('t_offset', t_offset)
+        # the image was shown from its first flip until the next flip, in Pro Lab time
+        t_onset = prolab_clock.to_prolab(image.tStartRefresh)
+        t_offset = prolab_clock.to_prolab(win.getFutureFlipTime(clock=None))
+        print('t_onset', t_onset, 't_offset', t_offset)
+        trials.addData('prolab_clock.residual', prolab_clock.residual)
         
-        # Send stimulus event
-        ttl.send_stimulus_event(rec['recording_id'],
-                                str(t_onset),
-                                media_id,
-                                end_timestamp=str(t_offset))
-        trials.addData('target.numLooks', target.numLooks)
-        if target.numLooks:
-           trials.addData('target.timesOn', target.timesOn)
-           trials.addData('target.timesOff', target.timesOff)
+        # Send stimulus event (queued, sent in the background)
+        prolab_events.stimulus_event(t_onset, media_id, end_timestamp=t_offset)
+        timeline.log(PROLAB, 0, f'StimulusEvent {media_id} {t_onset} {t_offset}')
+        trials.addData('target.numLooks', target_dwell.numLooks)
+        if target_dwell.numLooks:
+           trials.addData('target.timesOn', target_dwell.timesOn)
+           trials.addData('target.timesOff', target_dwell.timesOff)
         else:
            trials.addData('target.timesOn', "")
            trials.addData('target.timesOff', "")
+        # time from the start of the ROI to the sample which completed the dwell
+        if target_dwell.dwellEnd is not None:
+           trials.addData('target.dwellTime', target_dwell.dwellEnd - target_dwell.tStart)
+        else:
+           trials.addData('target.dwellTime', "")
+        # the fixation or saccade still going on ends with the trial
+        for eyeEvent in eye_events.flush():
+            trial_eye_events.append(eyeEvent)
+            timeline.log(FIXATION if eyeEvent.kind == 'fixation' else SACCADE,
+                         round(eyeEvent.duration * 1000), f'{eyeEvent.x:.4f} {eyeEvent.y:.4f}', t=eyeEvent.start)
+        # fixations and saccades of the trial, and the fixations which landed on the target
+        trial_fixations = [e for e in trial_eye_events if e.kind == 'fixation']
+        target_fixations = [e for e in trial_fixations if target_dwell.contains(e.x, e.y)]
+        trials.addData('eye.fixations', len(trial_fixations))
+        trials.addData('eye.saccades', len(trial_eye_events) - len(trial_fixations))
+        trials.addData('target.fixations', len(target_fixations))
+        trials.addData('target.fixationTime', sum(e.duration for e in target_fixations))
+        if trial_aois is not None:
+            for aoiName, aoiSamples in zip(trial_aois.names, trial_aoi_samples):
+                trials.addData(f'aoi.{aoiName}.samples', int(aoiSamples))
         # the Routine "trial" was not non-slip safe, so reset the non-slip timer
         routineTimer.reset()
         thisExp.nextEntry()
@@ -1142,15 +1185,12 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     key_resp_3.keys = []
     key_resp_3.rt = []
     _key_resp_3_allKeys = []
-    # keep track of which components have finished
-    ThankyouComponents = [key_resp_3, thank_you_message, stop_recording]
-    for thisComponent in ThankyouComponents:
-        thisComponent.tStart = None
-        thisComponent.tStop = None
-        thisComponent.tStartRefresh = None
-        thisComponent.tStopRefresh = None
-        if hasattr(thisComponent, 'status'):
-            thisComponent.status = NOT_STARTED
+    # start and stop the components on time, and keep track of which have finished
+    ThankyouScheduler = RoutineScheduler(win, thisExp, frameTolerance)
+    ThankyouScheduler.add(key_resp_3)
+    ThankyouScheduler.add(thank_you_message)
+    ThankyouScheduler.add(stop_recording, start=None, duration=1, onFlip=False)
+    ThankyouScheduler.begin()
     # reset timers
     t = 0
     _timeToFirstFrame = win.getFutureFlipTime(clock="now")
@@ -1158,6 +1198,7 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     
     # --- Run Routine "Thankyou" ---
     routineForceEnded = not continueRoutine
+    frame_timer.begin('Thankyou')
     while continueRoutine:
         # get current time
         t = routineTimer.getTime()
@@ -1165,25 +1206,18 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
         tThisFlipGlobal = win.getFutureFlipTime(clock=None)
         frameN = frameN + 1  # number of completed frames (so 0 is the first frame)
         # update/draw components on each frame
+        ThankyouScheduler.update(t, tThisFlip, tThisFlipGlobal, frameN)
         
         # *key_resp_3* updates
         waitOnFlip = False
         
         # if key_resp_3 is starting this frame...
-        if key_resp_3.status == NOT_STARTED and tThisFlip >= 0.0-frameTolerance:
-            # keep track of start time/frame for later
-            key_resp_3.frameNStart = frameN  # exact frame index
-            key_resp_3.tStart = t  # local t and not account for scr refresh
-            key_resp_3.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(key_resp_3, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'key_resp_3.started')
-            # update status
-            key_resp_3.status = STARTED
+        if ThankyouScheduler.isStarting(key_resp_3):
             # keyboard checking is just starting
             waitOnFlip = True
             win.callOnFlip(key_resp_3.clock.reset)  # t=0 on next screen flip
             win.callOnFlip(key_resp_3.clearEvents, eventType='keyboard')  # clear events on next screen flip
+        frame_timer.lap('components')
         if key_resp_3.status == STARTED and not waitOnFlip:
             theseKeys = key_resp_3.getKeys(keyList=['y','n','left','right','space'], ignoreKeys=["escape"], waitRelease=False)
             _key_resp_3_allKeys.extend(theseKeys)
@@ -1194,40 +1228,16 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
                 # a response ends the routine
                 continueRoutine = False
         
+        frame_timer.lap('keys')
         # *thank_you_message* updates
         
-        # if thank_you_message is starting this frame...
-        if thank_you_message.status == NOT_STARTED and tThisFlip >= 0-frameTolerance:
-            # keep track of start time/frame for later
-            thank_you_message.frameNStart = frameN  # exact frame index
-            thank_you_message.tStart = t  # local t and not account for scr refresh
-            thank_you_message.tStartRefresh = tThisFlipGlobal  # on global time
-            win.timeOnFlip(thank_you_message, 'tStartRefresh')  # time at next scr refresh
-            # add timestamp to datafile
-            thisExp.timestampOnFlip(win, 'thank_you_message.started')
-            # update status
-            thank_you_message.status = STARTED
-            thank_you_message.setAutoDraw(True)
-        
         # if thank_you_message is active this frame...
         if thank_you_message.status == STARTED:
             # update params
             pass
         # *stop_recording* updates
         
-        # if stop_recording is stopping this frame...
-        if stop_recording.status == STARTED:
-            # is it time to stop? (based on global clock, using actual start)
-            if tThisFlipGlobal > stop_recording.tStartRefresh + 1-frameTolerance:
-                # keep track of stop time/frame for later
-                stop_recording.tStop = t  # not accounting for scr refresh
-                stop_recording.tStopRefresh = tThisFlipGlobal  # on global time
-                stop_recording.frameNStop = frameN  # exact frame index
-                # add timestamp to datafile
-                thisExp.addData('stop_recording.stopped', t)
-                # update status
-                stop_recording.status = FINISHED
-        
+        frame_timer.lap('components')
         # check for quit (typically the Esc key)
         if defaultKeyboard.getKeys(keyList=["escape"]):
             thisExp.status = FINISHED
@@ -1235,25 +1245,24 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
             endExperiment(thisExp, win=win)
             return
         
+        frame_timer.lap('keys')
         # check if all components have finished
         if not continueRoutine:  # a component has requested a forced-end of Routine
             routineForceEnded = True
             break
-        continueRoutine = False  # will revert to True if at least one component still running
-        for thisComponent in ThankyouComponents:
-            if hasattr(thisComponent, "status") and thisComponent.status != FINISHED:
-                continueRoutine = True
-                break  # at least one component has not yet finished
+        continueRoutine = not ThankyouScheduler.finished  # True while at least one component is still running
         
+        frame_timer.lap('components')
         # refresh the screen
         if continueRoutine:  # don't flip if this routine is over or we'll get a blank screen
-            win.flip()
+            tFlip = win.flip()
+            timeline.flip(frameN, 'Thankyou', t=tFlip)
+            frame_timer.flip()
     
     # --- Ending Routine "Thankyou" ---
-    for thisComponent in ThankyouComponents:
-        if hasattr(thisComponent, "setAutoDraw"):
-            thisComponent.setAutoDraw(False)
+    ThankyouScheduler.end()
     thisExp.addData('Thankyou.stopped', globalClock.getTime(format='float'))
+    frame_timer.end(thisExp)
     # check responses
     if key_resp_3.keys in ['', [], None]:  # No response was made
         key_resp_3.keys = None
@@ -1267,21 +1276,8 @@ def run(expInfo, thisExp, win, globalClock=None, thisSession=None):
     thisExp.nextEntry()
     # the Routine "Thankyou" was not non-slip safe, so reset the non-slip timer
     routineTimer.reset()
-    # Run 'End Experiment' code from talk_to_prolab_code
-    ## Stop recording
-    ttl.send_message(ttl.external_presenter_address,
-        {"operation": "StopRecording"})
-    win.close()
-     
-    #%% Finalize the recording
-    # Finalize recording
-    print(rec)
-    print(rec['recording_id'])
-    ttl.send_message(ttl.external_presenter_address,
-        {"operation": "FinalizeRecording",
-        "recording_id": rec['recording_id']})
-    print('recording has been finalized')
-    ttl.disconnect()
+    # Run 'End Experiment' code: triggers, Pro Lab recording, timeline and journal
+    end_session()
     
     # mark experiment as finished
     endExperiment(thisExp, win=win)
@@ -1301,6 +1297,9 @@ def saveData(thisExp):
     # these shouldn't be strictly necessary (should auto-save)
     thisExp.saveAsWideText(filename + '.csv', delim='auto')
     thisExp.saveAsPickle(filename)
+    # typed and compressed copy of the same rows, for the analysis
+    if save_parquet(thisExp.entries, filename + '.parquet', metadata=thisExp.extraInfo) is None:
+        logging.warning('pyarrow is not installed, the .parquet data file was not written')
 
 
 def endExperiment(thisExp, win=None):
@@ -1361,6 +1360,8 @@ def quit(thisExp, win=None, thisSession=None):
 
 # if running this experiment as a script...
 if __name__ == '__main__':
+    # connect the devices while the participant dialog is shown
+    devices.start()
     # call all functions in order
     expInfo = showExpInfoDlg(expInfo=expInfo)
     thisExp = setupData(expInfo=expInfo)
@@ -0,0 +1,233 @@
+"""
+AOI store with a spatial index per image.
+
+`aoi_coordenates.json` holds one rectangle per image. Images can also hold many
+named AOIs, which can be rectangles, circles (like the `target` ROI) or
+polygons, all in pixels with the origin at the top-left corner of the image:
+
+    {
+      "img1": {"x": 1004, "y": 875, "w": 270, "h": 240},
+      "img7": {
+        "face": {"shape": "circle", "x": 960, "y": 400, "r": 120},
+        "hand": {"shape": "polygon", "points": [[100, 900], [300, 880], [260, 1040]]}
+      }
+    }
+
+When loaded, the AOIs of each image are put in a uniform grid, so a gaze
+sample is only tested against the AOIs overlapping its grid cell instead of
+all of them.
+"""
+
+import json
+import math
+from collections import defaultdict
+
+import numpy as np
+
+
+class Rect:
+    """
+    Rectangle AOI, (x, y) is its top-left corner.
+    """
+
+    def __init__(self, name, x, y, w, h):
+        self.name = name
+        self.bounds = (x, y, x + w, y + h)
+
+    def contains(self, x, y):
+        x0, y0, x1, y1 = self.bounds
+        return (x >= x0) & (x < x1) & (y >= y0) & (y < y1)
+
+
+class Circle:
+    """
+    Circle AOI, (x, y) is its center and r its radius.
+    """
+
+    def __init__(self, name, x, y, r):
+        self.name = name
+        self.center = (x, y)
+        self.r2 = r * r
+        self.bounds = (x - r, y - r, x + r, y + r)
+
+    def contains(self, x, y):
+        dx = x - self.center[0]
+        dy = y - self.center[1]
+        return dx * dx + dy * dy <= self.r2
+
+
+class Polygon:
+    """
+    Polygon AOI given by its vertices, which can be concave.
+    """
+
+    def __init__(self, name, points):
+        self.name = name
+        self.points = [(float(px), float(py)) for px, py in points]
+        xs = [p[0] for p in self.points]
+        ys = [p[1] for p in self.points]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+
+    def contains(self, x, y):
+        # even-odd rule: count the edges crossed by a ray going right from the point
+        inside = False
+        x0, y0 = self.points[-1]
+        for x1, y1 in self.points:
+            crosses = (y1 > y) != (y0 > y)
+            xCross = x0 + (y - y0) * (x1 - x0) / (y1 - y0) if y1 != y0 else x0
+            inside = inside ^ (crosses & (x < xCross))
+            x0, y0 = x1, y1
+        return inside
+
+
+def make_aoi(name, spec):
+    """
+    AOI from its description in the AOI file.
+    """
+    shape = spec.get('shape', 'rect')
+    if shape == 'rect':
+        return Rect(name, spec['x'], spec['y'], spec['w'], spec['h'])
+    if shape == 'circle':
+        return Circle(name, spec['x'], spec['y'], spec['r'])
+    if shape == 'polygon':
+        return Polygon(name, spec['points'])
+    raise ValueError(f'Unknown shape {shape!r} for AOI {name!r}, use rect, circle or polygon')
+
+
+class AOIIndex:
+    """
+    AOIs of one image in a uniform grid.
+
+    Parameters
+    ==========
+    aois : list
+        Rect, Circle and Polygon objects.
+    cellSize : float or None
+        Size of the grid cells in pixels, None to use the median AOI size.
+    """
+
+    def __init__(self, aois, cellSize=None):
+        self.aois = list(aois)
+        self.names = [aoi.name for aoi in self.aois]
+        if cellSize is None:
+            sizes = sorted(max(a.bounds[2] - a.bounds[0], a.bounds[3] - a.bounds[1]) for a in self.aois)
+            cellSize = max(16.0, sizes[len(sizes) // 2]) if sizes else 64.0
+        self.cellSize = float(cellSize)
+        self.cells = defaultdict(list)
+        for i, aoi in enumerate(self.aois):
+            x0, y0, x1, y1 = aoi.bounds
+            for cx in range(math.floor(x0 / self.cellSize), math.floor(x1 / self.cellSize) + 1):
+                for cy in range(math.floor(y0 / self.cellSize), math.floor(y1 / self.cellSize) + 1):
+                    self.cells[(cx, cy)].append(i)
+        self.cells = dict(self.cells)
+
+    def __len__(self):
+        return len(self.aois)
+
+    def hit(self, x, y):
+        """
+        Names of the AOIs containing a point, e.g. the current gaze position.
+
+        Parameters
+        ==========
+        x, y : float
+            Point in image pixels.
+
+        Returns
+        ==========
+        list of str
+            Empty if the point is in no AOI.
+        """
+        candidates = self.cells.get((math.floor(x / self.cellSize), math.floor(y / self.cellSize)), ())
+        return [self.names[i] for i in candidates if self.aois[i].contains(x, y)]
+
+    def classify(self, x, y):
+        """
+        AOIs containing each of many points, e.g. the gaze samples of a recording.
+
+        Points are grouped by grid cell and each group is tested, vectorized,
+        against the AOIs of its cell only.
+
+        Parameters
+        ==========
+        x, y : numpy.ndarray
+            Points in image pixels, NaN for missing samples.
+
+        Returns
+        ==========
+        numpy.ndarray, numpy.ndarray
+            Sample and AOI indices of every (sample, AOI) hit.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        if len(valid) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        cx = np.floor(x[valid] / self.cellSize).astype(np.int64)
+        cy = np.floor(y[valid] / self.cellSize).astype(np.int64)
+        order = np.lexsort((cy, cx))
+        valid, cx, cy = valid[order], cx[order], cy[order]
+        starts = np.flatnonzero(np.r_[True, (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])])
+        ends = np.r_[starts[1:], len(valid)]
+        samples, aois = [], []
+        for start, end in zip(starts, ends):
+            candidates = self.cells.get((int(cx[start]), int(cy[start])))
+            if not candidates:
+                continue
+            points = valid[start:end]
+            for i in candidates:
+                inside = points[self.aois[i].contains(x[points], y[points])]
+                samples.append(inside)
+                aois.append(np.full(len(inside), i))
+        if not samples:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(samples), np.concatenate(aois)
+
+    def hits(self, x, y):
+        """
+        (samples, AOIs) boolean array.
+        """
+        matrix = np.zeros((len(x), len(self.aois)), dtype=bool)
+        samples, aois = self.classify(x, y)
+        matrix[samples, aois] = True
+        return matrix
+
+
+def height_to_pixels(x, y, size):
+    """
+    Gaze positions in 'height' window units to pixels of a full-screen image.
+
+    Parameters
+    ==========
+    x, y : numpy.ndarray
+        Positions with the origin at the center of the screen and y going up.
+    size : tuple of int
+        Width and height of the window in pixels, `win.size`.
+
+    Returns
+    ==========
+    numpy.ndarray, numpy.ndarray
+        Positions with the origin at the top-left corner and y going down.
+    """
+    width, height = size
+    return np.asarray(x) * height + width / 2, height / 2 - np.asarray(y) * height
+
+
+def load_aoi_store(path='aoi_coordenates.json', cellSize=None):
+    """
+    Spatial index of the AOIs of every image in an AOI file.
+
+    Returns
+    ==========
+    dict
+        {image name: AOIIndex}. An image with a single unnamed AOI gets an AOI
+        named after the image.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    store = {}
+    for image, aois in spec.items():
+        if 'x' in aois or 'shape' in aois:
+            aois = {image: aois}
+        store[image] = AOIIndex([make_aoi(name, a) for name, a in aois.items()], cellSize)
+    return store
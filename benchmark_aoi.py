@@ -0,0 +1,84 @@
+"""
+AOI hit-testing benchmark, grid index against linear scans.
+
+Generates an image with many random AOIs (rectangles, circles and polygons)
+and random gaze samples, and times:
+
+- online: the AOIs containing one gaze point, once per frame, with a linear
+  scan of all the AOIs and with `AOIIndex.hit`,
+- offline: the (samples, AOIs) hits of a whole recording, with a broadcast
+  over all the AOIs and with `AOIIndex.hits`.
+
+Both methods must find the same hits. Run it with:
+
+    python benchmark_aoi.py --aois 500 --samples 200000
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from aoi_index import AOIIndex, Circle, Polygon, Rect
+
+
+def random_aois(n, width=1920, height=1080, size=60, seed=1):
+    rng = np.random.default_rng(seed)
+    aois = []
+    for i in range(n):
+        x, y = rng.uniform(0, width - size), rng.uniform(0, height - size)
+        kind = i % 3
+        if kind == 0:
+            aois.append(Rect(f'rect{i}', x, y, rng.uniform(10, size), rng.uniform(10, size)))
+        elif kind == 1:
+            aois.append(Circle(f'circle{i}', x, y, rng.uniform(5, size / 2)))
+        else:
+            angles = np.sort(rng.uniform(0, 2 * math.pi, 6))
+            radii = rng.uniform(5, size / 2, 6)
+            aois.append(Polygon(f'polygon{i}', list(zip(x + radii * np.cos(angles),
+                                                        y + radii * np.sin(angles)))))
+    return aois
+
+
+def linear_hit(aois, x, y):
+    return [aoi.name for aoi in aois if aoi.contains(x, y)]
+
+
+def linear_hits(aois, x, y):
+    return np.stack([aoi.contains(x, y) for aoi in aois], axis=1)
+
+
+def timed(function, *args):
+    t0 = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--aois', type=int, default=500)
+    parser.add_argument('--samples', type=int, default=200000)
+    parser.add_argument('--frames', type=int, default=2000, help='gaze points tested one by one')
+    args = parser.parse_args()
+
+    aois = random_aois(args.aois)
+    index, buildTime = timed(AOIIndex, aois)
+    print(f'{args.aois} AOIs, grid of {len(index.cells)} cells of {index.cellSize:.0f} px '
+          f'built in {buildTime * 1000:.1f} ms')
+    rng = np.random.default_rng(2)
+    x = rng.uniform(0, 1920, args.samples)
+    y = rng.uniform(0, 1080, args.samples)
+
+    points = list(zip(x[:args.frames].tolist(), y[:args.frames].tolist()))
+    linear, linearTime = timed(lambda: [linear_hit(aois, px, py) for px, py in points])
+    grid, gridTime = timed(lambda: [index.hit(px, py) for px, py in points])
+    assert [sorted(h) for h in linear] == [sorted(h) for h in grid]
+    print(f'online, per gaze point: linear {linearTime / args.frames * 1e6:.1f} us, '
+          f'grid {gridTime / args.frames * 1e6:.1f} us ({linearTime / gridTime:.0f}x)')
+
+    linear, linearTime = timed(linear_hits, aois, x, y)
+    grid, gridTime = timed(index.hits, x, y)
+    assert np.array_equal(linear, grid)
+    print(f'offline, {args.samples} samples: linear {linearTime:.3f} s, '
+          f'grid {gridTime:.3f} s ({linearTime / gridTime:.1f}x), {int(grid.sum())} hits')
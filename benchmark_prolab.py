@@ -0,0 +1,158 @@
+"""
+Per-trial Pro Lab overhead of the experiment, measured against `prolab_mock`.
+
+Each trial of the experiment shows a fixation cross and an image, and both are
+sent to Pro Lab as stimulus events. This script replays the Pro Lab traffic of
+that loop through Titta's `TalkToProLab`, against a mock Pro Lab with a given
+network latency, and reports how long the trial loop is blocked by it:
+
+- current: what the experiment used to do on every routine, ListMedia twice
+  (list_media and find_media), GetTimestamp at onset and offset and a
+  synchronous SendStimulusEvent, each waiting for its response.
+- optimized: what the experiment does now, media_id from a `MediaManifest`
+  fetched once, timestamps converted with the `ProLabClock` model and stimulus
+  events put in a `ProLabEventQueue`, so the loop only pays for queueing. The
+  time to fetch the manifest and calibrate the clock, to deliver the queued
+  events and the error of the clock model are reported separately. The mock
+  only delays its responses, not the requests, so the model error is about
+  half the latency; on a real network the delay is closer to symmetric.
+
+Before the trials, `--uploads` new images of `--upload-kb` kB are uploaded
+through `MediaManifest.upload`, so Titta's UploadMedia exchange (request,
+acknowledgement, 64 kB chunks, media_id) is exercised against the mock as well.
+
+`TalkToProLab` always connects to ws://localhost:8080, so the mock is started
+on that port. Run it with:
+
+    python benchmark_prolab.py --trials 60 --latency 0.005
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from titta.TalkToProLab import TalkToProLab
+
+from clock_sync import ProLabClock
+from prolab_events import ProLabEventQueue
+from prolab_media import MediaManifest
+from prolab_mock import MockProLab
+
+
+def start_mock(mock, port=8080):
+    ready = threading.Event()
+    thread = threading.Thread(target=lambda: asyncio.run(mock.serve('localhost', port, ready)),
+                              name='MockProLab', daemon=True)
+    thread.start()
+    ready.wait()
+
+
+def current_routine(ttl, recording_id, media_name):
+    media_list = ttl.list_media()['media_list']
+    # find_media lists the media again
+    ttl.list_media()
+    media_id = next(m['media_id'] for m in media_list if m['media_name'] == media_name)
+    t_onset = int(ttl.get_time_stamp()['timestamp'])
+    t_offset = int(ttl.get_time_stamp()['timestamp'])
+    ttl.send_stimulus_event(recording_id, str(t_onset), media_id, end_timestamp=str(t_offset))
+
+
+def optimized_routine(manifest, path, clock, events):
+    media_id = manifest[path]
+    t_onset = clock.to_prolab(time.perf_counter())
+    t_offset = clock.to_prolab(time.perf_counter())
+    events.stimulus_event(t_onset, media_id, end_timestamp=t_offset)
+
+
+def summarise(name, durations):
+    durations = sorted(d * 1000 for d in durations)
+    p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+    print(f'{name:>10}: mean {statistics.mean(durations):7.3f} ms  '
+          f'median {statistics.median(durations):7.3f} ms  p99 {p99:7.3f} ms  '
+          f'max {durations[-1]:7.3f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--trials', type=int, default=60)
+    parser.add_argument('--latency', type=float, default=0.005, help='network delay of each response (s)')
+    parser.add_argument('--jitter', type=float, default=0.002, help='maximum random extra delay (s)')
+    parser.add_argument('--processing', type=float, default=0.0005, help='time to handle each request (s)')
+    parser.add_argument('--media', type=int, default=7, help='number of media in the project')
+    parser.add_argument('--uploads', type=int, default=2, help='number of new media uploaded before the trials')
+    parser.add_argument('--upload-kb', type=int, default=500, help='size of each uploaded media (kB)')
+    args = parser.parse_args()
+
+    mock = MockProLab(latency=args.latency, jitter=args.jitter, processing=args.processing, seed=1)
+    for i in range(args.media):
+        mock.media[f'id{i}'] = {'media_id': f'id{i}', 'media_name': f'img{i}', 'md5': ''}
+    start_mock(mock)
+    ttl = TalkToProLab(project_name=None, dummy_mode=False)
+    participant = ttl.add_participant('benchmark')
+    recording_id = ttl.start_recording('benchmark', participant['participant_id'],
+                                       screen_width=1920, screen_height=1080)['recording_id']
+    names = [f'img{i % args.media}' for i in range(args.trials)]
+
+    current = []
+    for name in names:
+        t0 = time.perf_counter()
+        current_routine(ttl, recording_id, 'img0')  # fixation cross
+        current_routine(ttl, recording_id, name)  # trial image
+        current.append(time.perf_counter() - t0)
+
+    with tempfile.TemporaryDirectory() as folder:
+        # the manifest only matches files which exist
+        paths = {}
+        for i in range(args.media):
+            paths[f'img{i}'] = os.path.join(folder, f'img{i}.png')
+            with open(paths[f'img{i}'], 'wb') as f:
+                f.write(bytes([i]))
+        t0 = time.perf_counter()
+        manifest = MediaManifest(ttl)
+        manifest.fetch()
+        for path in paths.values():
+            manifest.match(path)
+        clock = ProLabClock(ttl, clock=time.perf_counter).calibrate().start()
+        setup = time.perf_counter() - t0
+        # media which are not in the project yet
+        newPaths = [os.path.join(folder, f'new{i}.png') for i in range(args.uploads)]
+        for path in newPaths:
+            with open(path, 'wb') as f:
+                f.write(os.urandom(args.upload_kb * 1000))
+        t0 = time.perf_counter()
+        for path in newPaths:
+            assert manifest.match(path) is None
+            manifest.upload(path)
+        upload = time.perf_counter() - t0
+        listed = {m['media_name']: m['media_id'] for m in ttl.list_media()['media_list']}
+        assert all(listed.get(f'new{i}') == manifest[path] for i, path in enumerate(newPaths)), \
+            'uploaded media not listed by Pro Lab under their media_id'
+    events = ProLabEventQueue(ttl, recording_id).start()
+
+    optimized = []
+    for name in names:
+        t0 = time.perf_counter()
+        optimized_routine(manifest, paths['img0'], clock, events)
+        optimized_routine(manifest, paths[name], clock, events)
+        optimized.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    unsent = events.drain()
+    drain = time.perf_counter() - t0
+    clock.stop()
+    # the mock's timestamps are time.perf_counter() in microseconds, so the model can be checked
+    errors = [abs(clock.to_prolab(t) - t * 1e6) for t in (time.perf_counter() for _ in range(100))]
+    ttl.disconnect()
+
+    print(f'Pro Lab overhead per trial ({args.trials} trials, latency {args.latency * 1000:g} ms '
+          f'+ up to {args.jitter * 1000:g} ms jitter)')
+    summarise('current', current)
+    summarise('optimized', optimized)
+    print(f'Fetching the manifest and calibrating the clock took {setup * 1000:.1f} ms before the loop')
+    print(f'Uploading {args.uploads} new media of {args.upload_kb} kB took {upload * 1000:.1f} ms')
+    print(f'Delivering the {events.sent} queued events took {drain * 1000:.1f} ms after the loop, '
+          f'{len(unsent)} not sent')
+    print(f'{clock.summary()}, model error {statistics.mean(errors):.0f} us')
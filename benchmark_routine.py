@@ -0,0 +1,145 @@
+"""
+Frame loop benchmark, Builder component checks against `RoutineScheduler`.
+
+Simulates a routine with many components (e.g. one stimulus per AOI) starting
+and stopping at random times on a 60 Hz frame grid, and times the per-frame
+component bookkeeping:
+
+- builder: the start and stop condition of every component checked on every
+  frame, then a scan for a component which has not finished,
+- scheduler: `RoutineScheduler.update` and its count of unfinished components.
+
+Both must start and stop every component on the same frame. This is checked
+twice: with every flip on its predicted time, and with flips coming `--early`
+seconds before it, so that `win.timeOnFlip` corrects the start times of the
+components to earlier values than the ones they were scheduled with. Run it
+with:
+
+    python benchmark_routine.py --components 50 --frames 600
+"""
+
+import argparse
+import time
+
+import numpy as np
+from psychopy.constants import NOT_STARTED, STARTED, FINISHED
+
+from routine_scheduler import RoutineScheduler
+
+
+class Window:
+    """
+    Minimal stand-in for `visual.Window`, only sets the `timeOnFlip` attributes on flip.
+    """
+
+    def __init__(self):
+        self._toTime = []
+
+    def timeOnFlip(self, obj, attrib):
+        self._toTime.append((obj, attrib))
+
+    def flip(self, flipTime):
+        for obj, attrib in self._toTime:
+            setattr(obj, attrib, flipTime)
+        self._toTime = []
+
+
+class Handler:
+    """
+    Minimal stand-in for `data.ExperimentHandler`.
+    """
+
+    def timestampOnFlip(self, win, name, format=float):
+        pass
+
+    def addData(self, name, value):
+        pass
+
+
+class Component:
+
+    def __init__(self, name):
+        self.name = name
+        self.status = NOT_STARTED
+        self.autoDraw = False
+
+    def setAutoDraw(self, value):
+        self.autoDraw = value
+
+
+def builder_frame(win, thisExp, components, times, t, tThisFlip, tThisFlipGlobal, frameN, frameTolerance):
+    # what the generated code does for each component, then the end of routine check
+    for component, (start, duration) in zip(components, times):
+        if component.status == NOT_STARTED and tThisFlip >= start - frameTolerance:
+            component.frameNStart = frameN
+            component.tStart = t
+            component.tStartRefresh = tThisFlipGlobal
+            win.timeOnFlip(component, 'tStartRefresh')
+            thisExp.timestampOnFlip(win, f'{component.name}.started')
+            component.status = STARTED
+            component.setAutoDraw(True)
+        if component.status == STARTED:
+            if tThisFlipGlobal > component.tStartRefresh + duration - frameTolerance:
+                component.tStop = t
+                component.tStopRefresh = tThisFlipGlobal
+                component.frameNStop = frameN
+                thisExp.timestampOnFlip(win, f'{component.name}.stopped')
+                component.status = FINISHED
+                component.setAutoDraw(False)
+    continueRoutine = False
+    for component in components:
+        if hasattr(component, 'status') and component.status != FINISHED:
+            continueRoutine = True
+            break
+    return continueRoutine
+
+
+def run(mode, times, frames, frameDur, early=0.0, frameTolerance=0.001):
+    win, thisExp = Window(), Handler()
+    components = [Component(f'aoi{i}') for i in range(len(times))]
+    scheduler = RoutineScheduler(win, thisExp, frameTolerance)
+    for component, (start, duration) in zip(components, times):
+        scheduler.add(component, start=start, duration=duration)
+    scheduler.begin()
+    frameTimes = []
+    for frameN in range(frames):
+        t = frameN * frameDur
+        tThisFlip = tThisFlipGlobal = t + frameDur
+        t0 = time.perf_counter()
+        if mode == 'builder':
+            continueRoutine = builder_frame(win, thisExp, components, times, t, tThisFlip, tThisFlipGlobal,
+                                            frameN, frameTolerance)
+        else:
+            scheduler.update(t, tThisFlip, tThisFlipGlobal, frameN)
+            continueRoutine = not scheduler.finished
+        frameTimes.append(time.perf_counter() - t0)
+        if not continueRoutine:
+            break
+        # the flip really happens `early` seconds before the predicted time
+        win.flip(tThisFlipGlobal - early)
+    frameNs = [(getattr(c, 'frameNStart', None), getattr(c, 'frameNStop', None)) for c in components]
+    return np.array(frameTimes), frameNs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--components', type=int, default=50)
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--refresh', type=float, default=60.0, help='simulated refresh rate (Hz)')
+    parser.add_argument('--early', type=float, default=0.004,
+                        help='time (s) the flips come before their predicted time, in the second case')
+    args = parser.parse_args()
+
+    frameDur = 1.0 / args.refresh
+    rng = np.random.default_rng(1)
+    length = args.frames * frameDur
+    starts = rng.uniform(0, length / 2, args.components)
+    times = list(zip(starts.tolist(), rng.uniform(0.1, length / 2, args.components).tolist()))
+
+    for early in (0.0, args.early):
+        print(f'flips {early * 1000:.1f} ms before their predicted time')
+        results = {mode: run(mode, times, args.frames, frameDur, early) for mode in ('builder', 'scheduler')}
+        assert results['builder'][1] == results['scheduler'][1], 'components started or stopped on different frames'
+        for mode, (frameTimes, frameNs) in results.items():
+            print(f'{mode:>9}: {len(frameTimes)} frames, per frame median {np.median(frameTimes) * 1e6:.1f} us, '
+                  f'p99 {np.percentile(frameTimes, 99) * 1e6:.1f} us, max {frameTimes.max() * 1e6:.1f} us')
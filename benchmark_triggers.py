@@ -0,0 +1,153 @@
+"""
+Trigger timing benchmark, without a trigger box.
+
+Replays the "Each Frame" code of the eeg_trigger component on a simulated
+60 Hz frame loop and writes the triggers to a loopback (or in-memory) port. For
+each pulse it measures, relative to the flip the trigger was meant for:
+
+- onset latency: when the code arrived at the other end of the port,
+- pulse width error: measured width minus the requested width,
+- jitter: spread of the onset latency.
+
+Two versions of the component are compared:
+
+- frame: the original code, writing with `win.callOnFlip(port.write, ...)`
+  and ending the pulse on the first frame after the width has elapsed.
+- engine: `win.callOnFlip(trigger_engine.pulse, code, width)`.
+
+Run it with:
+
+    python benchmark_triggers.py --pulses 100 --backend loopback
+"""
+
+import argparse
+import statistics
+import time
+
+from eeg_triggers import TriggerEngine
+from trigger_backends import open_backend
+
+
+class FrameLoop:
+    """
+    Minimal stand-in for `visual.Window`: flips on a fixed refresh grid and
+    runs the `callOnFlip` functions straight after each flip.
+    """
+
+    def __init__(self, refreshRate=60.0, clock=time.perf_counter):
+        self.frameDur = 1.0 / refreshRate
+        self.clock = clock
+        self.nextFlip = clock() + self.frameDur
+        self.toCall = []
+
+    def callOnFlip(self, function, *args, **kwargs):
+        self.toCall.append((function, args, kwargs))
+
+    def flip(self):
+        # sleep most of the way, then spin, like waiting for the vertical blank
+        time.sleep(max(0.0, self.nextFlip - self.clock() - 0.002))
+        while self.clock() < self.nextFlip:
+            pass
+        flipTime = self.nextFlip
+        self.nextFlip += self.frameDur
+        toCall, self.toCall = self.toCall, []
+        for function, args, kwargs in toCall:
+            function(*args, **kwargs)
+        return flipTime
+
+
+def run_trial(win, mode, write, engine, code, width, frames):
+    """
+    One trial of the eeg_trigger Each Frame logic, returns the onset flip time.
+    """
+    stimulus_pulse_started = False
+    stimulus_pulse_ended = False
+    onsetFlip = None
+    for frameN in range(frames):
+        if not stimulus_pulse_started:
+            if mode == 'frame':
+                win.callOnFlip(write, code)
+            else:
+                win.callOnFlip(engine.pulse, code, width=width)
+            stimulus_pulse_start_time = win.clock()
+            stimulus_pulse_started = True
+        if mode == 'frame' and stimulus_pulse_started and not stimulus_pulse_ended:
+            if win.clock() - stimulus_pulse_start_time >= width:
+                win.callOnFlip(write, [0x00])
+                stimulus_pulse_ended = True
+        flipTime = win.flip()
+        if onsetFlip is None:
+            onsetFlip = flipTime
+    return onsetFlip
+
+
+def measure(received, onsets, width):
+    """
+    Onset latencies and width errors (in ms) from the bytes read back.
+    """
+    latencies = []
+    widthErrors = []
+    codes = received
+    i = 0
+    for onset in onsets:
+        # the next non-zero byte is the onset, the next zero byte the reset
+        while i < len(codes) and codes[i][1] == 0:
+            i += 1
+        if i >= len(codes):
+            break
+        tOn = codes[i][0]
+        i += 1
+        while i < len(codes) and codes[i][1] != 0:
+            i += 1
+        if i >= len(codes):
+            break
+        tOff = codes[i][0]
+        latencies.append((tOn - onset) * 1000)
+        widthErrors.append((tOff - tOn - width) * 1000)
+    return latencies, widthErrors
+
+
+def histogram(values, bins=10, barWidth=40):
+    lo, hi = min(values), max(values)
+    step = (hi - lo) / bins or 1.0
+    counts = [0] * bins
+    for v in values:
+        counts[min(bins - 1, int((v - lo) / step))] += 1
+    lines = []
+    for n, count in enumerate(counts):
+        bar = '#' * round(barWidth * count / max(counts))
+        lines.append(f'    {lo + n * step:8.3f} ms | {bar} {count}')
+    return '\n'.join(lines)
+
+
+def report(name, latencies, widthErrors):
+    print(f'\n{name}: {len(latencies)} pulses')
+    print(f'  onset latency: median {statistics.median(latencies):.3f} ms, '
+          f'max {max(latencies):.3f} ms, jitter (sd) {statistics.pstdev(latencies):.3f} ms')
+    print(histogram(latencies))
+    print(f'  pulse width error: median {statistics.median(widthErrors):.3f} ms, '
+          f'max {max(widthErrors):.3f} ms')
+    print(histogram(widthErrors))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pulses', type=int, default=100)
+    parser.add_argument('--width', type=float, default=0.1, help='pulse width (s)')
+    parser.add_argument('--refresh', type=float, default=60.0, help='simulated refresh rate (Hz)')
+    parser.add_argument('--backend', default='loopback', choices=['loopback', 'memory'])
+    args = parser.parse_args()
+
+    framesPerTrial = int(args.width * args.refresh) + 5
+    for mode in ('frame', 'engine'):
+        port = open_backend(args.backend)
+        engine = TriggerEngine(port).start() if mode == 'engine' else None
+        win = FrameLoop(args.refresh)
+        onsets = [run_trial(win, mode, port.write, engine, [0x01], args.width, framesPerTrial)
+                  for _ in range(args.pulses)]
+        if engine is not None:
+            engine.stop()
+        time.sleep(0.05)  # let the last bytes arrive
+        port.close()
+        latencies, widthErrors = measure(port.received, onsets, args.width)
+        report(mode, latencies, widthErrors)
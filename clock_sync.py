@@ -0,0 +1,130 @@
+"""
+Local model of the Tobii Pro Lab clock.
+
+Asking Pro Lab for a timestamp is a blocking network round trip, and the
+answer describes when the request was handled, not when the stimulus appeared.
+Instead, Pro Lab timestamps are sampled in the background and an offset and
+drift are fitted against the experiment clock, so any flip time measured by
+PsychoPy can be converted to Pro Lab time without talking to Pro Lab.
+"""
+
+import threading
+from collections import deque
+
+
+class ProLabClock:
+    """
+    Linear model `prolab_us = offset + drift * local_s`, refitted after every sample.
+
+    Only the clock websocket of the connection is used, so the sampling thread
+    does not interfere with the messages sent to the external presenter from
+    the experiment thread.
+
+    Parameters
+    ==========
+    ttl : titta.TalkToProLab.TalkToProLab
+        Connection to Pro Lab.
+    clock : callable
+        Function returning the local time in seconds, e.g. `globalClock.getTime`.
+    interval : float
+        Time in seconds between two background samples.
+    window : int
+        Number of most recent samples the model is fitted on.
+    minSpan : float
+        Time in seconds the samples must span before the drift is estimated,
+        until then only the offset is fitted.
+    """
+
+    def __init__(self, ttl, clock, interval=1.0, window=600, minSpan=10.0):
+        self.ttl = ttl
+        self.clock = clock
+        self.interval = interval
+        self.minSpan = minSpan
+        self.samples = deque(maxlen=window)
+        self.offset = None
+        self.drift = 1e6
+        self.residual = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        """
+        Take one (local time, Pro Lab time, round trip) sample and refit the model.
+        """
+        t0 = self.clock()
+        prolab = int(self.ttl.get_time_stamp()['timestamp'])
+        t1 = self.clock()
+        with self._lock:
+            # assume the timestamp was taken half way through the round trip
+            self.samples.append(((t0 + t1) / 2, prolab, t1 - t0))
+            self._fit()
+
+    def calibrate(self, n=20):
+        """
+        Take a burst of samples so that the model can be used straight away.
+        """
+        for _ in range(n):
+            self.sample()
+        return self
+
+    def _fit(self):
+        # fit on the half of the samples with the shortest round trip, those
+        # have the least uncertainty on when the timestamp was taken
+        best = sorted(self.samples, key=lambda s: s[2])[:max(2, len(self.samples) // 2)]
+        n = len(best)
+        meanX = sum(s[0] for s in best) / n
+        meanY = sum(s[1] for s in best) / n
+        sxx = sum((s[0] - meanX) ** 2 for s in best)
+        span = self.samples[-1][0] - self.samples[0][0]
+        if span >= self.minSpan and sxx > 0:
+            drift = sum((s[0] - meanX) * (s[1] - meanY) for s in best) / sxx
+        else:
+            drift = 1e6
+        offset = meanY - drift * meanX
+        residual = (sum((s[1] - offset - drift * s[0]) ** 2 for s in best) / n) ** 0.5
+        self.offset, self.drift, self.residual = offset, drift, residual
+
+    def start(self):
+        """
+        Keep sampling in a background thread, returns immediately.
+        """
+        self._thread = threading.Thread(target=self._run, name='ProLabClock', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                # keep the last model, a missed sample only loses precision
+                print(f'Pro Lab clock sample failed: {e}')
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def to_prolab(self, t):
+        """
+        Convert a local time to a Pro Lab timestamp.
+
+        Parameters
+        ==========
+        t : float
+            Time in seconds on the local clock, e.g. a flip time from `win.timeOnFlip`.
+
+        Returns
+        ==========
+        int
+            Pro Lab timestamp in microseconds.
+        """
+        with self._lock:
+            if self.offset is None:
+                raise RuntimeError('Pro Lab clock has no samples yet, call calibrate() first')
+            return int(round(self.offset + self.drift * t))
+
+    def summary(self):
+        return (f'Pro Lab clock: {len(self.samples)} samples, '
+                f'drift {self.drift / 1e6 - 1:+.2e}, residual {self.residual:.0f} us')
@@ -0,0 +1,147 @@
+"""
+Conditions file compiled once to a JSON cache.
+
+`data.importConditions('images.xlsx')` opens the workbook with openpyxl at every
+launch. `load_conditions` only does that when the content of the file changed:
+the conditions are checked (required columns, numeric columns) and stored in
+`data/conditions_cache.json` under the SHA-256 of the workbook, and later
+launches read them from there. The stimulus files listed in the conditions are
+looked up at every launch, so a missing image stops the experiment before it
+starts instead of in the middle of a trial.
+"""
+
+import json
+import numbers
+import os
+
+from media_cache import file_digest
+
+
+def _plain(value):
+    # numpy values to Python ones, anything else JSON does not know to text
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def compile_conditions(path, columns=(), numeric=()):
+    """
+    Read and check a conditions file.
+
+    Parameters
+    ==========
+    path : str
+        Conditions file (.xlsx, .csv...), read with `data.importConditions`.
+    columns : list of str
+        Columns every row must have a value in.
+    numeric : list of str
+        Columns whose values must be numbers.
+
+    Returns
+    ==========
+    list of dict
+        The conditions, one dict per row.
+    """
+    from psychopy import data
+
+    conditions = [dict(row) for row in data.importConditions(path)]
+    names = list(conditions[0]) if conditions else []
+    missing = [c for c in list(columns) + list(numeric) if c not in names]
+    if missing:
+        raise ValueError(f'{path} has no column {", ".join(missing)} (columns: {", ".join(names)})')
+    for i, row in enumerate(conditions):
+        # row 1 is the header in the spreadsheet
+        empty = [c for c in columns if row[c] is None or row[c] == '']
+        if empty:
+            raise ValueError(f'{path} row {i + 2}: no value in {", ".join(empty)}')
+        wrong = [c for c in numeric if not isinstance(row[c], numbers.Number)]
+        if wrong:
+            raise ValueError(f'{path} row {i + 2}: {", ".join(f"{c}={row[c]!r}" for c in wrong)} '
+                             f'is not a number')
+    return conditions
+
+
+def check_files(conditions, fileColumns, folder=''):
+    """
+    Stat every file referenced by the conditions.
+
+    Parameters
+    ==========
+    conditions : list of dict
+        Conditions as returned by `load_conditions`.
+    fileColumns : list of str
+        Columns holding file paths.
+    folder : str
+        Folder relative paths are resolved from.
+
+    Returns
+    ==========
+    dict
+        Size in bytes of every file, by path as written in the conditions.
+    """
+    sizes, missing = {}, []
+    for row in conditions:
+        for column in fileColumns:
+            name = row[column]
+            if not name or name in sizes or name in missing:
+                continue
+            try:
+                sizes[name] = os.stat(os.path.join(folder, name)).st_size
+            except OSError:
+                missing.append(name)
+    if missing:
+        raise FileNotFoundError(f'Stimulus files not found in {os.path.abspath(folder)}: {", ".join(missing)}')
+    return sizes
+
+
+def load_conditions(path, cache=os.path.join('data', 'conditions_cache.json'), columns=(), numeric=(),
+                    fileColumns=()):
+    """
+    Conditions of a conditions file, compiled only if it changed since the last launch.
+
+    Parameters
+    ==========
+    path : str
+        Conditions file.
+    cache : str
+        JSON file the compiled conditions are kept in.
+    columns, numeric : list of str
+        Checks done when the file is compiled, see `compile_conditions`.
+    fileColumns : list of str
+        Columns holding stimulus files, checked at every launch, see `check_files`.
+
+    Returns
+    ==========
+    list of dict
+        The conditions, one dict per row, as `data.importConditions` gives them.
+    """
+    digest = file_digest(path)
+    entries = {}
+    if os.path.isfile(cache):
+        try:
+            with open(cache, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            # a broken cache only costs reading the conditions file again
+            print(f'Ignoring unreadable conditions cache "{cache}": {e}')
+    entry = entries.get(digest)
+    checks = {'columns': list(columns), 'numeric': list(numeric)}
+    if entry is None or entry['checks'] != checks:
+        conditions = compile_conditions(path, columns, numeric)
+        source = os.path.abspath(path)
+        # only keep the latest version of each conditions file
+        entries = {key: e for key, e in entries.items() if e['source'] != source}
+        entries[digest] = {'source': source, 'checks': checks, 'conditions': conditions}
+        folder = os.path.dirname(cache)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmpPath = cache + '.tmp'
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=1, default=_plain)
+        os.replace(tmpPath, cache)
+        # as read from the cache, so they are the same on every launch
+        conditions = json.loads(json.dumps(conditions, default=_plain))
+    else:
+        conditions = entry['conditions']
+    check_files(conditions, fileColumns, os.path.dirname(path))
+    return conditions
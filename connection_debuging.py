@@ -2,31 +2,27 @@ import asyncio
 import websockets
 import json
 
+from prolab_client import AsyncProLabClient
+
 async def connect_to_tobii_pro_lab():
-    uri = "ws://localhost:8080/project?client_id=TestClient"
-    
+    client = AsyncProLabClient(client_id='TestClient')
+
     try:
-        async with websockets.connect(uri) as websocket:
-            print("Connection established successfully")
-            
-            # Request media list
-            media_request = {
-                "operation": "ListMedia"
-            }
-            await websocket.send(json.dumps(media_request))
-            media_response = await websocket.recv()
-            print("\nMedia list:")
-            print(media_response)
-            
-            # Request participant list
-            participant_request = {
-                "operation": "ListParticipants"
-            }
-            await websocket.send(json.dumps(participant_request))
-            participant_response = await websocket.recv()
-            print("\nParticipant list:")
-            print(participant_response)
-    
+        # Both requests are sent at once on the same connection
+        media_response, participant_response = await asyncio.gather(
+            client.list_media(),
+            client.list_participants(),
+        )
+        print("Connection established successfully")
+
+        # Media list
+        print("\nMedia list:")
+        print(json.dumps(media_response))
+
+        # Participant list
+        print("\nParticipant list:")
+        print(json.dumps(participant_response))
+
     except websockets.exceptions.ConnectionClosedError:
         print("Connection closed unexpectedly")
     except websockets.exceptions.WebSocketException as e:
@@ -35,6 +31,8 @@ async def connect_to_tobii_pro_lab():
         print("Connection refused. Make sure Tobii Pro Lab is running and the WebSocket server is enabled.")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        await client.close()
 
 if __name__ == "__main__":
     print("Connecting to Tobii Pro Lab...")
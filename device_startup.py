@@ -0,0 +1,110 @@
+"""
+Background connection of the experiment's devices.
+
+Connecting to the eye tracker, Tobii Pro Lab and the trigger port takes a few
+seconds. Instead of doing it one after the other when the script is imported,
+each device is connected on its own thread while the participant dialog is
+shown, and the experiment only waits, if at all, when it first needs a device.
+A cancelled dialog quits straight away, without waiting for the connections.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+
+class DeviceStartup:
+    """
+    Devices connected concurrently, each behind a future.
+
+    Parameters
+    ==========
+    clock : callable
+        Function returning the time in seconds, for the startup timings.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.openers = {}
+        self.futures = {}
+        self.timings = {}
+        self._started = None
+
+    def register(self, name, opener, *args, **kwargs):
+        """
+        Declare how to connect a device, nothing is connected yet.
+
+        Parameters
+        ==========
+        name : str
+            Name the device is got with, e.g. 'prolab'.
+        opener : callable
+            Called with `*args` and `**kwargs` on a background thread, returns the device.
+        """
+        self.openers[name] = (opener, args, kwargs)
+        return self
+
+    def start(self):
+        """
+        Start connecting every registered device, returns immediately.
+        """
+        if self._started is None:
+            self._started = self.clock()
+        for name in self.openers:
+            if name not in self.futures:
+                future = Future()
+                self.futures[name] = future
+                # daemon threads, so quitting never waits for a device
+                threading.Thread(target=self._connect, args=(name, future),
+                                 name=f'connect-{name}', daemon=True).start()
+        return self
+
+    def _connect(self, name, future):
+        opener, args, kwargs = self.openers[name]
+        t0 = self.clock()
+        device = error = None
+        try:
+            device = opener(*args, **kwargs)
+        except BaseException as e:
+            error = e
+        # timings first, they are read as soon as the future is done
+        self.timings.setdefault(name, {}).update(started=t0 - self._started, connect=self.clock() - t0,
+                                                 failed=error is not None)
+        if error is None:
+            future.set_result(device)
+        else:
+            future.set_exception(error)
+
+    def ready(self, name):
+        """
+        Whether a device is connected (or failed to).
+        """
+        return name in self.futures and self.futures[name].done()
+
+    def get(self, name, timeout=None):
+        """
+        A connected device, waiting for it if needed.
+
+        The connection is started if `start` was not called, and an error
+        raised while connecting is raised here.
+        """
+        self.start()
+        t0 = self.clock()
+        try:
+            return self.futures[name].result(timeout)
+        finally:
+            self.timings.setdefault(name, {})['waited'] = self.clock() - t0
+
+    def summary(self):
+        """
+        One line per device: when it started connecting, how long it took and
+        how long the experiment waited for it.
+        """
+        lines = ['Device startup:']
+        for name in self.openers:
+            timing = self.timings.get(name, {})
+            state = 'failed after' if timing.get('failed') else 'connected in'
+            lines.append(f"  {name}: {state} {timing.get('connect', float('nan')):.3f} s "
+                         f"(started at {timing.get('started', float('nan')):.3f} s), "
+                         f"waited {timing.get('waited', 0.0):.3f} s")
+        return '\n'.join(lines)
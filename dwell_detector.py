@@ -0,0 +1,173 @@
+"""
+Gaze-contingent dwell detection on every eye tracker sample.
+
+Checking `roi.isLookedIn` once per frame only sees the latest gaze sample, one
+in two at 120 Hz on a 60 Hz screen, and times the looks to the frame. Here all
+the samples buffered by ioHub since the previous frame are classified at once,
+so looks start and end at the sample they really did, and the end of the dwell
+is timed to the sample that completed it.
+"""
+
+import numpy as np
+
+
+def gaze_samples(events):
+    """
+    Times and gaze positions of the eye samples among ioHub events.
+
+    The position is the average of both eyes, or the eye that was found.
+
+    Returns
+    ==========
+    numpy.ndarray, numpy.ndarray, numpy.ndarray
+        Time (s), x and y of every sample, NaN when no gaze was found.
+    """
+    # only needed here, the detector itself works on plain arrays
+    from psychopy.iohub.constants import EventConstants
+
+    sampleTypes = (EventConstants.BINOCULAR_EYE_SAMPLE, EventConstants.MONOCULAR_EYE_SAMPLE)
+    samples = [e for e in events if e.type in sampleTypes]
+    t = np.fromiter((e.time for e in samples), dtype=float, count=len(samples))
+    if samples and samples[0].type == EventConstants.BINOCULAR_EYE_SAMPLE:
+        xy = np.array([(e.left_gaze_x, e.left_gaze_y, e.right_gaze_x, e.right_gaze_y)
+                       for e in samples], dtype=float)
+        # mean of the eyes which were found, NaN if neither was
+        x = np.where(np.isnan(xy[:, 0]), xy[:, 2], np.where(np.isnan(xy[:, 2]), xy[:, 0], (xy[:, 0] + xy[:, 2]) / 2))
+        y = np.where(np.isnan(xy[:, 1]), xy[:, 3], np.where(np.isnan(xy[:, 3]), xy[:, 1], (xy[:, 1] + xy[:, 3]) / 2))
+    else:
+        xy = np.array([(e.gaze_x, e.gaze_y) for e in samples], dtype=float).reshape(-1, 2)
+        x, y = xy[:, 0], xy[:, 1]
+    return t, x, y
+
+
+class DwellDetector:
+    """
+    Looks into a ROI and the moment the gaze has stayed in it long enough.
+
+    Parameters
+    ==========
+    device : ioHub eye tracker or None
+        Eye tracker the samples are read from, None to pass them to `process`.
+    roi : psychopy.visual.ROI
+        Region looked at, a circle or a rectangle, read at `start`.
+    dwell : float
+        Time in seconds the gaze must stay in the ROI.
+    """
+
+    def __init__(self, device, roi, dwell=0.5):
+        self.device = device
+        self.roi = roi
+        self.dwell = dwell
+        self.running = False
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the looks, call at the start of every routine.
+        """
+        self.running = False
+        self.tStart = None
+        self.timesOn = []
+        self.timesOff = []
+        self.transitions = []
+        self.dwellEnd = None
+        self._inside = False
+        self._lookStart = None
+
+    def start(self, t):
+        """
+        Start classifying samples, discarding those received before.
+
+        Parameters
+        ==========
+        t : float
+            Start time on the clock of the ioHub sample times, looks are timed
+            from it. After `ioServer.syncClock(globalClock)` that is
+            `globalClock.getTime()`, not `core.getTime()`.
+        """
+        self.reset()
+        self.running = True
+        self.tStart = t
+        self.center = np.asarray(self.roi.pos, dtype=float)
+        self.radius = np.abs(np.asarray(self.roi.size, dtype=float)) / 2
+        self.ellipse = getattr(self.roi, 'shape', 'circle') in ('circle', 'ellipse')
+        if self.device is not None:
+            self.device.clearEvents()
+
+    @property
+    def numLooks(self):
+        return len(self.timesOn)
+
+    def contains(self, x, y):
+        """
+        Which of the gaze positions are in the ROI.
+        """
+        dx = (x - self.center[0]) / self.radius[0]
+        dy = (y - self.center[1]) / self.radius[1]
+        with np.errstate(invalid='ignore'):
+            if self.ellipse:
+                return dx * dx + dy * dy <= 1.0
+            return (np.abs(dx) <= 1.0) & (np.abs(dy) <= 1.0)
+
+    def update(self):
+        """
+        Classify the samples received since the last call, once per frame.
+
+        Returns
+        ==========
+        float or None
+            Time (on the eye tracker clock) of the sample completing the dwell,
+            None if the dwell has not been reached yet.
+        """
+        if not self.running:
+            return None
+        return self.process(*gaze_samples(self.device.getEvents()))
+
+    def process(self, t, x, y):
+        """
+        Classify a batch of samples, see `update`.
+
+        Parameters
+        ==========
+        t, x, y : numpy.ndarray
+            Sample times and gaze positions, in the same units as the ROI.
+        """
+        self.transitions = []
+        if self.dwellEnd is not None or len(t) == 0:
+            return self.dwellEnd
+        keep = t >= self.tStart
+        t, x, y = t[keep], x[keep], y[keep]
+        if len(t) == 0:
+            return None
+        inside = self.contains(x, y)
+        before = np.empty_like(inside)
+        before[0] = self._inside
+        before[1:] = inside[:-1]
+        entries = np.flatnonzero(inside & ~before)
+        exits = np.flatnonzero(~inside & before)
+        # when the current look started, for every sample
+        lookStart = np.maximum.accumulate(np.where(inside & ~before, np.arange(len(t)), -1))
+        startTime = np.where(lookStart >= 0, t[np.maximum(lookStart, 0)],
+                             self._lookStart if self._lookStart is not None else np.inf)
+        done = np.flatnonzero(inside & (t - startTime >= self.dwell))
+        if len(done):
+            # ignore what happened after the dwell was reached
+            entries, exits = entries[entries <= done[0]], exits[exits <= done[0]]
+            self.dwellEnd = float(t[done[0]])
+        events = sorted([(i, True) for i in entries] + [(i, False) for i in exits])
+        for i, entered in events:
+            if entered:
+                self.timesOn.append(float(t[i] - self.tStart))
+                self.timesOff.append(float(t[i] - self.tStart))
+            else:
+                # the look lasted until the last sample in the ROI
+                self.timesOff[-1] = float(t[i - 1] - self.tStart) if i > 0 else self.timesOff[-1]
+            self.transitions.append((float(t[i]), entered))
+        last = done[0] if len(done) else len(t) - 1
+        if inside[last]:
+            self.timesOff[-1] = float(t[last] - self.tStart)
+            self._lookStart = float(startTime[last])
+        else:
+            self._lookStart = None
+        self._inside = bool(inside[last])
+        return self.dwellEnd
@@ -0,0 +1,140 @@
+"""
+EEG trigger writer running on its own thread.
+
+The frame loop only asks for a pulse ("code X at this flip, W ms long"); the
+writer thread owns the port, writes the code straight away and writes the reset
+code when the pulse width has elapsed, independently of the frame rate. Serial
+writes therefore never block a flip callback, and the pulse width is not
+rounded to whole frames.
+"""
+
+import heapq
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+RESET = b'\x00'
+
+
+class TriggerEngine:
+    """
+    Thread writing trigger pulses to a port at precise times.
+
+    Parameters
+    ==========
+    port : serial.Serial or any object with a `write(bytes)` method
+        Port the trigger box is connected to.
+    clock : callable
+        Function returning the time in seconds used to schedule the writes.
+    log : callable or None
+        Called with a message for every write, e.g. `psychopy.logging.data`.
+    onWrite : callable or None
+        Called with the time on `clock` and the code of every write, e.g. to
+        add it to an `event_timeline.EventTimeline`.
+    spin : float
+        Time in seconds before a deadline when the thread stops sleeping and
+        busy-waits instead, sleep alone is not precise enough.
+    """
+
+    def __init__(self, port, clock=time.perf_counter, log=None, spin=0.002, onWrite=None):
+        self.port = port
+        self.clock = clock
+        self.log = log
+        self.spin = spin
+        self.onWrite = onWrite
+        self.writes = deque(maxlen=10000)
+        self._requests = queue.Queue()
+        self._scheduled = []
+        self._order = itertools.count()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the writer thread, returns immediately.
+        """
+        self._thread = threading.Thread(target=self._run, name='TriggerEngine', daemon=True)
+        self._thread.start()
+        return self
+
+    def pulse(self, code, width=0.1, at=None):
+        """
+        Ask for a pulse, returns immediately.
+
+        Use with `win.callOnFlip(engine.pulse, code, width)` to start the pulse
+        at the next flip.
+
+        Parameters
+        ==========
+        code : bytes, int or list of int
+            Trigger code to write at the start of the pulse.
+        width : float
+            Time in seconds before the reset code is written, None to leave the
+            code on the port.
+        at : float or None
+            Time on `clock` at which to write the code, None for now.
+        """
+        if at is None:
+            at = self.clock()
+        if isinstance(code, int):
+            code = bytes([code])
+        self._requests.put((at, bytes(code), width))
+
+    def write(self, code, at=None):
+        """
+        Ask for a single write, without reset.
+        """
+        self.pulse(code, width=None, at=at)
+
+    def _schedule(self, at, code, requested):
+        heapq.heappush(self._scheduled, (at, next(self._order), code, requested))
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._scheduled:
+                timeout = max(0.0, self._scheduled[0][0] - self.clock() - self.spin)
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                request = False
+            if request is None:
+                break
+            if request:
+                at, code, width = request
+                self._schedule(at, code, at)
+                if width is not None:
+                    self._schedule(at + width, RESET, at + width)
+                continue
+            # busy-wait the last moments before the deadline
+            at = self._scheduled[0][0]
+            while self.clock() < at:
+                pass
+            _, _, code, requested = heapq.heappop(self._scheduled)
+            self._write(code, requested)
+        # write whatever is still scheduled (e.g. a pending reset) before stopping
+        while self._scheduled:
+            at, _, code, requested = heapq.heappop(self._scheduled)
+            time.sleep(max(0.0, at - self.clock()))
+            self._write(code, requested)
+
+    def _write(self, code, requested):
+        t0 = self.clock()
+        self.port.write(code)
+        t1 = self.clock()
+        # when it was written compared to when it was asked for, and how long write() blocked
+        self.writes.append((requested, t0, t1, code))
+        if self.onWrite is not None:
+            self.onWrite(t0, code)
+        if self.log is not None:
+            self.log(f'Trigger {code.hex()} written {(t0 - requested) * 1000:.3f} ms after '
+                     f'its deadline, write took {(t1 - t0) * 1000:.3f} ms')
+
+    def stop(self):
+        """
+        Write any pending code (e.g. a reset) and stop the thread.
+        """
+        self._requests.put(None)
+        if self._thread is not None:
+            self._thread.join()
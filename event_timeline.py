@@ -0,0 +1,190 @@
+"""
+Session timeline of every timing-relevant event, on a single clock.
+
+Screen flips, EEG trigger writes, ROI enter/exit transitions, fixations,
+saccades and Pro Lab messages are all logged to the same append-only binary
+file, so the alignment between the EEG and the eye tracking recordings can be
+audited afterwards.
+
+Logging an event only stores a tuple in a preallocated ring buffer; a writer
+thread packs the events and appends them to the file. Run this module on a
+timeline file to convert it to a tab separated table:
+
+    python event_timeline.py data/<session>.timeline > timeline.tsv
+"""
+
+import itertools
+import struct
+import sys
+import threading
+import time
+
+FLIP = 1
+TRIGGER = 2
+ROI_ENTER = 3
+ROI_EXIT = 4
+PROLAB = 5
+ROUTINE = 6
+FIXATION = 7
+SACCADE = 8
+KINDS = {FLIP: 'flip', TRIGGER: 'trigger', ROI_ENTER: 'roi_enter', ROI_EXIT: 'roi_exit',
+         PROLAB: 'prolab', ROUTINE: 'routine', FIXATION: 'fixation', SACCADE: 'saccade'}
+
+MAGIC = b'EVTL\x01'
+# time (s), kind, code, length of the utf-8 label which follows
+RECORD = struct.Struct('<dBiH')
+
+
+class EventTimeline:
+    """
+    Append-only event log flushed to disk by a background thread.
+
+    Events can be logged from any thread. Each one takes a slot in the ring
+    buffer from an atomic counter, so no lock is needed; if the writer thread
+    falls a whole buffer behind, new events are dropped and counted.
+
+    Parameters
+    ==========
+    path : str
+        File to append the events to.
+    clock : callable
+        Function returning the time in seconds, the same clock should be used
+        for every event (e.g. `core.getTime`).
+    size : int
+        Number of events the ring buffer can hold.
+    interval : float
+        Time in seconds between two flushes to disk.
+    """
+
+    def __init__(self, path, clock=time.perf_counter, size=65536, interval=0.5):
+        self.path = path
+        self.clock = clock
+        self.size = size
+        self.interval = interval
+        self.dropped = 0
+        self.written = 0
+        self._slots = [None] * size
+        self._counter = itertools.count()
+        self._skipped = set()
+        self._read = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def start(self):
+        """
+        Start the writer thread, returns immediately.
+        """
+        self._thread = threading.Thread(target=self._run, name='EventTimeline', daemon=True)
+        self._thread.start()
+        return self
+
+    def log(self, kind, code=0, label='', t=None):
+        """
+        Add an event to the timeline.
+
+        Parameters
+        ==========
+        kind : int
+            One of FLIP, TRIGGER, ROI_ENTER, ROI_EXIT, PROLAB, ROUTINE, FIXATION or SACCADE.
+        code : int
+            Number attached to the event (frame number, trigger code, ...).
+        label : str
+            Text attached to the event (routine or ROI name, Pro Lab message, ...).
+        t : float or None
+            Time of the event on the timeline clock, None for now.
+        """
+        if t is None:
+            t = self.clock()
+        sequence = next(self._counter)
+        index = sequence % self.size
+        if self._slots[index] is not None:
+            # the writer has not caught up with this slot yet, tell it not to wait for this event
+            self._skipped.add(sequence)
+            self.dropped += 1
+            return
+        self._slots[index] = (sequence, t, kind, code, label)
+
+    def flip(self, frameN=0, label='', t=None):
+        """
+        Log a screen flip.
+
+        Parameters
+        ==========
+        frameN : int
+            Frame number in the routine.
+        label : str
+            Name of the routine.
+        t : float or None
+            Time of the flip on the timeline clock, e.g. as returned by
+            `win.flip()` when the timeline clock is the logging clock. None for
+            now, which is late by however long `win.flip()` took to return.
+        """
+        self.log(FLIP, frameN, label, t)
+
+    def _flush(self):
+        chunks = []
+        while True:
+            index = self._read % self.size
+            event = self._slots[index]
+            if event is None or event[0] != self._read:
+                if self._read in self._skipped:
+                    self._skipped.discard(self._read)
+                    self._read += 1
+                    continue
+                # not logged yet
+                break
+            self._slots[index] = None
+            self._read += 1
+            _, t, kind, code, label = event
+            label = label.encode('utf-8')
+            chunks.append(RECORD.pack(t, kind, code, len(label)))
+            chunks.append(label)
+        if chunks:
+            self._file.write(b''.join(chunks))
+            self._file.flush()
+            self.written += len(chunks) // 2
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._flush()
+        self._flush()
+
+    def close(self):
+        """
+        Write the remaining events and close the file.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self._flush()
+        self._file.close()
+
+
+def read_timeline(path):
+    """
+    Events of a timeline file.
+
+    Returns
+    ==========
+    generator
+        (time, kind name, code, label) for every event, in the order they were written.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not an event timeline file')
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            t, kind, code, length = RECORD.unpack(header)
+            yield t, KINDS.get(kind, str(kind)), code, f.read(length).decode('utf-8')
+
+
+if __name__ == '__main__':
+    print('time\tkind\tcode\tlabel')
+    for t, kind, code, label in read_timeline(sys.argv[1]):
+        print(f'{t:.6f}\t{kind}\t{code}\t{label}')
@@ -0,0 +1,259 @@
+"""
+Online fixation and saccade detection on the eye tracker sample stream.
+
+Samples are fed as they arrive (e.g. once per frame, with everything ioHub
+buffered since the previous frame) and finished fixations and saccades are
+returned as soon as they end. Two classic algorithms are available:
+
+- 'ivt': velocity threshold. A sample is part of a saccade when the gaze moves
+  faster than `velocity` deg/s over the last `window` seconds.
+- 'idt': dispersion threshold. A fixation is a run of at least `minFixation`
+  seconds whose horizontal plus vertical spread stays under `dispersion` deg;
+  the movement between two fixations is a saccade.
+
+Only the last samples are kept, in a fixed-size ring buffer, and the current
+event is summarised by running sums, so memory does not grow with the length
+of the session.
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+
+class EyeEvent(namedtuple('EyeEvent', ['kind', 'start', 'end', 'x', 'y', 'amplitude'])):
+    """
+    A fixation or saccade: kind ('fixation' or 'saccade'), start and end time
+    (s), mean position for fixations (end position for saccades) and amplitude
+    (deg, from the start to the end position).
+    """
+
+    __slots__ = ()
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class SampleRing:
+    """
+    Last `capacity` samples, oldest first.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.data = np.empty((capacity, 3))
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, t, x, y):
+        if self.size == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+            self.size -= 1
+        self.data[(self.start + self.size) % self.capacity] = (t, x, y)
+        self.size += 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.size
+        return self.data[(self.start + i) % self.capacity]
+
+    def drop(self, n=1):
+        """
+        Forget the `n` oldest samples.
+        """
+        n = min(n, self.size)
+        self.start = (self.start + n) % self.capacity
+        self.size -= n
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+
+    def array(self):
+        """
+        (samples, 3) array of time, x and y.
+        """
+        index = (self.start + np.arange(self.size)) % self.capacity
+        return self.data[index]
+
+
+class EyeEventClassifier:
+    """
+    Streaming I-VT or I-DT classifier.
+
+    Parameters
+    ==========
+    method : str
+        'ivt' or 'idt'.
+    degPerUnit : float
+        Degrees of visual angle per unit of the gaze positions, e.g.
+        `monitorunittools.pix2deg(win.size[1], win.monitor)` for 'height' units.
+    velocity : float
+        I-VT saccade threshold in deg/s.
+    window : float
+        I-VT time in seconds over which the velocity is measured.
+    dispersion : float
+        I-DT fixation threshold in deg.
+    minFixation : float
+        Shortest fixation in seconds, shorter ones are discarded.
+    maxGap : float
+        Longest time in seconds without valid samples (e.g. a blink) that does
+        not end the current event.
+    capacity : int
+        Number of samples in the ring buffer.
+    """
+
+    def __init__(self, method='ivt', degPerUnit=1.0, velocity=30.0, window=0.02, dispersion=1.0,
+                 minFixation=0.06, maxGap=0.075, capacity=256):
+        if method not in ('ivt', 'idt'):
+            raise ValueError(f'Unknown method {method!r}, use ivt or idt')
+        self.method = method
+        self.degPerUnit = degPerUnit
+        self.velocity = velocity
+        self.window = window
+        self.dispersion = dispersion
+        self.minFixation = minFixation
+        self.maxGap = maxGap
+        self.ring = SampleRing(capacity)
+        self._lastValid = None
+        self._current = None
+        self._lastFixation = None
+
+    def feed(self, t, x, y):
+        """
+        Classify new samples.
+
+        Parameters
+        ==========
+        t, x, y : numpy.ndarray
+            Sample times (s) and gaze positions, NaN when no gaze was found.
+
+        Returns
+        ==========
+        list of EyeEvent
+            Events which ended with these samples, in order.
+        """
+        events = []
+        step = self._ivt if self.method == 'ivt' else self._idt
+        for ti, xi, yi in zip(t.tolist(), x.tolist(), y.tolist()):
+            if math.isnan(xi) or math.isnan(yi):
+                continue
+            if self._lastValid is not None and ti - self._lastValid > self.maxGap:
+                # tracking was lost for too long, nothing spans the gap
+                self._close(events)
+                self._lastFixation = None
+                self.ring.clear()
+            self._lastValid = ti
+            step(ti, xi, yi, events)
+        return events
+
+    def flush(self):
+        """
+        End the current event, e.g. at the end of a trial.
+
+        Returns
+        ==========
+        list of EyeEvent
+            The event which was still going on, if it is long enough.
+        """
+        events = []
+        self._close(events)
+        self.ring.clear()
+        self._lastValid = None
+        return events
+
+    def reset(self):
+        """
+        Forget everything, e.g. at the start of a trial, so that no event spans two trials.
+        """
+        self.flush()
+        self._lastFixation = None
+
+    def _distance(self, x0, y0, x1, y1):
+        return math.hypot(x1 - x0, y1 - y0) * self.degPerUnit
+
+    # the current event: [kind, start, end, n, sum x, sum y, x0, y0, x, y, min x, max x, min y, max y]
+    def _open(self, kind, t, x, y, start=None):
+        self._current = [kind, t if start is None else start, t, 1, x, y, x, y, x, y, x, x, y, y]
+
+    def _extend(self, t, x, y):
+        c = self._current
+        c[2] = t
+        c[3] += 1
+        c[4] += x
+        c[5] += y
+        c[8], c[9] = x, y
+        c[10], c[11] = min(c[10], x), max(c[11], x)
+        c[12], c[13] = min(c[12], y), max(c[13], y)
+
+    def _close(self, events):
+        c = self._current
+        self._current = None
+        if c is None:
+            return
+        kind, start, end, n, sx, sy, x0, y0, x1, y1 = c[:10]
+        if kind == 'fixation':
+            if end - start < self.minFixation:
+                return
+            fixation = EyeEvent('fixation', start, end, sx / n, sy / n, self._distance(x0, y0, x1, y1))
+            if self.method == 'idt' and self._lastFixation is not None:
+                # I-DT saccades are the movements between fixations
+                previous = self._lastFixation
+                events.append(EyeEvent('saccade', previous.end, start, fixation.x, fixation.y,
+                                       self._distance(previous.x, previous.y, fixation.x, fixation.y)))
+            self._lastFixation = fixation
+            events.append(fixation)
+        else:
+            events.append(EyeEvent('saccade', start, end, x1, y1, self._distance(x0, y0, x1, y1)))
+
+    def _ivt(self, t, x, y, events):
+        ring = self.ring
+        ring.append(t, x, y)
+        if len(ring) == 1:
+            self._open('fixation', t, x, y)
+            return
+        # only keep the samples of the velocity window
+        while len(ring) > 2 and t - ring[1][0] >= self.window:
+            ring.drop(1)
+        t0, x0, y0 = ring[0]
+        speed = self._distance(x0, y0, x, y) / (t - t0) if t > t0 else 0.0
+        kind = 'saccade' if speed > self.velocity else 'fixation'
+        if self._current is not None and self._current[0] == kind:
+            self._extend(t, x, y)
+            return
+        previous = self._current
+        self._close(events)
+        if kind == 'saccade' and previous is not None:
+            # the saccade starts where the fixation ended
+            self._open(kind, t, previous[8], previous[9], start=previous[2])
+            self._extend(t, x, y)
+        else:
+            self._open(kind, t, x, y)
+
+    def _idt(self, t, x, y, events):
+        ring = self.ring
+        c = self._current
+        if c is not None:
+            spread = (max(c[11], x) - min(c[10], x) + max(c[13], y) - min(c[12], y)) * self.degPerUnit
+            if spread <= self.dispersion:
+                self._extend(t, x, y)
+                return
+            self._close(events)
+            ring.clear()
+        ring.append(t, x, y)
+        window = ring.array()
+        # drop the oldest samples until the window is compact enough
+        while len(window) > 1 and (np.ptp(window[:, 1]) + np.ptp(window[:, 2])) * self.degPerUnit > self.dispersion:
+            ring.drop(1)
+            window = window[1:]
+        if window[-1, 0] - window[0, 0] >= self.minFixation:
+            # a fixation from now on, summarised by running sums
+            self._open('fixation', window[0, 0], window[0, 1], window[0, 2])
+            for ti, xi, yi in window[1:].tolist():
+                self._extend(ti, xi, yi)
+            ring.clear()
@@ -0,0 +1,145 @@
+"""
+Frame timing of the routines, to find out where dropped frames come from.
+
+Each frame of a routine is split in sections (component updates, code
+components, keyboard checks) timed with `lap`, and `flip` records the time
+between two screen flips. At the end of the routine the median, 99th percentile
+and maximum of each, with the number of dropped frames, are added to the data
+file. A warning is logged as soon as a frame goes over its budget.
+
+Instrumentation is opt-in: a disabled `FrameTimer` returns straight away from
+every call.
+"""
+
+import numpy as np
+from psychopy import core, logging
+
+SECTIONS = ('components', 'code', 'keys')
+
+
+class FrameTimer:
+    """
+    Per-frame timer of the routine loops.
+
+    Parameters
+    ==========
+    frameDur : float
+        Expected time in seconds between two flips.
+    enabled : bool
+        Whether to time the frames at all.
+    clock : callable
+        Function returning the time in seconds.
+    dropTolerance : float
+        A flip interval longer than this many `frameDur` counts as dropped frames.
+    """
+
+    def __init__(self, frameDur, enabled=True, clock=core.getTime, dropTolerance=1.5):
+        self.frameDur = frameDur
+        self.enabled = enabled
+        self.clock = clock
+        self.dropTolerance = dropTolerance
+        self.routine = None
+        self._lastFlip = None
+        self._mark = None
+
+    def begin(self, routine):
+        """
+        Start timing the frames of a routine, call before its `while continueRoutine` loop.
+
+        Flip intervals are counted from the first flip of the routine, the gap
+        since the previous routine is not.
+        """
+        if not self.enabled:
+            return
+        self.routine = routine
+        self.frameN = 0
+        self.dropped = 0
+        self.intervals = []
+        self.times = {section: [] for section in SECTIONS}
+        self._frame = dict.fromkeys(SECTIONS, 0.0)
+        self._lastFlip = None
+        self._mark = self.clock()
+
+    def lap(self, section):
+        """
+        Add the time since the last lap (or flip) to a section of the current frame.
+
+        Parameters
+        ==========
+        section : str
+            'components', 'code' or 'keys'.
+        """
+        if not self.enabled:
+            return
+        now = self.clock()
+        self._frame[section] += now - self._mark
+        self._mark = now
+
+    def flip(self):
+        """
+        End the current frame, call straight after `win.flip()`.
+        """
+        if not self.enabled:
+            return
+        now = self.clock()
+        work = 0.0
+        for section in SECTIONS:
+            work += self._frame[section]
+            self.times[section].append(self._frame[section])
+            self._frame[section] = 0.0
+        interval = None
+        if self._lastFlip is not None:
+            interval = now - self._lastFlip
+            self.intervals.append(interval)
+        missed = 0
+        if interval is not None and interval > self.dropTolerance * self.frameDur:
+            missed = round(interval / self.frameDur) - 1
+            self.dropped += missed
+        if missed or work > self.frameDur:
+            logging.warning(
+                f'{self.routine} frame {self.frameN}: {work * 1000:.1f} ms of work for a '
+                f'{self.frameDur * 1000:.1f} ms frame, {missed} frame(s) dropped ('
+                + ', '.join(f'{s} {self.times[s][-1] * 1000:.1f} ms' for s in SECTIONS) + ')')
+        self.frameN += 1
+        self._lastFlip = now
+        self._mark = now
+
+    def summary(self):
+        """
+        Frame statistics of the current routine.
+
+        Returns
+        ==========
+        dict
+            '<routine>.<measure>_p50_ms', '_p99_ms' and '_max_ms' for the flip
+            interval and each section, '<routine>.frames' and '<routine>.dropped_frames'.
+        """
+        summary = {f'{self.routine}.frames': self.frameN,
+                   f'{self.routine}.dropped_frames': self.dropped}
+        measures = dict(self.times, interval=self.intervals)
+        for name, values in measures.items():
+            if not values:
+                continue
+            values = np.asarray(values) * 1000
+            p50, p99 = np.percentile(values, [50, 99])
+            summary[f'{self.routine}.{name}_p50_ms'] = round(float(p50), 3)
+            summary[f'{self.routine}.{name}_p99_ms'] = round(float(p99), 3)
+            summary[f'{self.routine}.{name}_max_ms'] = round(float(values.max()), 3)
+        return summary
+
+    def end(self, thisExp):
+        """
+        Add the frame statistics of the routine to the current row of the data file.
+
+        Parameters
+        ==========
+        thisExp : psychopy.data.ExperimentHandler
+            Handler of the data file.
+        """
+        if not self.enabled or self.routine is None:
+            return
+        for name, value in self.summary().items():
+            thisExp.addData(name, value)
+        if self.dropped:
+            logging.exp(f'{self.routine}: {self.dropped} dropped frame(s) in {self.frameN} frames')
+        self.routine = None
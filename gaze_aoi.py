@@ -0,0 +1,234 @@
+"""
+Offline gaze-in-AOI analysis of Tobii Pro Lab data exports.
+
+Loads the gaze samples of one or more Pro Lab "Data Export" TSV files (a single
+export of the whole project is enough, no need for one export per participant),
+splits them in trials by the presented media and classifies the samples in the
+AOIs of `aoi_coordenates.json` with the grid index of `aoi_index.py`, so images
+can have many rectangle, circle or polygon AOIs. For each trial and AOI it
+reports:
+
+- hits: number of gaze samples in the AOI,
+- dwell_ms: total time the gaze was in the AOI,
+- ttff_ms: time from the stimulus onset to the first fixation in the AOI,
+- revisits: number of times the gaze came back to the AOI after leaving it.
+
+AOIs are in pixels of the stimulus image, with the origin at the top-left
+corner, and the images are shown full screen, so they are compared with the
+gaze point on the screen. Run it with:
+
+    python gaze_aoi.py export.tsv --aois aoi_coordenates.json -o data/aoi_metrics.csv
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from aoi_index import load_aoi_store
+from prolab_media import media_name
+
+# Pro Lab column names, newer versions add the unit, e.g. "Gaze point X [DACS px]"
+COLUMNS = {
+    'recording': 'Recording name',
+    'participant': 'Participant name',
+    'timestamp': 'Recording timestamp',
+    'x': 'Gaze point X',
+    'y': 'Gaze point Y',
+    'media': 'Presented Media name',
+    'movement': 'Eye movement type',
+}
+OPTIONAL = ('participant', 'movement')
+
+
+def load_aois(path='aoi_coordenates.json'):
+    """
+    AOIs of a JSON file like `aoi_coordenates.json`, see `aoi_index.py` for the format.
+
+    Returns
+    ==========
+    dict
+        {media name: aoi_index.AOIIndex} of every image with AOIs.
+    """
+    return load_aoi_store(path)
+
+
+def find_column(header, name):
+    """
+    Column of a Pro Lab export called `name`, with or without a unit.
+    """
+    for column in header:
+        if column == name or column.startswith(name + ' ['):
+            return column
+    return None
+
+
+def load_gaze(path, decimal='.'):
+    """
+    Gaze samples of a Pro Lab data export.
+
+    Parameters
+    ==========
+    path : str
+        Tab separated file exported from Pro Lab.
+    decimal : str
+        Decimal separator used in the export, ',' with some regional settings.
+
+    Returns
+    ==========
+    pandas.DataFrame
+        The columns of `COLUMNS` that are in the export, under their short names.
+    """
+    header = pd.read_csv(path, sep='\t', nrows=0).columns
+    columns = {}
+    for key, name in COLUMNS.items():
+        column = find_column(header, name)
+        if column is None and key not in OPTIONAL:
+            raise ValueError(f'Column {name!r} not found in {path}, add it to the Pro Lab export')
+        if column is not None:
+            columns[column] = key
+    gaze = pd.read_csv(path, sep='\t', usecols=list(columns), decimal=decimal, low_memory=False)
+    return gaze.rename(columns=columns)
+
+
+def aoi_hits(x, y, store, images, shown=None):
+    """
+    Which AOIs each gaze sample falls in.
+
+    Parameters
+    ==========
+    x, y : numpy.ndarray
+        Gaze coordinates of the samples, NaN when no gaze was found.
+    store : dict
+        {media name: AOIIndex} from `load_aois`.
+    images : list of str
+        Media names whose AOIs are tested, in the order of the columns.
+    shown : numpy.ndarray or None
+        Index in `images` of the image shown at each sample, to only test the
+        AOIs of that image; None to test every sample against every AOI.
+
+    Returns
+    ==========
+    numpy.ndarray
+        (samples, AOIs) boolean array, the AOIs of `images` one after the other.
+    """
+    offsets = np.cumsum([0] + [len(store[image]) for image in images])
+    hits = np.zeros((len(x), offsets[-1]), dtype=bool)
+    for i, image in enumerate(images):
+        rows = np.arange(len(x)) if shown is None else np.flatnonzero(shown == i)
+        if len(rows) == 0:
+            continue
+        samples, aois = store[image].classify(x[rows], y[rows])
+        hits[rows[samples], offsets[i] + aois] = True
+    return hits
+
+
+def aoi_metrics(gaze, store, ownOnly=True, timeUnit=0.001, maxGap=100.0):
+    """
+    Hits, dwell time, time to first fixation and revisits per trial and AOI.
+
+    A trial is a run of samples of one recording during which the same media,
+    with AOIs, was presented.
+
+    Parameters
+    ==========
+    gaze : pandas.DataFrame
+        Samples from `load_gaze`, in recording order.
+    store : dict
+        AOIs from `load_aois`.
+    ownOnly : bool
+        Only report the AOIs of the image shown in the trial, not all of them.
+    timeUnit : float
+        Milliseconds per timestamp unit, Pro Lab exports microseconds.
+    maxGap : float
+        Longest time in ms a single sample can count for, e.g. across tracking loss.
+
+    Returns
+    ==========
+    pandas.DataFrame
+        One row per trial and AOI, `aoi_media` is the image the AOI belongs to.
+    """
+    images = list(store)
+    imageIndex = {image: i for i, image in enumerate(images)}
+    names = [name for image in images for name in store[image].names]
+    aoiImage = np.repeat(np.arange(len(images)), [len(store[image]) for image in images])
+    # work on integer codes, there are only a few distinct recordings and media
+    recordingCode, recordings = pd.factorize(gaze['recording'])
+    mediaCode, mediaNames = pd.factorize(gaze['media'])
+    mediaNames = np.array([media_name(m) for m in mediaNames] + [''], dtype=object)
+    shownCode = np.array([imageIndex.get(m, -1) for m in mediaNames])
+    # trials start where the recording or the presented media changes
+    change = np.ones(len(mediaCode), dtype=bool)
+    change[1:] = (recordingCode[1:] != recordingCode[:-1]) | (mediaCode[1:] != mediaCode[:-1])
+    shown = shownCode[mediaCode]  # code -1 (no media) picks the last entry, -1 as well
+    keep = shown >= 0
+    run = np.cumsum(change)[keep]
+    recording = np.asarray(recordings)[recordingCode[keep]]
+    media = mediaNames[mediaCode[keep]]
+    shown = shown[keep]
+    t = gaze['timestamp'].to_numpy(dtype=float)[keep] * timeUnit
+    x = gaze['x'].to_numpy(dtype=float)[keep]
+    y = gaze['y'].to_numpy(dtype=float)[keep]
+    n = len(t)
+    if n == 0:
+        return pd.DataFrame(columns=['recording', 'participant', 'trial', 'media', 'start_ms',
+                                     'aoi', 'aoi_media', 'hits', 'dwell_ms', 'ttff_ms', 'revisits'])
+
+    first = np.ones(n, dtype=bool)
+    first[1:] = run[1:] != run[:-1]
+    starts = np.flatnonzero(first)
+    dt = np.diff(t, append=np.nan)
+    # time each sample stands for, up to the next one
+    dt[np.r_[starts[1:] - 1, n - 1]] = np.nan
+    dt[np.isnan(dt)] = np.nanmedian(dt) if np.any(~np.isnan(dt)) else 0.0
+    dt = np.clip(dt, 0.0, maxGap)
+
+    hits = aoi_hits(x, y, store, images, shown if ownOnly else None)
+    hitCount = np.add.reduceat(hits.astype(np.int64), starts, axis=0)
+    dwell = np.add.reduceat(hits * dt[:, None], starts, axis=0)
+    before = np.zeros_like(hits)
+    before[1:] = hits[:-1]
+    before[starts] = False
+    entries = np.add.reduceat((hits & ~before).astype(np.int64), starts, axis=0)
+    fixated = hits
+    if 'movement' in gaze:
+        fixated = hits & (gaze['movement'].to_numpy()[keep] == 'Fixation')[:, None]
+    firstFixation = np.minimum.reduceat(np.where(fixated, np.arange(n)[:, None], n), starts, axis=0)
+    ttff = np.where(firstFixation < n, t[np.minimum(firstFixation, n - 1)] - t[starts][:, None], np.nan)
+
+    trials = pd.DataFrame({'recording': recording[starts]})
+    if 'participant' in gaze:
+        trials['participant'] = gaze['participant'].to_numpy()[keep][starts]
+    trials['trial'] = trials.groupby('recording').cumcount()
+    trials['media'] = media[starts]
+    trials['start_ms'] = t[starts]
+    trials['shown'] = shown[starts]
+    nTrials, nAois = len(starts), len(names)
+    metrics = trials.loc[np.repeat(np.arange(nTrials), nAois)].reset_index(drop=True)
+    metrics['aoi'] = np.tile(names, nTrials)
+    metrics['aoi_media'] = np.tile(np.array(images, dtype=object)[aoiImage], nTrials)
+    metrics['hits'] = hitCount.ravel()
+    metrics['dwell_ms'] = dwell.ravel()
+    metrics['ttff_ms'] = ttff.ravel()
+    metrics['revisits'] = np.maximum(entries.ravel() - 1, 0)
+    if ownOnly:
+        metrics = metrics[metrics['shown'] == np.tile(aoiImage, nTrials)]
+    return metrics.drop(columns='shown').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('exports', nargs='+', help='Pro Lab data export(s), tab separated')
+    parser.add_argument('--aois', default='aoi_coordenates.json')
+    parser.add_argument('--decimal', default='.', help='decimal separator of the export')
+    parser.add_argument('--all-aois', action='store_true',
+                        help='report every AOI in every trial, not only the one of the image shown')
+    parser.add_argument('-o', '--output', default='aoi_metrics.csv')
+    args = parser.parse_args()
+
+    store = load_aois(args.aois)
+    results = [aoi_metrics(load_gaze(path, args.decimal), store, ownOnly=not args.all_aois)
+               for path in args.exports]
+    metrics = pd.concat(results, ignore_index=True)
+    metrics.to_csv(args.output, index=False)
+    print(f'{len(metrics)} trial/AOI rows written to {args.output}')
@@ -0,0 +1,83 @@
+"""
+Look-ahead image decoding for stimulus sets too large to preload.
+
+While the fixation cross is on screen a worker thread reads and decodes the
+image of the coming trial, so creating its `visual.ImageStim` only has to copy
+the pixels to the GPU instead of reading and decompressing the file as well.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from psychopy import logging
+
+
+def decode_image(path):
+    """
+    Read and decode an image file into memory.
+    """
+    with Image.open(path) as im:
+        im.load()
+        return im.copy()
+
+
+class ImagePrefetcher:
+    """
+    Decode images on a worker thread ahead of when they are needed.
+
+    Parameters
+    ==========
+    depth : int
+        Maximum number of decoded images kept waiting to be used.
+    """
+
+    def __init__(self, depth=2):
+        self.depth = depth
+        self.hits = 0
+        self.misses = 0
+        self._futures = OrderedDict()
+        self._pool = ThreadPoolExecutor(1, thread_name_prefix='ImagePrefetcher')
+
+    def request(self, path):
+        """
+        Start decoding an image in the background, returns immediately.
+        """
+        if path in self._futures:
+            return
+        while len(self._futures) >= self.depth:
+            _, future = self._futures.popitem(last=False)
+            future.cancel()
+        self._futures[path] = self._pool.submit(decode_image, path)
+
+    def take(self, path):
+        """
+        Decoded image for a file, waiting for it if the worker is not done yet.
+
+        Parameters
+        ==========
+        path : str
+            Path of the image file.
+
+        Returns
+        ==========
+        PIL.Image.Image or None
+            Decoded image, or None if it was never requested.
+        """
+        future = self._futures.pop(path, None)
+        if future is None:
+            return None
+        if future.done():
+            self.hits += 1
+        else:
+            # the stimulus is needed now but is still being decoded
+            self.misses += 1
+            logging.warning(f'Prefetch of {path} missed its deadline')
+        return future.result()
+
+    def summary(self):
+        return f'Image prefetch: {self.hits} ready in time, {self.misses} missed their deadline'
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._futures.clear()
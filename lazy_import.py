@@ -0,0 +1,44 @@
+"""
+Modules loaded on first use instead of when the script starts.
+
+The Builder script imports every PsychoPy subsystem before the participant
+dialog is shown, including some this experiment never uses (e.g. `sound`, which
+loads the Psychtoolbox audio library with `audioLib='ptb'`). A module imported
+with `lazy_module` is only executed when one of its attributes is first used:
+
+    sound = lazy_module('psychopy.sound')
+
+Set the environment variable `LAZY_IMPORTS=0` to import everything straight
+away, e.g. to compare the startup times with `profile_imports.py --compare`.
+"""
+
+import importlib.util
+import os
+import sys
+
+
+def lazy_module(name):
+    """
+    A module which is imported when one of its attributes is first used.
+
+    Parameters
+    ==========
+    name : str
+        Full name of the module, e.g. 'psychopy.sound'.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if os.environ.get('LAZY_IMPORTS', '1') == '0':
+        __import__(name)  # unlike importlib.import_module, shows in -X importtime
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    spec.loader.exec_module(module)
+    return module
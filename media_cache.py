@@ -0,0 +1,113 @@
+"""
+Persistent cache of the stimuli already uploaded to Tobii Pro Lab.
+
+Files are identified by the SHA-256 of their content rather than by their name,
+so renaming a stimulus (or using the same image under two names) never causes a
+second upload. The digest of each file is stored with its size and mtime, so
+unchanged files are not hashed again on the next session.
+"""
+
+import hashlib
+import json
+import os
+
+_chunkSize = 1 << 20
+
+
+def file_digest(path):
+    """
+    SHA-256 of the content of a file.
+
+    Parameters
+    ==========
+    path : str
+        File to hash.
+
+    Returns
+    ==========
+    str
+        Hexadecimal digest.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_chunkSize), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class MediaCache:
+    """
+    JSON index mapping file content to Pro Lab media_id, per Pro Lab project.
+
+    Parameters
+    ==========
+    path : str
+        Location of the index, by default `data/media_cache.json`.
+    """
+
+    def __init__(self, path=os.path.join('data', 'media_cache.json')):
+        self.path = path
+        self.files = {}
+        self.projects = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                self.files = index.get('files', {})
+                self.projects = index.get('projects', {})
+            except (OSError, ValueError) as e:
+                # a broken cache only costs a re-hash, never stop the experiment for it
+                print(f'Ignoring unreadable media cache "{path}": {e}')
+
+    def digest(self, path):
+        """
+        Content digest of a stimulus file, only hashing it if it changed on disk.
+
+        Parameters
+        ==========
+        path : str
+            Stimulus file.
+
+        Returns
+        ==========
+        str
+            Hexadecimal SHA-256 of the file.
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.files.get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry['sha256']
+        digest = file_digest(path)
+        self.files[key] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    def get(self, project, digest):
+        """
+        media_id of a file content in a project, or None if it was never uploaded.
+        """
+        return self.projects.get(project, {}).get(digest)
+
+    def remember(self, project, digest, media_id):
+        """
+        Store the media_id Pro Lab gave to a file content in a project.
+        """
+        self.projects.setdefault(project, {})[digest] = media_id
+
+    def forget(self, project, digest):
+        """
+        Drop a media_id which does not exist in the project anymore.
+        """
+        self.projects.get(project, {}).pop(digest, None)
+
+    def save(self):
+        """
+        Write the index to disk, replacing the previous one atomically.
+        """
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmpPath = self.path + '.tmp'
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files, 'projects': self.projects}, f, indent=1)
+        os.replace(tmpPath, self.path)
@@ -0,0 +1,154 @@
+"""
+Background upload of the experiment stimuli to Tobii Pro Lab.
+
+The uploader is started at Begin Experiment and does its work while the
+participant reads the welcome and instruction screens. The trial loop only has
+to wait for it if the uploads are not finished by then.
+
+The files are first hashed and matched against the project, all at the same
+time. The missing ones are then grouped by content, and each content is
+uploaded once, by one worker, so identical files under different names never
+cause two uploads.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MediaUploader:
+    """
+    Resolve and upload a list of stimuli in background threads.
+
+    Parameters
+    ==========
+    manifest : prolab_media.MediaManifest
+        Manifest to fill with the media_ids.
+    files : list
+        Paths of the stimulus files, see `prolab_media.stimulus_files`.
+    workers : int
+        Number of files hashed and uploaded at the same time.
+    media_type : str
+        Pro Lab media type of the files.
+    connect : callable or None
+        Function returning a new `TalkToProLab` connection. Each worker then
+        uploads through its own connection. Leave as None to share the
+        manifest's connection, in which case the uploads themselves (but not
+        the hashing) are done one at a time.
+    """
+
+    def __init__(self, manifest, files, workers=2, media_type='image', connect=None):
+        self.manifest = manifest
+        self.files = list(files)
+        self.workers = max(1, int(workers))
+        self.media_type = media_type
+        self.connect = connect
+        self.completed = 0
+        self.uploaded = 0
+        self.error = None
+        self._thread = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._uploadLock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+
+    def start(self):
+        """
+        Start resolving and uploading the stimuli, returns immediately.
+        """
+        self._thread = threading.Thread(target=self._run, name='MediaUploader', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.manifest.fetch()
+            with ThreadPoolExecutor(self.workers, thread_name_prefix='MediaUploader') as pool:
+                missing = [path for path in pool.map(self._match, self.files) if path is not None]
+                # files with the same content share one upload
+                groups = {}
+                for path in missing:
+                    groups.setdefault(self.manifest.digest(path), []).append(path)
+                for _ in pool.map(self._upload, groups.values()):
+                    pass
+            self.manifest.save()
+        except Exception as e:
+            self.error = e
+            print(f'Uploading media to Tobii Pro Lab failed: {e}')
+        finally:
+            for ttl in self._connections:
+                ttl.disconnect()
+            self._done.set()
+
+    def _match(self, path):
+        # the path if it has to be uploaded, None if it is done
+        if self.manifest.match(path) is None and os.path.isfile(path):
+            self.manifest.digest(path)
+            return path
+        with self._lock:
+            self.completed += 1
+        return None
+
+    def _upload(self, paths):
+        if self.connect is None:
+            with self._uploadLock:
+                media_id = self.manifest.upload(paths[0], self.media_type)
+        else:
+            media_id = self.manifest.upload(paths[0], self.media_type, ttl=self._connection())
+        for path in paths[1:]:
+            self.manifest.share(path, media_id)
+        with self._lock:
+            self.uploaded += 1
+            self.completed += len(paths)
+
+    def _connection(self):
+        # one connection per worker thread, created on first use
+        ttl = getattr(self._local, 'ttl', None)
+        if ttl is None:
+            ttl = self._local.ttl = self.connect()
+            with self._lock:
+                self._connections.append(ttl)
+        return ttl
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def progress(self):
+        """
+        Fraction of the stimuli already resolved, between 0 and 1.
+        """
+        if not self.files:
+            return 1.0
+        return self.completed / len(self.files)
+
+    def status_text(self):
+        """
+        One line description of the upload progress, to show on screen.
+        """
+        if self.error is not None:
+            return f'Media upload failed: {self.error}'
+        if self.done:
+            return f'Media ready ({self.uploaded} uploaded)'
+        return f'Preparing media {self.completed}/{len(self.files)}'
+
+    def wait(self, timeout=None):
+        """
+        Block until all the stimuli are resolved.
+
+        Parameters
+        ==========
+        timeout : float or None
+            Maximum time to wait in seconds, None to wait until done.
+
+        Returns
+        ==========
+        bool
+            True if the uploader has finished.
+        """
+        finished = self._done.wait(timeout)
+        if finished and self.error is not None:
+            raise self.error
+        return finished
@@ -0,0 +1,106 @@
+"""
+Import-time profile of the experiment script.
+
+Loads the script in a fresh Python process with `-X importtime`, without
+running its `__main__` block, so it measures everything done before the
+participant dialog is shown. It reports the time taken by each module the
+script imports (including what that module imports in turn), the time spent
+per package, and the total time to the dialog.
+
+Run it with:
+
+    python profile_imports.py EEG_experimemt_lastrun.py --top 20
+    python profile_imports.py --compare
+
+`--compare` loads the script with and without the modules loaded on first use
+(`lazy_import.py`) and shows the difference.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+# loads the script without running its __main__ block, then prints how long it took
+LOADER = ("import runpy, sys, time; t0 = time.perf_counter(); "
+          "runpy.run_path(sys.argv[1], run_name='profile_imports'); "
+          "print('loaded', time.perf_counter() - t0)")
+
+
+def parse_importtime(text):
+    """
+    Entries of the `-X importtime` report.
+
+    Returns
+    ==========
+    list of (str, int, float, float)
+        Module name, nesting level (0 for the modules imported by the script
+        itself), own time and cumulative time in seconds, in import order.
+    """
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|', 2)
+        # the name is indented by two spaces per level
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((name.strip(), level, int(own) / 1e6, int(cumulative) / 1e6))
+    return entries
+
+
+def profile(script, lazy=True):
+    """
+    Load `script` in a new process and return its import entries and load time.
+    """
+    env = dict(os.environ, LAZY_IMPORTS='1' if lazy else '0')
+    script = os.path.abspath(script)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', LOADER, script],
+                            cwd=os.path.dirname(script), env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Loading {script} failed:\n{result.stderr[-2000:]}')
+    loaded = [line for line in result.stdout.splitlines() if line.startswith('loaded ')]
+    return parse_importtime(result.stderr), float(loaded[-1].split()[1])
+
+
+def report(entries, loaded, top=20):
+    """
+    Text report of the slowest imports and packages.
+    """
+    # modules imported before the script started (by Python itself and runpy)
+    # are included too, they are part of the time to the dialog
+    direct = sorted((e for e in entries if e[1] == 0), key=lambda e: -e[3])
+    packages = defaultdict(float)
+    for name, level, own, cumulative in entries:
+        packages[name.split('.')[0]] += own
+    lines = [f'Time to dialog: {loaded:.3f} s (script), '
+             f'{sum(e[2] for e in entries):.3f} s importing {len(entries)} modules',
+             '', f'{"cumulative (s)":>15}  import']
+    lines += [f'{cumulative:15.3f}  {name}' for name, level, own, cumulative in direct[:top]]
+    lines += ['', f'{"own (s)":>15}  package']
+    lines += [f'{own:15.3f}  {name}' for name, own in sorted(packages.items(), key=lambda p: -p[1])[:top]]
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('script', nargs='?', default='EEG_experimemt_lastrun.py')
+    parser.add_argument('--top', type=int, default=20, help='number of imports and packages listed')
+    parser.add_argument('--repeat', type=int, default=3, help='loads per mode, the fastest is kept')
+    parser.add_argument('--compare', action='store_true',
+                        help='also load the script with every module imported straight away')
+    args = parser.parse_args()
+
+    modes = [True, False] if args.compare else [True]
+    times = {}
+    for lazy in modes:
+        # the first load also warms up the file system cache
+        runs = [profile(args.script, lazy) for _ in range(max(args.repeat, 1))]
+        entries, loaded = min(runs, key=lambda run: run[1])
+        times[lazy] = loaded
+        print(f'--- {"lazy" if lazy else "eager"} imports ---')
+        print(report(entries, loaded, args.top))
+        print()
+    if args.compare:
+        print(f'Time to dialog: {times[True]:.3f} s lazy, {times[False]:.3f} s eager, '
+              f'{times[False] - times[True]:.3f} s saved')
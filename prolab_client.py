@@ -0,0 +1,317 @@
+"""
+Persistent asyncio client for the Tobii Pro Lab websocket API.
+
+Grown from `connection_debuging.py`. One connection is kept open per Pro Lab
+endpoint (project, clock and external presenter) and requests are pipelined:
+several requests can be sent before the first response arrives. Pro Lab
+answers the requests of a connection in the order they were sent, so each
+response is matched with the oldest request still waiting on that connection.
+
+`ProLabClient` wraps the asyncio client in a background event loop, for use
+from Builder code components, which are synchronous.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+
+import websockets
+
+ENDPOINTS = {
+    'project': '/project',
+    'clock': '/clock',
+    'externalpresenter': '/record/externalpresenter',
+}
+
+
+class ProLabError(Exception):
+    """
+    Pro Lab answered a request with a non-zero status code.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        super().__init__(f"{response.get('operation')} failed with status "
+                         f"{response.get('status_code')}: {response.get('reason', '')}")
+
+
+class ProLabConnection:
+    """
+    Persistent websocket connection to one Pro Lab endpoint.
+
+    Parameters
+    ==========
+    uri : str
+        Websocket address of the endpoint.
+    reconnectAttempts : int
+        Number of times to try to (re)connect before a request fails.
+    reconnectDelay : float
+        Time in seconds before the first reconnection attempt, doubled after
+        every failed attempt.
+    """
+
+    def __init__(self, uri, reconnectAttempts=5, reconnectDelay=0.2):
+        self.uri = uri
+        self.reconnectAttempts = reconnectAttempts
+        self.reconnectDelay = reconnectDelay
+        self.websocket = None
+        self._pending = deque()
+        self._reader = None
+        self._sendLock = None
+
+    @property
+    def connected(self):
+        return self.websocket is not None
+
+    async def connect(self):
+        """
+        Open the connection, retrying with exponential backoff.
+        """
+        delay = self.reconnectDelay
+        for attempt in range(self.reconnectAttempts):
+            try:
+                self.websocket = await websockets.connect(self.uri, max_size=None)
+                break
+            except OSError:
+                if attempt == self.reconnectAttempts - 1:
+                    raise
+                await asyncio.sleep(delay)
+                delay *= 2
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        websocket = self.websocket
+        try:
+            async for raw in websocket:
+                if not self._pending:
+                    print(f'Unexpected message from {self.uri}: {raw}')
+                    continue
+                operation, future = self._pending.popleft()
+                response = json.loads(raw)
+                if future.done():
+                    continue
+                if response.get('status_code', 0) != 0:
+                    future.set_exception(ProLabError(response))
+                else:
+                    future.set_result(response)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            # the next request reconnects, the ones in flight are lost
+            if self.websocket is websocket:
+                self.websocket = None
+            while self._pending:
+                operation, future = self._pending.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError(f'Connection to {self.uri} closed during {operation}'))
+
+    async def request(self, message):
+        """
+        Send a request and wait for its response, other requests can be sent meanwhile.
+
+        Parameters
+        ==========
+        message : dict
+            Request, with at least an "operation" key.
+
+        Returns
+        ==========
+        dict
+            Response from Pro Lab.
+        """
+        if self._sendLock is None:
+            self._sendLock = asyncio.Lock()
+        future = asyncio.get_running_loop().create_future()
+        async with self._sendLock:
+            if not self.connected:
+                await self.connect()
+            # register before sending, the answer can arrive before send() returns
+            self._pending.append((message.get('operation'), future))
+            await self.websocket.send(json.dumps(message))
+        return await future
+
+    async def upload(self, message, data, chunkSize=64000):
+        """
+        Send a request followed by binary data, the way UploadMedia works.
+
+        Pro Lab answers the request with an acknowledgement, then the data is
+        sent in chunks and Pro Lab answers again once it has all of it. No
+        other request is sent on the connection in the meantime.
+
+        Parameters
+        ==========
+        message : dict
+            Request, with at least an "operation" key.
+        data : bytes
+            Data sent once the request is acknowledged.
+        chunkSize : int
+            Size in bytes of the binary messages.
+
+        Returns
+        ==========
+        dict
+            Second response from Pro Lab.
+        """
+        if self._sendLock is None:
+            self._sendLock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        ack, done = loop.create_future(), loop.create_future()
+        operation = message.get('operation')
+        async with self._sendLock:
+            if not self.connected:
+                await self.connect()
+            self._pending.append((operation, ack))
+            self._pending.append((operation, done))
+            await self.websocket.send(json.dumps(message))
+            try:
+                await ack
+            except Exception:
+                # a rejected request gets no second response
+                if (operation, done) in self._pending:
+                    self._pending.remove((operation, done))
+                elif done.done():
+                    done.exception()  # closed connection, already reported by the ack
+                raise
+            for i in range(0, len(data), chunkSize):
+                await self.websocket.send(data[i:i + chunkSize])
+        return await done
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+        if self._reader is not None:
+            await self._reader
+
+
+class AsyncProLabClient:
+    """
+    Pro Lab API over persistent, pipelined connections.
+
+    Parameters
+    ==========
+    host : str
+        Computer running Pro Lab.
+    port : int
+        Port of the Pro Lab websocket server.
+    client_id : str
+        Name this client is known by in Pro Lab.
+    """
+
+    def __init__(self, host='localhost', port=8080, client_id='PsychoPy'):
+        self.connections = {
+            name: ProLabConnection(f'ws://{host}:{port}{path}?client_id={client_id}')
+            for name, path in ENDPOINTS.items()
+        }
+
+    async def request(self, endpoint, message):
+        return await self.connections[endpoint].request(message)
+
+    async def list_media(self):
+        return await self.request('project', {'operation': 'ListMedia'})
+
+    async def list_participants(self):
+        return await self.request('project', {'operation': 'ListParticipants'})
+
+    async def upload_media(self, path, media_type='image'):
+        # same request as TalkToProLab.upload_media, Pro Lab lists the media without the extension
+        with open(path, 'rb') as f:
+            data = f.read()
+        ext = os.path.splitext(path)[1][1:].lower()
+        return await self.connections['project'].upload({
+            'operation': 'UploadMedia',
+            'media_name': os.path.basename(path),
+            'media_size': str(len(data)),
+            'mime_type': f"{media_type}/{'jpeg' if ext == 'jpg' else ext}",
+        }, data)
+
+    async def get_time_stamp(self):
+        return await self.request('clock', {'operation': 'GetTimestamp'})
+
+    async def send_stimulus_event(self, recording_id, start_timestamp, media_id,
+                                  media_position=None, end_timestamp=None, background=None):
+        message = {'operation': 'SendStimulusEvent', 'recording_id': recording_id,
+                   'start_timestamp': str(start_timestamp), 'media_id': media_id}
+        if media_position is not None:
+            message['media_position'] = media_position
+        if end_timestamp is not None:
+            message['end_timestamp'] = str(end_timestamp)
+        if background is not None:
+            message['background'] = background
+        return await self.request('externalpresenter', message)
+
+    async def send_custom_event(self, recording_id, timestamp, event_type, value=None):
+        message = {'operation': 'SendCustomEvent', 'recording_id': recording_id,
+                   'timestamp': str(timestamp), 'event_type': event_type}
+        if value is not None:
+            message['value'] = value
+        return await self.request('externalpresenter', message)
+
+    async def close(self):
+        for connection in self.connections.values():
+            await connection.close()
+
+
+class ProLabClient:
+    """
+    Synchronous facade of `AsyncProLabClient`, for Builder code.
+
+    The asyncio client runs in its own thread. `submit` returns immediately with
+    a `concurrent.futures.Future`, so many requests can be in flight at once;
+    the other methods wait for the response like `TalkToProLab` does.
+
+    Parameters
+    ==========
+    timeout : float or None
+        Maximum time in seconds to wait for a response.
+    **kwargs
+        Passed to `AsyncProLabClient`.
+    """
+
+    def __init__(self, timeout=10.0, **kwargs):
+        self.timeout = timeout
+        self.client = AsyncProLabClient(**kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='ProLabClient', daemon=True)
+        self._thread.start()
+
+    def _submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def submit(self, endpoint, message):
+        """
+        Send a request without waiting for its response.
+
+        Returns
+        ==========
+        concurrent.futures.Future
+            Resolves to the response from Pro Lab.
+        """
+        return self._submit(self.client.request(endpoint, message))
+
+    def request(self, endpoint, message):
+        return self.submit(endpoint, message).result(self.timeout)
+
+    def list_media(self):
+        return self._submit(self.client.list_media()).result(self.timeout)
+
+    def list_participants(self):
+        return self._submit(self.client.list_participants()).result(self.timeout)
+
+    def upload_media(self, path, media_type='image'):
+        return self._submit(self.client.upload_media(path, media_type)).result(self.timeout)
+
+    def get_time_stamp(self):
+        return self._submit(self.client.get_time_stamp()).result(self.timeout)
+
+    def send_stimulus_event(self, *args, **kwargs):
+        return self._submit(self.client.send_stimulus_event(*args, **kwargs)).result(self.timeout)
+
+    def send_custom_event(self, *args, **kwargs):
+        return self._submit(self.client.send_custom_event(*args, **kwargs)).result(self.timeout)
+
+    def disconnect(self):
+        self._submit(self.client.close()).result(self.timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
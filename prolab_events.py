@@ -0,0 +1,167 @@
+"""
+Deferred sending of events to the Tobii Pro Lab recording.
+
+Stimulus and custom events are put in a queue by the experiment and sent to the
+external presenter by a background thread, so the trial loop never waits on the
+network. Call `drain` before stopping the recording so that no event is lost.
+
+An event Pro Lab keeps rejecting is dropped after `maxAttempts` tries so it
+does not hold back the ones queued after it, and `drain` gives up after its
+timeout; both are reported with the events concerned.
+"""
+
+import threading
+from collections import deque
+
+
+class ProLabEventQueue:
+    """
+    Queue of events sent to a Pro Lab recording from a background thread.
+
+    Only the external presenter websocket of the connection is used, so the
+    experiment must not send messages to it itself until the queue is drained.
+
+    Parameters
+    ==========
+    ttl : titta.TalkToProLab.TalkToProLab
+        Connection to Pro Lab.
+    recording_id : str
+        ID of the recording the events belong to.
+    batchSize : int
+        Maximum number of events sent each time the thread wakes up.
+    retryDelay : float
+        Time in seconds to wait after a failed send, doubled on every failure
+        in a row up to `maxRetryDelay`.
+    maxRetryDelay : float
+        Longest time in seconds to wait between two attempts.
+    maxAttempts : int
+        Number of times an event is sent before it is dropped.
+    """
+
+    def __init__(self, ttl, recording_id, batchSize=32, retryDelay=0.1, maxRetryDelay=2.0, maxAttempts=5):
+        self.ttl = ttl
+        self.recording_id = recording_id
+        self.batchSize = batchSize
+        self.retryDelay = retryDelay
+        self.maxRetryDelay = maxRetryDelay
+        self.maxAttempts = maxAttempts
+        self.sent = 0
+        self.failures = 0
+        self.dropped = []
+        self._queue = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._closing = False
+        self._thread = None
+
+    def start(self):
+        """
+        Start the sending thread, returns immediately.
+        """
+        self._thread = threading.Thread(target=self._run, name='ProLabEventQueue', daemon=True)
+        self._thread.start()
+        return self
+
+    def stimulus_event(self, start_timestamp, media_id, end_timestamp=None, **kwargs):
+        """
+        Queue a stimulus event, see `TalkToProLab.send_stimulus_event`.
+        """
+        self._put((self.ttl.send_stimulus_event,
+                   (self.recording_id, str(start_timestamp), media_id),
+                   dict(kwargs, end_timestamp=None if end_timestamp is None else str(end_timestamp))))
+
+    def custom_event(self, timestamp, event_type, value=''):
+        """
+        Queue a custom event, see `TalkToProLab.send_custom_event`.
+
+        `value` must be text, TalkToProLab cleans it up with `re.sub`.
+        """
+        self._put((self.ttl.send_custom_event,
+                   (self.recording_id, str(timestamp), event_type),
+                   dict(value=value)))
+
+    def _put(self, event):
+        self._queue.append(event)
+        self._wake.set()
+
+    @property
+    def pending(self):
+        return len(self._queue)
+
+    @staticmethod
+    def describe(event):
+        """
+        One line description of a queued event, e.g. for the log.
+        """
+        send, args, kwargs = event
+        # the recording_id is the same for every event
+        return f'{send.__name__}({", ".join(repr(a) for a in args[1:])})'
+
+    def _run(self):
+        delay = self.retryDelay
+        attempts = 0
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            while self._queue and not self._stop.is_set():
+                for _ in range(min(self.batchSize, len(self._queue))):
+                    if self._stop.is_set():
+                        return
+                    event = self._queue[0]
+                    send, args, kwargs = event
+                    try:
+                        send(*args, **kwargs)
+                    except Exception as e:
+                        self.failures += 1
+                        attempts += 1
+                        if attempts >= self.maxAttempts:
+                            # rejected every time, let the events behind it through
+                            self._queue.popleft()
+                            self.dropped.append(event)
+                            print(f'Dropped event {self.describe(event)} after {attempts} failed attempts: {e}')
+                            attempts = 0
+                            delay = self.retryDelay
+                            continue
+                        # leave the event at the front of the queue and try again later
+                        print(f'Sending event to Pro Lab failed, retrying in {delay:.2f} s: {e}')
+                        self._stop.wait(delay)
+                        delay = min(delay * 2, self.maxRetryDelay)
+                        break
+                    self._queue.popleft()
+                    self.sent += 1
+                    attempts = 0
+                    delay = self.retryDelay
+            if self._closing:
+                return
+
+    def drain(self, timeout=10.0):
+        """
+        Send all the queued events and stop the thread.
+
+        If they are not all sent within the timeout, the thread is stopped
+        anyway, after the send it may be waiting on.
+
+        Parameters
+        ==========
+        timeout : float or None
+            Maximum time in seconds to wait for the events to be sent.
+
+        Returns
+        ==========
+        list of str
+            Descriptions of the events which were not sent, dropped ones first.
+        """
+        self._closing = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                self._stop.set()
+                self._wake.set()
+                # a send cannot be interrupted, give it the time of one more attempt
+                self._thread.join(self.maxRetryDelay)
+        unsent = [self.describe(event) for event in self.dropped]
+        if self._queue:
+            print(f'{len(self._queue)} events could not be sent to Pro Lab in {timeout} s')
+            unsent += [self.describe(event) for event in list(self._queue)]
+        return unsent
@@ -0,0 +1,218 @@
+"""
+Session-level media manifest for Tobii Pro Lab.
+
+All the stimuli used by the experiment are resolved against the Pro Lab
+project once, at Begin Experiment, so the trial loop only has to look up the
+media_id of the image it is about to show.
+"""
+
+import os
+import threading
+
+from media_cache import file_digest
+
+
+def media_name(path):
+    """
+    Name Pro Lab gives to an uploaded file (file name without extension).
+
+    Parameters
+    ==========
+    path : str
+        Path of the stimulus file, as written in the conditions file.
+
+    Returns
+    ==========
+    str
+        Media name as listed by `ListMedia`.
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def stimulus_files(conditions, column='images', extra=()):
+    """
+    Unique stimulus files referenced by a conditions list, in order of appearance.
+
+    Parameters
+    ==========
+    conditions : list of dict
+        Conditions as returned by `data.importConditions`.
+    column : str
+        Name of the column holding the image paths.
+    extra : list, tuple
+        Any other files shown outside the loop (e.g. the fixation cross).
+
+    Returns
+    ==========
+    list
+        Paths of all the stimulus files, without duplicates.
+    """
+    files = []
+    for path in [row[column] for row in conditions] + list(extra):
+        if path and path not in files:
+            files.append(path)
+    return files
+
+
+class MediaManifest:
+    """
+    Map from stimulus file to Pro Lab media_id for the current project.
+
+    Parameters
+    ==========
+    ttl : titta.TalkToProLab.TalkToProLab
+        Connection to Pro Lab.
+    cache : media_cache.MediaCache or None
+        Index of the media uploaded in previous sessions. When given, files are
+        matched by content instead of by name.
+    project : str or None
+        ID of the Pro Lab project the media belong to, used as key in the cache.
+    """
+
+    def __init__(self, ttl, cache=None, project=None):
+        self.ttl = ttl
+        self.cache = cache
+        self.project = project
+        self.mediaIds = {}
+        self.prolabMedia = None
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        """
+        Get the list of media in the Pro Lab project.
+
+        This is the only place where Pro Lab is asked about media, with a single
+        `ListMedia` request for the whole session.
+        """
+        print('Searching media in Tobii Pro Lab')
+        self.prolabMedia = {m['media_name']: m['media_id']
+                            for m in self.ttl.list_media()['media_list']}
+
+    def match(self, path):
+        """
+        Find a stimulus file among the media already in the project.
+
+        Parameters
+        ==========
+        path : str
+            Stimulus file.
+
+        Returns
+        ==========
+        str or None
+            media_id of the file, or None if it has to be uploaded (or does not exist).
+        """
+        if path in self.mediaIds:
+            return self.mediaIds[path]
+        if not os.path.isfile(path):
+            print(f'Media "{path}" not found on disk, it will have no media_id')
+            return None
+        media_id = None
+        if self.cache is not None:
+            digest = self.digest(path)
+            cached_id = self.cache.get(self.project, digest)
+            if cached_id in self.prolabMedia.values():
+                # same content was uploaded before, possibly under another name
+                media_id = cached_id
+            elif cached_id is not None:
+                # media was deleted from the project since last session
+                self.cache.forget(self.project, digest)
+        if media_id is None:
+            media_id = self.prolabMedia.get(media_name(path))
+        if media_id is not None:
+            self._record(path, media_id)
+        return media_id
+
+    def digest(self, path):
+        """
+        Content digest of a stimulus file, from the cache when there is one.
+        """
+        with self._lock:
+            if path in self._digests:
+                return self._digests[path]
+        digest = self.cache.digest(path) if self.cache is not None else file_digest(path)
+        with self._lock:
+            self._digests[path] = digest
+        return digest
+
+    def share(self, path, media_id):
+        """
+        Give a file the media_id of a file with the same content.
+        """
+        self._record(path, media_id)
+
+    def upload(self, path, media_type='image', ttl=None):
+        """
+        Upload a stimulus file to the project.
+
+        Parameters
+        ==========
+        path : str
+            Stimulus file.
+        media_type : str
+            Pro Lab media type of the file.
+        ttl : titta.TalkToProLab.TalkToProLab or None
+            Connection to upload through, leave as None to use the manifest's one.
+
+        Returns
+        ==========
+        str
+            media_id given by Pro Lab.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        print(f'Media "{path}" not found, uploading to Tobii Pro Lab')
+        upload_response = ttl.upload_media(path, media_type)
+        media_id = upload_response['media_id']
+        self._record(path, media_id)
+        return media_id
+
+    def _record(self, path, media_id):
+        with self._lock:
+            self.mediaIds[path] = media_id
+            self.prolabMedia.setdefault(media_name(path), media_id)
+            if path in self._digests and self.cache is not None:
+                self.cache.remember(self.project, self._digests[path], media_id)
+
+    def save(self):
+        """
+        Store the media_ids of this session in the cache, if there is one.
+        """
+        if self.cache is not None:
+            with self._lock:
+                self.cache.save()
+
+    def resolve(self, files, media_type='image'):
+        """
+        Find every file in the Pro Lab project, uploading the ones that are missing.
+
+        See `media_uploader.MediaUploader` to do this in the background instead.
+
+        Parameters
+        ==========
+        files : list
+            Paths of the stimulus files.
+        media_type : str
+            Pro Lab media type of the files.
+
+        Returns
+        ==========
+        dict
+            Map from file path to media_id.
+        """
+        self.fetch()
+        for path in files:
+            if self.match(path) is None and os.path.isfile(path):
+                self.upload(path, media_type)
+        self.save()
+        return self.mediaIds
+
+    def __getitem__(self, path):
+        return self.mediaIds.get(path)
+
+    def __contains__(self, path):
+        return path in self.mediaIds
+
+    def __len__(self):
+        return len(self.mediaIds)
@@ -0,0 +1,226 @@
+"""
+Stand-in for the Tobii Pro Lab websocket API, to test without a licensed machine.
+
+Serves the project, clock and external presenter endpoints on the same address
+as Pro Lab (ws://localhost:8080), so `connection_debuging.py`, `prolab_client`
+and Titta's `TalkToProLab` can connect to it. Responses can be delayed and
+made to fail to measure how the experiment copes with a slow or flaky Pro Lab.
+
+Media are uploaded like in Pro Lab: the client sends the UploadMedia request
+(`media_name` with its extension, `media_size` as a string, `mime_type`),
+waits for an acknowledgement, sends the file in binary chunks and gets the
+media_id in a second response once all `media_size` bytes have arrived.
+
+Run it with:
+
+    python prolab_mock.py --latency 0.005 --failure-rate 0.01
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from urllib.parse import urlparse
+
+import websockets
+
+ERROR_STATUS = 101  # status code of the injected failures
+
+
+class MockProLab:
+    """
+    In-memory Pro Lab project answering the websocket API.
+
+    Parameters
+    ==========
+    latency : float
+        Network delay in seconds added to every response. Delays of pipelined
+        requests overlap, like on a real network.
+    jitter : float
+        Maximum random extra delay in seconds.
+    processing : float
+        Time in seconds Pro Lab takes to handle a request, requests on the same
+        connection are handled one at a time.
+    failureRate : float
+        Probability that a request is answered with an error status.
+    seed : int or None
+        Seed of the random latency and failures.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, processing=0.0, failureRate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.processing = processing
+        self.failureRate = failureRate
+        self.random = random.Random(seed)
+        self.media = {}
+        self.participants = {}
+        self.recordings = {}
+        self.state = 'ready'
+        self.requests = 0
+        self.failures = 0
+
+    # --- operations, by endpoint ---
+
+    def project(self, message, payload):
+        operation = message['operation']
+        if operation == 'GetProjectInfo':
+            return {'project_id': 'mock-project', 'project_name': 'Mock project'}
+        if operation == 'ListMedia':
+            return {'media_list': list(self.media.values())}
+        if operation == 'ListParticipants':
+            return {'participant_list': list(self.participants.values())}
+        if operation == 'AddParticipant':
+            participant = {'participant_id': str(uuid.uuid4()),
+                           'participant_name': message['participant_name']}
+            self.participants[participant['participant_id']] = participant
+            return participant
+        if operation == 'UploadMedia':
+            if payload is None or len(payload) != int(message['media_size']):
+                return None
+            # listed without the extension
+            media = {'media_id': str(uuid.uuid4()), 'media_name': os.path.splitext(message['media_name'])[0],
+                     'md5': hashlib.md5(payload).hexdigest()}
+            self.media[media['media_id']] = media
+            return {'media_id': media['media_id']}
+        return None
+
+    def upload_request(self, message, payload):
+        # acknowledgement of an UploadMedia request, before the file is sent
+        try:
+            size = int(message['media_size'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        kind, _, subtype = message.get('mime_type', '').partition('/')
+        if size < 0 or not message.get('media_name') or not kind or not subtype:
+            return None
+        return {}
+
+    def clock(self, message, payload):
+        if message['operation'] in ('GetTimestamp', 'GetTimeStamp'):
+            return {'timestamp': str(int(time.perf_counter() * 1e6))}
+        return None
+
+    def externalpresenter(self, message, payload):
+        operation = message['operation']
+        if operation == 'GetState':
+            return {'state': self.state}
+        if operation == 'StartRecording':
+            recording_id = str(uuid.uuid4())
+            self.recordings[recording_id] = {'events': [], 'state': 'recording'}
+            self.state = 'recording'
+            return {'recording_id': recording_id}
+        if operation == 'StopRecording':
+            self.state = 'ready'
+            return {}
+        if operation == 'FinalizeRecording':
+            recording = self.recordings.get(message.get('recording_id'))
+            if recording is None:
+                return None
+            recording['state'] = 'finalized'
+            return {}
+        if operation in ('SendStimulusEvent', 'SendCustomEvent'):
+            recording = self.recordings.get(message.get('recording_id'))
+            if recording is None:
+                return None
+            recording['events'].append(message)
+            return {}
+        return None
+
+    # --- websocket server ---
+
+    async def handler(self, websocket, path=None):
+        if path is None:
+            path = getattr(websocket, 'path', None) or websocket.request.path
+        endpoint = urlparse(path).path.rstrip('/').split('/')[-1]
+        if endpoint not in ('project', 'clock', 'externalpresenter'):
+            await websocket.close(reason=f'Unknown endpoint {path}')
+            return
+        operations = getattr(self, endpoint)
+        handled = asyncio.Lock()
+        previous = None
+        try:
+            async for raw in websocket:
+                if isinstance(raw, bytes):
+                    continue
+                message = json.loads(raw)
+                payload = None
+                if message.get('operation') == 'UploadMedia':
+                    # the client only sends the file once the request is acknowledged
+                    ack = await self._respond(websocket, self.upload_request, message, None, handled, previous)
+                    previous = None
+                    if ack['status_code'] != 0:
+                        continue
+                    payload = bytearray()
+                    while len(payload) < int(message['media_size']):
+                        chunk = await websocket.recv()
+                        if not isinstance(chunk, bytes):
+                            break
+                        payload += chunk
+                    payload = bytes(payload)
+                previous = asyncio.ensure_future(
+                    self._respond(websocket, operations, message, payload, handled, previous))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _respond(self, websocket, operations, message, payload, handled, previous):
+        self.requests += 1
+        # processing is serial, network latency overlaps between requests
+        async with handled:
+            await asyncio.sleep(self.processing)
+            if self.random.random() < self.failureRate:
+                self.failures += 1
+                response = {'status_code': ERROR_STATUS, 'reason': 'Injected failure'}
+            else:
+                response = operations(message, payload)
+                if response is None:
+                    response = {'status_code': ERROR_STATUS, 'reason': 'Unsupported or invalid request'}
+                else:
+                    response = dict(response, status_code=0)
+        await asyncio.sleep(self.latency + self.random.random() * self.jitter)
+        if previous is not None:
+            # keep the responses in the order of the requests
+            await previous
+        response['operation'] = message['operation']
+        try:
+            await websocket.send(json.dumps(response))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        return response
+
+    async def serve(self, host='localhost', port=8080, ready=None):
+        """
+        Serve until cancelled.
+
+        Parameters
+        ==========
+        ready : threading.Event or None
+            Set once the server is listening.
+        """
+        async with websockets.serve(self.handler, host, port, max_size=None):
+            if ready is not None:
+                ready.set()
+            await asyncio.Future()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='network delay of each response (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum random extra delay (s)')
+    parser.add_argument('--processing', type=float, default=0.0, help='time to handle each request (s)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='probability of an error response')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    mock = MockProLab(latency=args.latency, jitter=args.jitter, processing=args.processing,
+                      failureRate=args.failure_rate, seed=args.seed)
+    print(f'Mock Pro Lab listening on ws://{args.host}:{args.port}')
+    try:
+        asyncio.run(mock.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
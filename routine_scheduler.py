@@ -0,0 +1,199 @@
+"""
+Event-driven start and stop of the components of a routine.
+
+The Builder frame loop checks the start and stop condition of every component
+on every frame, then scans all the components to see whether any of them is
+still running. `RoutineScheduler` keeps the components waiting to start and
+those waiting to stop in two heaps ordered by time, and counts the unfinished
+ones, so a frame only costs a look at the top of each heap plus the components
+which actually start or stop on it. Routines with many components (e.g. one
+per AOI) cost the same per frame as routines with one.
+
+A component's stop time is its `tStartRefresh` plus its duration, and
+`win.timeOnFlip` only sets `tStartRefresh` to the real time of the flip after
+the frame it started on. The stop is therefore put in the heap on the next
+frame, with the corrected start time, and only checked on the start frame
+itself with the predicted one, as the Builder code does.
+
+    trialScheduler = RoutineScheduler(win, thisExp, frameTolerance)
+    trialScheduler.add(image, start=0.0, duration=2.0)
+    trialScheduler.begin()
+    while continueRoutine:
+        ...
+        trialScheduler.update(t, tThisFlip, tThisFlipGlobal, frameN)
+        ...
+        continueRoutine = not trialScheduler.finished
+    trialScheduler.end()
+"""
+
+import heapq
+
+from psychopy.constants import NOT_STARTED, STARTED, FINISHED
+
+
+class RoutineScheduler:
+    """
+    Start and stop times of the components of one routine.
+
+    Parameters
+    ==========
+    win : psychopy.visual.Window
+        Window the start and stop times are taken from.
+    thisExp : psychopy.data.ExperimentHandler
+        Handler the `.started` and `.stopped` timestamps are added to.
+    frameTolerance : float
+        How close to its start or stop time a component is started or stopped (s).
+    """
+
+    def __init__(self, win, thisExp, frameTolerance=0.001):
+        self.win = win
+        self.thisExp = thisExp
+        self.frameTolerance = frameTolerance
+        self.components = []
+        self.started = []
+        self.unfinished = 0
+        self._starts = ([], [])
+        self._stops = []
+        self._startedLastFrame = []
+
+    def add(self, component, start=0.0, duration=None, onFlip=True, draw=None):
+        """
+        Add a component to the routine.
+
+        Parameters
+        ==========
+        component : object
+            A Builder component, with `name` and `status` attributes.
+        start : float or None
+            Start time in seconds from the start of the routine, None if it
+            never starts by itself.
+        duration : float or None
+            Time in seconds from its start to its stop, None if it runs until
+            the end of the routine.
+        onFlip : bool
+            Whether the component starts with the next flip (a stimulus or a
+            keyboard), or straight away (e.g. an eye tracker control). In the
+            second case the timestamps are the routine time of the frame.
+        draw : bool or None
+            Whether it is drawn while it runs, None for any component with
+            `setAutoDraw`.
+        """
+        if draw is None:
+            draw = hasattr(component, 'setAutoDraw')
+        self.components.append((component, start, duration, onFlip, draw))
+        return self
+
+    def begin(self):
+        """
+        Reset the components, at the start of every repeat of the routine.
+        """
+        self._starts = ([], [])
+        self._stops = []
+        self._startedLastFrame = []
+        self.started = []
+        self.unfinished = 0
+        for i, (component, start, duration, onFlip, draw) in enumerate(self.components):
+            component.tStart = None
+            component.tStop = None
+            component.tStartRefresh = None
+            component.tStopRefresh = None
+            if hasattr(component, 'status'):
+                component.status = NOT_STARTED
+                self.unfinished += 1
+            if start is not None:
+                # flip-locked components start on the time of the next flip, the others on the time now
+                self._starts[onFlip].append((start, i))
+        for starts in self._starts:
+            heapq.heapify(starts)
+        return self
+
+    @property
+    def finished(self):
+        """
+        Whether every component has finished.
+        """
+        return self.unfinished == 0
+
+    def isStarting(self, component):
+        """
+        Whether a component started on this frame.
+        """
+        return any(c is component for c in self.started)
+
+    def update(self, t, tThisFlip, tThisFlipGlobal, frameN):
+        """
+        Start and stop the components due on this frame, once per frame.
+
+        Parameters
+        ==========
+        t : float
+            Routine time now.
+        tThisFlip : float
+            Routine time of the next flip.
+        tThisFlipGlobal : float
+            Global time of the next flip.
+        frameN : int
+            Frame number in the routine.
+        """
+        stops = self._stops
+        # the flip since the last frame has corrected tStartRefresh of the components started on it
+        for i in self._startedLastFrame:
+            component, start, duration, onFlip, draw = self.components[i]
+            if component.status == STARTED:
+                heapq.heappush(stops, (component.tStartRefresh + duration, i))
+        self._startedLastFrame = []
+        self.started = []
+        for onFlip, now in ((False, t), (True, tThisFlip)):
+            starts = self._starts[onFlip]
+            while starts and now >= starts[0][0] - self.frameTolerance:
+                self._start(heapq.heappop(starts)[1], t, tThisFlipGlobal, frameN)
+        while stops and tThisFlipGlobal > stops[0][0] - self.frameTolerance:
+            self._stop(heapq.heappop(stops)[1], t, tThisFlipGlobal, frameN)
+
+    def _start(self, i, t, tThisFlipGlobal, frameN):
+        component, start, duration, onFlip, draw = self.components[i]
+        # keep track of start time/frame for later
+        component.frameNStart = frameN  # exact frame index
+        component.tStart = t  # local t and not account for scr refresh
+        component.tStartRefresh = tThisFlipGlobal  # on global time
+        self.win.timeOnFlip(component, 'tStartRefresh')  # time at next scr refresh
+        # add timestamp to datafile
+        if onFlip:
+            self.thisExp.timestampOnFlip(self.win, f'{component.name}.started')
+        else:
+            self.thisExp.addData(f'{component.name}.started', t)
+        component.status = STARTED
+        if draw:
+            component.setAutoDraw(True)
+        self.started.append(component)
+        if duration is None:
+            return
+        if tThisFlipGlobal > tThisFlipGlobal + duration - self.frameTolerance:
+            # stops on the frame it starts, e.g. a duration of 0
+            self._stop(i, t, tThisFlipGlobal, frameN)
+        else:
+            self._startedLastFrame.append(i)
+
+    def _stop(self, i, t, tThisFlipGlobal, frameN):
+        component, start, duration, onFlip, draw = self.components[i]
+        # keep track of stop time/frame for later
+        component.tStop = t  # not accounting for scr refresh
+        component.tStopRefresh = tThisFlipGlobal  # on global time
+        component.frameNStop = frameN  # exact frame index
+        # add timestamp to datafile
+        if onFlip:
+            self.thisExp.timestampOnFlip(self.win, f'{component.name}.stopped')
+        else:
+            self.thisExp.addData(f'{component.name}.stopped', t)
+        component.status = FINISHED
+        if draw:
+            component.setAutoDraw(False)
+        self.unfinished -= 1
+
+    def end(self):
+        """
+        Stop drawing every component, at the end of the routine.
+        """
+        for component, start, duration, onFlip, draw in self.components:
+            if hasattr(component, 'setAutoDraw'):
+                component.setAutoDraw(False)
@@ -0,0 +1,129 @@
+"""
+Columnar copy of the experiment data, as a Parquet file per session.
+
+The wide CSV written by PsychoPy has a column for everything ever added to the
+data, mostly empty, and list values such as `target.timesOn` are written as
+text. The Parquet file has the same rows and columns, but with typed columns
+(numbers, booleans, text, lists of numbers), empty columns left out and
+compression, so many sessions can be loaded and filtered quickly:
+
+    from session_parquet import load_sessions
+    data = load_sessions('data/*.parquet')
+
+Needs pyarrow (`pip install pyarrow`); without it no Parquet file is written.
+"""
+
+import glob
+import json
+import numbers
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+def _plain(value):
+    # numpy scalars and arrays to Python values, empty cells to None
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+    if value is None or value == '' or (isinstance(value, float) and value != value):
+        return None
+    return value
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def column_array(values):
+    """
+    Typed Arrow array of the values of one column.
+
+    Booleans, integers and floats keep their type, lists of numbers become
+    list<double>, anything else is stored as text.
+    """
+    values = [_plain(v) for v in values]
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, bool) for v in present):
+        return pa.array(values, type=pa.bool_())
+    if all(isinstance(v, numbers.Integral) and not isinstance(v, bool) for v in present):
+        return pa.array(values, type=pa.int64())
+    if all(_is_number(v) for v in present):
+        return pa.array([None if v is None else float(v) for v in values], type=pa.float64())
+    if all(isinstance(v, (list, tuple)) for v in present):
+        if all(_is_number(x) for v in present for x in v):
+            return pa.array([None if v is None else [float(x) for x in v] for v in values],
+                            type=pa.list_(pa.float64()))
+        return pa.array([None if v is None else [str(x) for x in v] for v in values],
+                        type=pa.list_(pa.string()))
+    return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def save_parquet(entries, path, metadata=None, compression='zstd'):
+    """
+    Write the rows of the data file to a Parquet file.
+
+    Parameters
+    ==========
+    entries : list of dict
+        Rows of the data, `thisExp.entries`.
+    path : str
+        File to write, e.g. `filename + '.parquet'`.
+    metadata : dict or None
+        Stored in the file, e.g. `thisExp.extraInfo`.
+    compression : str
+        Parquet compression codec.
+
+    Returns
+    ==========
+    str or None
+        The path written, None if pyarrow is not installed.
+    """
+    if pa is None:
+        return None
+    columns = {}
+    for row in entries:
+        for name in row:
+            columns.setdefault(name, None)
+    arrays = {}
+    for name in columns:
+        values = [row.get(name) for row in entries]
+        if all(_plain(v) is None for v in values):
+            continue  # empty in every row
+        arrays[name] = column_array(values)
+    table = pa.table(arrays)
+    if metadata:
+        table = table.replace_schema_metadata({'psychopy': json.dumps(metadata, default=str)})
+    pq.write_table(table, path, compression=compression)
+    return path
+
+
+def load_sessions(pattern='data/*.parquet', columns=None, filters=None):
+    """
+    Data of many sessions in one pandas DataFrame.
+
+    Parameters
+    ==========
+    pattern : str
+        Glob pattern of the Parquet files.
+    columns : list of str or None
+        Only load these columns.
+    filters : list or None
+        Row filters applied while reading, e.g. `[('diff_level', '=', 'high')]`.
+    """
+    if pa is None:
+        raise ImportError('Loading the Parquet data files needs pyarrow, pip install pyarrow')
+    tables = []
+    for path in sorted(glob.glob(pattern)):
+        names = pq.read_schema(path).names
+        keep = None if columns is None else [c for c in columns if c in names]
+        # filters on columns missing from a session would fail, those sessions have no matching rows
+        if filters and any(f[0] not in names for f in filters):
+            continue
+        tables.append(pq.read_table(path, columns=keep, filters=filters))
+    if not tables:
+        raise FileNotFoundError(f'No Parquet data file matches {pattern}')
+    # sessions can have different columns, missing ones are filled with nulls
+    return pa.concat_tables(tables, promote_options='permissive').to_pandas()
@@ -0,0 +1,147 @@
+"""
+Pool of preloaded image stimuli.
+
+Decoding a full-HD PNG and uploading it to the GPU takes tens of milliseconds,
+so instead of calling `setImage` at the start of every trial each unique image
+gets its own `visual.ImageStim`, created once while nothing time critical is on
+screen. The least recently used stimuli are released when the pool goes over
+its memory budget.
+"""
+
+from collections import OrderedDict, deque
+
+from PIL import Image
+from psychopy import logging, visual
+
+
+def texture_bytes(path):
+    """
+    Estimated GPU memory used by an image, as 8 bit RGBA.
+
+    Only the image header is read, the pixels are not decoded.
+    """
+    with Image.open(path) as im:
+        width, height = im.size
+    return width * height * 4
+
+
+class StimulusPool:
+    """
+    Least recently used cache of `visual.ImageStim`, one per image file.
+
+    Parameters
+    ==========
+    win : psychopy.visual.Window
+        Window the stimuli are drawn in.
+    budgetMB : float
+        Maximum estimated GPU memory used by the pooled textures.
+    prefetcher : image_prefetch.ImagePrefetcher or None
+        Decodes images which are not in the pool ahead of time, see `prefetch`.
+    **kwargs
+        Any other `visual.ImageStim` parameter, shared by all the stimuli.
+    """
+
+    def __init__(self, win, budgetMB=1024, prefetcher=None, **kwargs):
+        self.win = win
+        self.budget = int(budgetMB * 1024 * 1024)
+        self.prefetcher = prefetcher
+        self.kwargs = kwargs
+        self.used = 0
+        self.stims = OrderedDict()
+        self._sizes = {}
+        self._pending = deque()
+
+    def preload(self, files):
+        """
+        Queue files to be loaded with `step`, keeping those that fit in the budget.
+
+        Parameters
+        ==========
+        files : list
+            Paths of the image files, in order of first use.
+        """
+        total = 0
+        for path in files:
+            if path in self.stims or path in self._pending:
+                continue
+            total += self._size(path)
+            if total > self.budget:
+                logging.warning(
+                    f'Stimulus pool budget reached, {path} and later images will be loaded on first use')
+                break
+            self._pending.append(path)
+
+    def step(self, n=1):
+        """
+        Load up to n queued images, call this once per frame on untimed screens.
+
+        Returns
+        ==========
+        bool
+            True while there are images left to load.
+        """
+        while n and self._pending:
+            self._load(self._pending.popleft())
+            n -= 1
+        return bool(self._pending)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def prefetch(self, path):
+        """
+        Start decoding an image on the prefetcher's thread, if it is not in the pool.
+        """
+        if self.prefetcher is not None and path not in self.stims:
+            self.prefetcher.request(path)
+
+    def get(self, path):
+        """
+        Stimulus showing an image, loading it if it is not in the pool.
+
+        Parameters
+        ==========
+        path : str
+            Path of the image file.
+
+        Returns
+        ==========
+        psychopy.visual.ImageStim
+            Stimulus with the image texture already on the GPU.
+        """
+        stim = self.stims.get(path)
+        if stim is None:
+            if path in self._pending:
+                self._pending.remove(path)
+            logging.info(f'Stimulus pool miss, loading {path}')
+            stim = self._load(path)
+        else:
+            self.stims.move_to_end(path)
+        return stim
+
+    def _size(self, path):
+        if path not in self._sizes:
+            self._sizes[path] = texture_bytes(path)
+        return self._sizes[path]
+
+    def _load(self, path):
+        size = self._size(path)
+        # make room for the new texture, oldest first
+        while self.stims and self.used + size > self.budget:
+            self._evict()
+        image = None
+        if self.prefetcher is not None:
+            image = self.prefetcher.take(path)
+        if image is None:
+            image = path
+        stim = visual.ImageStim(self.win, image=image, **self.kwargs)
+        self.stims[path] = stim
+        self.used += size
+        return stim
+
+    def _evict(self):
+        path, stim = self.stims.popitem(last=False)
+        self.used -= self._sizes[path]
+        stim.clearTextures()
+        logging.info(f'Stimulus pool evicted {path}')
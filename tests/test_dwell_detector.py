@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from dwell_detector import DwellDetector
+
+# a power of two, so the sample times and the dwell are exact in floating point
+DT = 1 / 128
+
+
+def detector(dwell=0.5):
+    roi = SimpleNamespace(pos=(0.0, 0.0), size=(0.2, 0.2), shape='circle')
+    dwell = DwellDetector(None, roi, dwell=dwell)
+    dwell.start(0.0)
+    return dwell
+
+
+def samples(inside):
+    # one sample per DT from 0, in the ROI, out of it, or lost (NaN)
+    x = np.array([{'in': 0.0, 'out': 0.5, 'nan': np.nan}[s] for s in inside])
+    return np.arange(len(inside)) * DT, x, np.zeros(len(inside))
+
+
+def test_look_split_across_two_batches():
+    dwell = detector()
+    t, x, y = samples(['in'] * 80)
+    assert dwell.process(t[:40], x[:40], y[:40]) is None
+    assert dwell.transitions == [(0.0, True)]
+    # the look goes on in the next batch and reaches 0.5 s on sample 64
+    assert dwell.process(t[40:], x[40:], y[40:]) == 64 * DT
+    assert dwell.transitions == []
+    assert dwell.numLooks == 1
+    assert dwell.timesOn == [0.0]
+    assert dwell.timesOff == [64 * DT]
+
+
+def test_dwell_completed_mid_batch():
+    dwell = detector()
+    t, x, y = samples(['out'] * 16 + ['in'] * 70 + ['out'] * 10)
+    assert dwell.process(t, x, y) == (16 + 64) * DT
+    # the exit after the dwell is ignored
+    assert dwell.transitions == [(16 * DT, True)]
+    assert dwell.timesOn == [16 * DT]
+    assert dwell.timesOff == [80 * DT]
+    # nothing changes once the dwell is reached
+    assert dwell.process(t + 1.0, x, y) == 80 * DT
+    assert dwell.numLooks == 1
+
+
+def test_nan_gap_ends_the_look():
+    dwell = detector()
+    t, x, y = samples(['in'] * 32 + ['nan'] * 4 + ['in'] * 70)
+    # the gap is split between the two batches
+    assert dwell.process(t[:34], x[:34], y[:34]) is None
+    assert dwell.process(t[34:], x[34:], y[34:]) == (36 + 64) * DT
+    assert dwell.transitions == [(36 * DT, True)]
+    assert dwell.timesOn == [0.0, 36 * DT]
+    assert dwell.timesOff == [31 * DT, 100 * DT]
+
+
+def test_samples_before_start_ignored():
+    dwell = detector()
+    dwell.start(1.0)
+    t, x, y = samples(['in'] * 200)
+    assert dwell.process(t, x, y) == 1.5
+    assert dwell.timesOn == [0.0]
+
+
+def test_samples_on_the_synced_clock():
+    # ioServer.syncClock(globalClock) stamps the samples on globalClock, which
+    # started long after the core.getTime clock
+    globalStart, coreStart = 2.0, 1002.0
+    t, x, y = samples(['in'] * 100)
+    t = t + globalStart
+    dwell = detector()
+    dwell.start(globalStart)
+    assert dwell.process(t, x, y) == globalStart + 64 * DT
+    assert dwell.timesOn == [0.0]
+    # started on core.getTime every sample looks older than the start and is dropped
+    dwell = detector()
+    dwell.start(coreStart)
+    assert dwell.process(t, x, y) is None
+    assert dwell.numLooks == 0
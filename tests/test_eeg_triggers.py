@@ -0,0 +1,48 @@
+import time
+
+from eeg_triggers import RESET, TriggerEngine
+from trigger_backends import MemoryBackend
+
+# how late a write may be on a busy test machine; it must never be early
+LATE = 0.005
+
+
+def engine():
+    port = MemoryBackend(clock=time.perf_counter)
+    return port, TriggerEngine(port, clock=time.perf_counter).start()
+
+
+def test_pulse_written_on_time_and_reset_after_width():
+    port, triggers = engine()
+    at = time.perf_counter() + 0.05
+    triggers.pulse(7, width=0.02, at=at)
+    triggers.stop()
+    (tCode, code), (tReset, reset) = port.received
+    assert (code, reset) == (7, RESET[0])
+    assert at <= tCode < at + LATE
+    assert at + 0.02 <= tReset < at + 0.02 + LATE
+    for requested, t0, t1, written in triggers.writes:
+        assert 0 <= t0 - requested < LATE
+
+
+def test_pulses_written_in_time_order():
+    port, triggers = engine()
+    now = time.perf_counter()
+    # asked for out of order, the second pulse starts before the first one is reset
+    triggers.pulse(2, width=0.04, at=now + 0.06)
+    triggers.pulse(1, width=0.04, at=now + 0.03)
+    triggers.stop()
+    assert [code for t, code in port.received] == [1, 2, 0, 0]
+    times = [t for t, code in port.received]
+    assert times == sorted(times)
+
+
+def test_stop_writes_pending_reset():
+    port, triggers = engine()
+    triggers.pulse(3, width=0.05)
+    time.sleep(0.01)
+    triggers.stop()
+    assert [code for t, code in port.received] == [3, 0]
+    # the reset still waits for the end of the pulse
+    requested, t0, t1, code = triggers.writes[1]
+    assert code == RESET and t0 >= requested
@@ -0,0 +1,44 @@
+import time
+
+from eeg_triggers import TriggerEngine
+from event_timeline import FIXATION, TRIGGER, EventTimeline, read_timeline
+from trigger_backends import MemoryBackend
+
+LATE = 0.005
+
+
+class Clock:
+    """
+    Stand-in for `core.Clock`, counts from its creation like `globalClock`.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+
+    def getTime(self, format=float):
+        return time.perf_counter() - self._start
+
+
+def test_flip_eye_and_trigger_entries_line_up(tmp_path):
+    globalClock = Clock()
+
+    def session_time():
+        return globalClock.getTime(format='float')
+
+    # wired like the experiment: every producer on globalClock
+    timeline = EventTimeline(str(tmp_path / 'session.timeline'), clock=session_time).start()
+    triggers = TriggerEngine(MemoryBackend(clock=session_time), clock=session_time,
+                             onWrite=lambda t, code: timeline.log(TRIGGER, code[0], t=t)).start()
+    tFlip = session_time() + 0.02
+    triggers.pulse(5, width=None, at=tFlip)
+    while session_time() < tFlip:
+        pass
+    # the time win.flip() returns, and an eye sample stamped by ioHub at the same instant
+    timeline.flip(1, 'trial', t=tFlip)
+    timeline.log(FIXATION, 100, '0.0 0.0', t=tFlip)
+    triggers.stop()
+    timeline.close()
+
+    events = {kind: t for t, kind, code, label in read_timeline(str(tmp_path / 'session.timeline'))}
+    assert events['flip'] == events['fixation'] == tFlip
+    assert 0 <= events['trigger'] - tFlip < LATE
@@ -0,0 +1,82 @@
+import numpy as np
+
+from eye_events import EyeEventClassifier
+
+RATE = 120.0
+
+
+def fixation(t0, duration, x, y):
+    t = t0 + np.arange(round(duration * RATE)) / RATE
+    return t, np.full(len(t), float(x)), np.full(len(t), float(y))
+
+
+def saccade(t0, duration, x0, y0, x1, y1):
+    n = round(duration * RATE)
+    t = t0 + np.arange(n) / RATE
+    f = (np.arange(n) + 1) / (n + 1)
+    return t, x0 + f * (x1 - x0), y0 + f * (y1 - y0)
+
+
+def stream(*parts):
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def run_trial(classifier, samples, batch=2):
+    # fed a couple of samples per frame, flushed at the end of the trial like the experiment does
+    classifier.reset()
+    events = []
+    t, x, y = samples
+    for i in range(0, len(t), batch):
+        events += classifier.feed(t[i:i + batch], x[i:i + batch], y[i:i + batch])
+    events += classifier.flush()
+    return events
+
+
+def counts(events):
+    return (sum(e.kind == 'fixation' for e in events), sum(e.kind == 'saccade' for e in events))
+
+
+def test_ivt_fixation_saccade_fixation():
+    classifier = EyeEventClassifier('ivt', degPerUnit=1.0)
+    events = run_trial(classifier, stream(fixation(0.0, 0.3, 0, 0), saccade(0.3, 0.03, 0, 0, 10, 0),
+                                          fixation(0.33, 0.3, 10, 0)))
+    assert [e.kind for e in events] == ['fixation', 'saccade', 'fixation']
+    assert abs(events[0].x) < 1e-9 and abs(events[2].x - 10) < 1e-9
+    assert 9 < events[1].amplitude < 11
+
+
+def test_fixation_open_at_the_end_of_a_trial_counts_for_that_trial():
+    classifier = EyeEventClassifier('ivt', degPerUnit=1.0)
+    # trial 1 ends in the middle of the second fixation, trial 2 goes on from there
+    first = run_trial(classifier, stream(fixation(0.0, 0.3, 0, 0), saccade(0.3, 0.03, 0, 0, 10, 0),
+                                         fixation(0.33, 0.2, 10, 0)))
+    second = run_trial(classifier, stream(fixation(1.0, 0.2, 10, 0), saccade(1.2, 0.03, 10, 0, 0, 0),
+                                          fixation(1.23, 0.3, 0, 0)))
+    assert counts(first) == (2, 1)
+    assert counts(second) == (2, 1)
+    # nothing of trial 1 leaks into trial 2
+    assert all(e.start >= 1.0 for e in second)
+
+
+def test_tracking_lost_ends_the_fixation():
+    classifier = EyeEventClassifier('ivt', degPerUnit=1.0, maxGap=0.075)
+    t, x, y = stream(fixation(0.0, 0.3, 0, 0), fixation(0.3, 0.2, 0, 0), fixation(0.5, 0.3, 0, 0))
+    # a 200 ms blink in the middle
+    x[(t >= 0.3) & (t < 0.5)] = np.nan
+    events = run_trial(classifier, (t, x, y))
+    assert counts(events) == (2, 0)
+    assert events[0].end < 0.3 and events[1].start >= 0.5
+
+
+def test_idt_saccades_are_between_fixations():
+    classifier = EyeEventClassifier('idt', degPerUnit=1.0, dispersion=1.0)
+    events = run_trial(classifier, stream(fixation(0.0, 0.3, 0, 0), saccade(0.3, 0.03, 0, 0, 10, 0),
+                                          fixation(0.33, 0.3, 10, 0)))
+    assert [e.kind for e in events] == ['fixation', 'saccade', 'fixation']
+    assert events[1].start == events[0].end and events[1].end == events[2].start
+
+
+def test_short_fixations_are_discarded():
+    classifier = EyeEventClassifier('ivt', degPerUnit=1.0, minFixation=0.06)
+    events = run_trial(classifier, fixation(0.0, 0.04, 0, 0))
+    assert events == []
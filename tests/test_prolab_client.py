@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+import pytest
+
+from prolab_client import AsyncProLabClient, ProLabError
+from test_prolab_mock import CHUNK, start_mock
+
+
+async def session(port, path):
+    client = AsyncProLabClient(port=port)
+    try:
+        # pipelined on the project connection, before and after the upload
+        before, uploaded, after = await asyncio.gather(client.list_media(), client.upload_media(path),
+                                                       client.list_media())
+        return before, uploaded, after
+    finally:
+        await client.close()
+
+
+def test_upload_media_then_more_requests(tmp_path):
+    mock = start_mock()
+    path = tmp_path / 'img9.jpg'
+    data = os.urandom(3 * CHUNK + 17)
+    path.write_bytes(data)
+    before, uploaded, after = asyncio.run(session(mock.port, str(path)))
+    assert before['media_list'] == []
+    media = mock.media[uploaded['media_id']]
+    assert media['media_name'] == 'img9'
+    # each reply went to its own request, the acknowledgement did not shift them
+    assert after['operation'] == 'ListMedia'
+    assert [m['media_id'] for m in after['media_list']] == [uploaded['media_id']]
+
+
+def test_rejected_upload_does_not_shift_replies(tmp_path):
+    mock = start_mock()
+    path = tmp_path / 'img9'  # no extension, no mime type
+
+    async def run():
+        client = AsyncProLabClient(port=mock.port)
+        try:
+            path.write_bytes(b'x')
+            with pytest.raises(ProLabError):
+                await client.upload_media(str(path))
+            return await client.list_media()
+        finally:
+            await client.close()
+
+    assert asyncio.run(run())['operation'] == 'ListMedia'
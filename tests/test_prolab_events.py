@@ -0,0 +1,84 @@
+import re
+import threading
+
+from prolab_events import ProLabEventQueue
+
+
+class ProLab:
+    """
+    Records the events sent, rejects the media_ids in `reject`.
+    """
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.events = []
+        self.release = threading.Event()
+
+    def send_stimulus_event(self, recording_id, start_timestamp, media_id, end_timestamp=None):
+        if media_id in self.reject:
+            raise ValueError(f'unknown media {media_id}')
+        self.events.append(media_id)
+
+    def send_custom_event(self, recording_id, timestamp, event_type, value=None):
+        # blocks until released, like a connection which stopped answering
+        self.release.wait()
+        self.events.append(event_type)
+
+
+def queue(ttl, **kwargs):
+    return ProLabEventQueue(ttl, 'rec', retryDelay=0.001, maxRetryDelay=0.01, **kwargs).start()
+
+
+def test_all_events_sent_in_order():
+    ttl = ProLab()
+    events = queue(ttl)
+    for i in range(100):
+        events.stimulus_event(i, f'm{i}')
+    assert events.drain() == []
+    assert ttl.events == [f'm{i}' for i in range(100)]
+    assert events.sent == 100
+
+
+def test_rejected_event_dropped():
+    ttl = ProLab(reject={'m1'})
+    events = queue(ttl, maxAttempts=3)
+    for i in range(3):
+        events.stimulus_event(i, f'm{i}')
+    unsent = events.drain()
+    assert ttl.events == ['m0', 'm2']
+    assert events.failures == 3
+    assert unsent == ["send_stimulus_event('1', 'm1')"]
+
+
+def test_drain_timeout_stops_thread():
+    ttl = ProLab()
+    events = queue(ttl)
+    events.custom_event(0, 'stuck')
+    events.stimulus_event(1, 'm1')
+    unsent = events.drain(timeout=0.05)
+    assert unsent == ["send_custom_event('0', 'stuck')", "send_stimulus_event('1', 'm1')"]
+    ttl.release.set()
+    events._thread.join(1.0)
+    # the send in progress ends, but nothing is sent after the timeout
+    assert not events._thread.is_alive()
+    assert ttl.events == ['stuck']
+
+
+class Titta(ProLab):
+    """
+    Like TalkToProLab, which runs `re.sub` on the value of a custom event.
+    """
+
+    def send_custom_event(self, recording_id, timestamp, event_type, value=''):
+        value = re.sub(r'[\\"]', '', value)
+        self.events.append((event_type, value))
+
+
+def test_custom_event_without_value():
+    ttl = Titta()
+    events = queue(ttl)
+    events.custom_event(0, 'trial_start')
+    events.custom_event(1, 'response', 'left "key"')
+    assert events.drain() == []
+    assert events.failures == 0
+    assert ttl.events == [('trial_start', ''), ('response', 'left key')]
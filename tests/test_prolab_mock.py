@@ -0,0 +1,83 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+
+import pytest
+import websockets
+
+from prolab_mock import ERROR_STATUS, MockProLab
+
+CHUNK = 64000
+
+
+def start_mock(port=0):
+    # port 0 for any free port, the mock runs in its own thread like in benchmark_prolab.py
+    with socket.socket() as s:
+        s.bind(('localhost', port))
+        port = s.getsockname()[1]
+    mock = MockProLab()
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(mock.serve('localhost', port, ready)), daemon=True).start()
+    ready.wait()
+    mock.port = port
+    return mock
+
+
+@pytest.fixture
+def mock():
+    return start_mock()
+
+
+async def upload(port, name, data, size=None):
+    # the exchange of Titta's TalkToProLab.upload_media
+    async with websockets.connect(f'ws://localhost:{port}/project?client_id=test', max_size=None) as ws:
+        await ws.send(json.dumps({'operation': 'UploadMedia', 'media_name': name,
+                                  'media_size': str(len(data) if size is None else size),
+                                  'mime_type': 'image/png'}))
+        ack = json.loads(await asyncio.wait_for(ws.recv(), 5))
+        if ack['status_code'] != 0:
+            return ack, None
+        for i in range(0, len(data), CHUNK):
+            await ws.send(data[i:i + CHUNK])
+        final = json.loads(await asyncio.wait_for(ws.recv(), 5))
+        await ws.send(json.dumps({'operation': 'ListMedia'}))
+        listed = json.loads(await asyncio.wait_for(ws.recv(), 5))
+        return ack, final, listed
+
+
+def test_upload_in_chunks(mock):
+    data = os.urandom(3 * CHUNK + 123)
+    ack, final, listed = asyncio.run(upload(mock.port, 'img9.png', data))
+    assert ack['status_code'] == 0 and 'media_id' not in ack
+    assert final['status_code'] == 0
+    media = mock.media[final['media_id']]
+    assert media['media_name'] == 'img9'
+    # the next request on the connection gets its own answer
+    assert listed['operation'] == 'ListMedia'
+    assert [m['media_id'] for m in listed['media_list']] == [final['media_id']]
+
+
+def test_upload_with_bad_size_rejected(mock):
+    ack, final = asyncio.run(upload(mock.port, 'img9.png', b'', size='many'))
+    assert ack['status_code'] == ERROR_STATUS
+    assert mock.media == {}
+
+
+def test_upload_through_talk_to_prolab(tmp_path):
+    TalkToProLab = pytest.importorskip('titta.TalkToProLab').TalkToProLab
+    try:
+        # TalkToProLab always connects to ws://localhost:8080
+        mock = start_mock(8080)
+    except OSError:
+        pytest.skip('port 8080 is in use')
+    path = tmp_path / 'img9.png'
+    path.write_bytes(os.urandom(2 * CHUNK + 1))
+    ttl = TalkToProLab(project_name=None, dummy_mode=False)
+    try:
+        response = ttl.upload_media(str(path), 'image')
+        assert mock.media[response['media_id']]['media_name'] == 'img9'
+        assert any(m['media_id'] == response['media_id'] for m in ttl.list_media()['media_list'])
+    finally:
+        ttl.disconnect()
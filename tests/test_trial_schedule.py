@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from trial_schedule import build_schedule, trial_order
+
+CONDITIONS = [{'images': f'img{i}.png', 'diff_level': 'easy' if i < 3 else 'hard',
+               'target_x': i / 10, 'target_y': -i / 10} for i in range(6)]
+MEDIA = {row['images']: f'id{i}' for i, row in enumerate(CONDITIONS)}
+
+
+class TriggerCodes:
+    """
+    Stand-in for `trigger_codes.TriggerCodeTable`, one code per difficulty level.
+    """
+
+    def trigger(self, row, routine='trial'):
+        return bytes([1 if row['diff_level'] == 'easy' else 2])
+
+
+def test_order_runs_down_each_repeat():
+    # one column per repeat, as TrialHandler.sequenceIndices
+    trials = SimpleNamespace(trialList=CONDITIONS,
+                             sequenceIndices=np.array([[2, 0], [0, 1], [1, 2]]))
+    assert trial_order(trials).tolist() == [2, 0, 1, 0, 1, 2]
+
+
+def test_records_follow_the_order():
+    sequence = np.array([[5, 0], [3, 4], [1, 2]])
+    trials = SimpleNamespace(trialList=CONDITIONS, sequenceIndices=sequence)
+    schedule = build_schedule(trials, MEDIA, TriggerCodes())
+    assert [trial.n for trial in schedule] == list(range(6))
+    assert [trial.condition for trial in schedule] == [5, 3, 1, 0, 4, 2]
+    trial = schedule[1]
+    assert trial.image == 'img3.png'
+    assert trial.mediaId == 'id3'
+    assert trial.diffLevel == 'hard'
+    assert trial.trigger == b'\x02'
+    assert trial.targetPos == (0.3, -0.3)
+
+
+def test_seed_replays_the_same_schedule():
+    data = pytest.importorskip('psychopy.data')
+
+    def schedule(seed):
+        trials = data.TrialHandler(nReps=3, method='random', trialList=CONDITIONS, seed=seed)
+        return trials, [trial.condition for trial in build_schedule(trials, MEDIA, TriggerCodes())]
+
+    trials, first = schedule(1234)
+    assert schedule(1234)[1] == first
+    assert schedule(4321)[1] != first
+    # and it is the order the loop runs the trials in
+    assert [trials.thisIndex for _ in trials] == first
@@ -0,0 +1,182 @@
+"""
+Crash-safe journal of the data rows, written as the experiment runs.
+
+PsychoPy writes the .csv and .psydat files at the end of the session, so a
+session that crashes loses all of its data. The journal appends every row to a
+file as soon as `thisExp.nextEntry()` is called: the trial loop only queues a
+copy of the row, a background thread writes it (one JSON object per line) and
+regularly forces it to disk with fsync.
+
+If a session did not finish, rebuild its data files from the journal with:
+
+    python trial_journal.py data/<session>.journal
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+_STOP = object()
+
+
+def _plain(value):
+    # numpy values to Python ones, anything else JSON does not know to text
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class TrialJournal:
+    """
+    Append-only journal of the rows of an ExperimentHandler.
+
+    Parameters
+    ==========
+    path : str
+        Journal file, e.g. `filename + '.journal'`.
+    fsyncInterval : float
+        Longest time in seconds between two fsync calls while rows are written.
+    """
+
+    def __init__(self, path, fsyncInterval=1.0):
+        self.path = path
+        self.fsyncInterval = fsyncInterval
+        self.rows = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    def attach(self, thisExp):
+        """
+        Journal every row of `thisExp` from now on and start the writer thread.
+
+        Parameters
+        ==========
+        thisExp : psychopy.data.ExperimentHandler
+            Handler whose rows are journaled when `nextEntry` is called.
+        """
+        header = {'journal': 1, 'name': thisExp.name, 'dataFileName': thisExp.dataFileName,
+                  'extraInfo': thisExp.extraInfo, 'started': time.time()}
+        self._queue.put(header)
+        nextEntry = thisExp.nextEntry
+
+        def journaledNextEntry():
+            nextEntry()
+            self.append(thisExp.entries[-1])
+
+        thisExp.nextEntry = journaledNextEntry
+        self._thread = threading.Thread(target=self._run, name='TrialJournal', daemon=True)
+        self._thread.start()
+        return self
+
+    def append(self, row):
+        """
+        Queue a row to be written, returns immediately.
+        """
+        self._queue.put({'row': dict(row)})
+
+    def _run(self):
+        lastSync = time.monotonic()
+        unsynced = False
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                try:
+                    items = [self._queue.get(timeout=self.fsyncInterval if unsynced else None)]
+                except queue.Empty:
+                    items = []
+                # write everything already queued in one go
+                while not self._queue.empty():
+                    items.append(self._queue.get())
+                stop = bool(items) and items[-1] is _STOP
+                if stop:
+                    items[-1] = {'end': time.time()}
+                for item in items:
+                    f.write(json.dumps(item, default=_plain) + '\n')
+                # in the operating system's hands, safe if Python crashes
+                f.flush()
+                self.rows += sum('row' in item for item in items)
+                unsynced = unsynced or bool(items)
+                if unsynced and (stop or not items or time.monotonic() - lastSync >= self.fsyncInterval):
+                    # on the disk, safe if the computer crashes
+                    os.fsync(f.fileno())
+                    lastSync = time.monotonic()
+                    unsynced = False
+                if stop:
+                    return
+
+    def close(self):
+        """
+        Write the remaining rows, mark the session as finished and stop the thread.
+        """
+        self._queue.put(_STOP)
+        if self._thread is not None:
+            self._thread.join()
+
+
+def read_journal(path):
+    """
+    Content of a journal file.
+
+    A last line cut by a crash is ignored.
+
+    Returns
+    ==========
+    dict, list of dict, bool
+        The header, the rows and whether the session finished.
+    """
+    header, rows, finished = {}, [], False
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if 'row' in item:
+                rows.append(item['row'])
+            elif 'journal' in item:
+                header = item
+            elif 'end' in item:
+                finished = True
+    return header, rows, finished
+
+
+def recover(path, filename=None):
+    """
+    Rebuild the .csv and .psydat files of a session from its journal.
+
+    Parameters
+    ==========
+    path : str
+        Journal file.
+    filename : str or None
+        Data file name without extension, None for the journal's name.
+
+    Returns
+    ==========
+    str
+        The data file name used.
+    """
+    from psychopy import data
+
+    header, rows, finished = read_journal(path)
+    if filename is None:
+        filename = os.path.splitext(path)[0]
+    thisExp = data.ExperimentHandler(name=header.get('name', ''), extraInfo=header.get('extraInfo'),
+                                     savePickle=False, saveWideText=False, dataFileName=filename)
+    for row in rows:
+        for name, value in row.items():
+            thisExp.addData(name, value)
+        thisExp.nextEntry()
+    thisExp.saveAsWideText(filename + '.csv', delim='auto')
+    thisExp.saveAsPickle(filename)
+    thisExp.abort()  # the files are written, don't save them again on exit
+    state = 'finished' if finished else 'interrupted'
+    print(f'{len(rows)} rows ({state} session) written to {filename}.csv and {filename}.psydat')
+    return filename
+
+
+if __name__ == '__main__':
+    for journal in sys.argv[1:]:
+        recover(journal)
@@ -0,0 +1,103 @@
+"""
+Trial schedule computed before the trial loop starts.
+
+The Builder loop copies every column of the current condition into the
+module's globals at the start of each trial, and the trial code then looks up
+the media_id and trigger code of the image. `build_schedule` does all of that
+once, in the order the TrialHandler will run the trials, so each routine only
+reads the attributes of the trial's record:
+
+    schedule = build_schedule(trials, media, trigger_codes)
+    for thisTrial in trials:
+        trial = schedule[trials.thisN]
+        target.setPos(trial.targetPos)
+
+The order comes from the TrialHandler, so it is reproducible from the seed the
+TrialHandler was given.
+"""
+
+import numpy as np
+
+
+class TrialRecord:
+    """
+    Everything a trial needs, read by attribute.
+
+    Parameters
+    ==========
+    n : int
+        Trial number, as `trials.thisN`.
+    condition : int
+        Row of the conditions file, as `trials.thisIndex`.
+    image : str
+        Image file.
+    diffLevel : str
+        Difficulty level of the image.
+    targetPos : tuple of float
+        Position of the target.
+    trigger : bytes
+        Trigger code sent at the image onset.
+    mediaId : str or None
+        Pro Lab media_id of the image.
+    """
+
+    __slots__ = ('n', 'condition', 'image', 'diffLevel', 'targetPos', 'trigger', 'mediaId')
+
+    def __init__(self, n, condition, image, diffLevel, targetPos, trigger, mediaId):
+        self.n = n
+        self.condition = condition
+        self.image = image
+        self.diffLevel = diffLevel
+        self.targetPos = targetPos
+        self.trigger = trigger
+        self.mediaId = mediaId
+
+    def __repr__(self):
+        return (f'TrialRecord(n={self.n}, condition={self.condition}, image={self.image!r}, '
+                f'diffLevel={self.diffLevel!r}, targetPos={self.targetPos})')
+
+
+def trial_order(trials):
+    """
+    Condition index of every trial, in the order the TrialHandler runs them.
+
+    Parameters
+    ==========
+    trials : psychopy.data.TrialHandler
+        The loop, before it is started.
+
+    Returns
+    ==========
+    numpy.ndarray
+        Row of the conditions file of each trial.
+    """
+    # sequenceIndices has one column per repeat, the trials of a repeat run down its column
+    return np.ravel(np.asarray(trials.sequenceIndices), order='F').astype(int)
+
+
+def build_schedule(trials, media, trigger_codes, routine='trial'):
+    """
+    Records of all the trials of a loop, indexed by trial number.
+
+    Parameters
+    ==========
+    trials : psychopy.data.TrialHandler
+        The loop, before it is started.
+    media : prolab_media.MediaManifest
+        Pro Lab media_id of the images, after the upload.
+    trigger_codes : trigger_codes.TriggerCodeTable
+        Compiled trigger codes.
+    routine : str
+        Routine the trigger is sent in.
+
+    Returns
+    ==========
+    list of TrialRecord
+    """
+    # a record is built once per condition and copied for every repeat
+    byCondition = []
+    for i, row in enumerate(trials.trialList):
+        byCondition.append((i, row['images'], row['diff_level'],
+                            (float(row['target_x']), float(row['target_y'])),
+                            trigger_codes.trigger(row, routine=routine), media[row['images']]))
+    return [TrialRecord(n, *byCondition[condition]) for n, condition in enumerate(trial_order(trials))]
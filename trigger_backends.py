@@ -0,0 +1,128 @@
+"""
+Ports the EEG triggers can be written to.
+
+- serial: the Brain Products TriggerBox (or any serial port), through pyserial.
+- loopback: a pseudo-terminal pair (Linux and macOS). Triggers are written to
+  one end and read back from the other with their arrival time, to measure
+  trigger timing without a trigger box.
+- memory: keeps the writes in a list, for running without any hardware.
+
+All backends have the `write(bytes)` and `close()` methods used by
+`eeg_triggers.TriggerEngine`; loopback and memory also fill `received` with
+(time, byte) pairs.
+"""
+
+import os
+import threading
+import time
+
+
+class SerialBackend:
+    """
+    Serial port, e.g. the TriggerBox on "COM7".
+    """
+
+    def __init__(self, port='COM7', baudrate=2000000, **kwargs):
+        import serial
+        self.serial = serial.Serial(port=port, baudrate=baudrate, **kwargs)
+
+    def write(self, data):
+        return self.serial.write(data)
+
+    def close(self):
+        self.serial.close()
+
+
+class MemoryBackend:
+    """
+    Records the writes in memory with the time they were made.
+
+    Parameters
+    ==========
+    clock : callable
+        Function returning the time in seconds.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.received = []
+
+    def write(self, data):
+        t = self.clock()
+        self.received.extend((t, b) for b in bytes(data))
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class LoopbackBackend:
+    """
+    Pseudo-terminal pair standing in for a serial trigger box.
+
+    Writes go through the operating system like on a real serial device and a
+    reader thread timestamps every byte arriving at the other end.
+
+    Parameters
+    ==========
+    clock : callable
+        Function returning the time in seconds.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        import tty
+        self.clock = clock
+        self.received = []
+        self.master, self.slave = os.openpty()
+        # raw mode, so bytes are passed as they are (no echo or newline translation)
+        tty.setraw(self.slave)
+        tty.setraw(self.master)
+        self._reader = threading.Thread(target=self._read, name='LoopbackReader', daemon=True)
+        self._reader.start()
+
+    @property
+    def name(self):
+        # device path of the writing end, can be opened with pyserial
+        return os.ttyname(self.slave)
+
+    def _read(self):
+        while True:
+            try:
+                data = os.read(self.master, 64)
+            except OSError:
+                return
+            if not data:
+                return
+            t = self.clock()
+            self.received.extend((t, b) for b in data)
+
+    def write(self, data):
+        return os.write(self.slave, bytes(data))
+
+    def close(self):
+        os.close(self.slave)
+        os.close(self.master)
+        self._reader.join(1.0)
+
+
+BACKENDS = {
+    'serial': SerialBackend,
+    'loopback': LoopbackBackend,
+    'memory': MemoryBackend,
+}
+
+
+def open_backend(kind='serial', **kwargs):
+    """
+    Open a trigger port.
+
+    Parameters
+    ==========
+    kind : str
+        'serial', 'loopback' or 'memory'.
+    **kwargs
+        Passed to the backend, e.g. `port` and `baudrate` for 'serial'.
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f'Unknown trigger backend {kind!r}, use one of {", ".join(BACKENDS)}')
+    return BACKENDS[kind](**kwargs)
@@ -0,0 +1,110 @@
+"""
+EEG trigger codes compiled from the conditions file.
+
+Every combination of the chosen condition columns gets its own 8 bit code. The
+codes are written to a sidecar file, which is read back on the next launch so
+that a code keeps its meaning when conditions are added: new combinations get
+the next free code. The same file tells BrainVision Analyzer users what each
+marker means.
+"""
+
+import csv
+import os
+
+MAX_CODE = 255
+
+
+def marker_name(code):
+    """
+    Name BrainVision Recorder gives to a stimulus marker, e.g. "S  1".
+    """
+    return f'S{code:3d}'
+
+
+class TriggerCodeTable:
+    """
+    Map from (routine, condition values) to a trigger code, as ready to write bytes.
+
+    Parameters
+    ==========
+    sidecar : str
+        Tab separated file with the codes assigned so far, created if missing.
+    """
+
+    fields = ['code', 'marker', 'routine', 'meaning']
+
+    def __init__(self, sidecar='trigger_codes.tsv'):
+        self.sidecar = sidecar
+        self.columns = {}
+        self.codes = {}
+        self.meanings = {}
+        self._bytes = {}
+        if os.path.isfile(sidecar):
+            with open(sidecar, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f, delimiter='\t'):
+                    self._add((row['routine'], row['meaning']), int(row['code']))
+
+    def _add(self, key, code):
+        self.codes[key] = code
+        self.meanings[code] = key
+        # preallocated, so that sending a trigger does not build a new object
+        self._bytes[key] = bytes([code])
+
+    @staticmethod
+    def meaning(row, columns):
+        return ', '.join(f'{column}={row[column]}' for column in columns)
+
+    def compile(self, conditions, columns, routine='trial'):
+        """
+        Give a code to every combination of `columns` found in the conditions.
+
+        Parameters
+        ==========
+        conditions : list of dict
+            Conditions as returned by `data.importConditions`.
+        columns : list of str
+            Columns identifying a trigger, e.g. ['diff_level'] or ['diff_level', 'images'].
+        routine : str
+            Routine the triggers are sent in.
+
+        Returns
+        ==========
+        TriggerCodeTable
+            This table, with the new codes saved to the sidecar file.
+        """
+        self.columns[routine] = list(columns)
+        added = False
+        for row in conditions:
+            key = (routine, self.meaning(row, columns))
+            if key in self.codes:
+                continue
+            code = max(self.meanings, default=0) + 1
+            if code > MAX_CODE:
+                raise ValueError(f'More than {MAX_CODE} trigger codes needed, '
+                                 f'use fewer columns than {columns}')
+            self._add(key, code)
+            added = True
+        if added or not os.path.isfile(self.sidecar):
+            self.save()
+        return self
+
+    def trigger(self, row, routine='trial'):
+        """
+        Bytes to write to the trigger port for a condition.
+
+        Parameters
+        ==========
+        row : dict
+            The condition of the current trial.
+        routine : str
+            Routine the trigger is sent in.
+        """
+        return self._bytes[(routine, self.meaning(row, self.columns[routine]))]
+
+    def save(self):
+        with open(self.sidecar, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            writer.writerow(self.fields)
+            for code in sorted(self.meanings):
+                routine, meaning = self.meanings[code]
+                writer.writerow([code, marker_name(code), routine, meaning])